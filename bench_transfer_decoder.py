@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark: ABI process_log() vs the topic-filtered TransferDecoder
+Usage: python bench_transfer_decoder.py [--logs N] [--iterations N]
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.datastructures import AttributeDict
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+
+from myApp.services.erc20_abi import USDC_ABI
+from myApp.services.transfer_decoder import TRANSFER_TOPIC, TransferDecoder
+
+USDC = '0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913'
+OTHER_TOKEN = '0x4200000000000000000000000000000000000006'  # WETH on Base
+RECEIVER = '0x918e03d7c59d61b6505fed486082419941ffd77f'
+SWAP_TOPIC = bytes(Web3.keccak(text='Swap(address,uint256,uint256,uint256,uint256,address)'))
+
+
+def _address_topic(address):
+    return HexBytes(b'\x00' * 12 + bytes.fromhex(address[2:]))
+
+
+def build_logs(count):
+    """Aggregator-style receipt: mostly swaps and other-token transfers, one USDC transfer"""
+    logs = []
+    for index in range(count):
+        if index == count - 1:
+            address, topics = USDC, [HexBytes(TRANSFER_TOPIC), _address_topic('0x' + '11' * 20), _address_topic(RECEIVER)]
+        elif index % 2:
+            address, topics = OTHER_TOKEN, [HexBytes(TRANSFER_TOPIC), _address_topic('0x' + '22' * 20), _address_topic('0x' + '33' * 20)]
+        else:
+            address, topics = '0x' + '44' * 20, [HexBytes(SWAP_TOPIC), _address_topic('0x' + '55' * 20)]
+        logs.append(AttributeDict({
+            'address': Web3.to_checksum_address(address),
+            'topics': topics,
+            'data': HexBytes((5_000_000).to_bytes(32, 'big')),
+            'logIndex': index,
+            'transactionIndex': 0,
+            'transactionHash': HexBytes(b'\xab' * 32),
+            'blockHash': HexBytes(b'\xcd' * 32),
+            'blockNumber': 1,
+        }))
+    return logs
+
+
+def abi_decode(contract, logs):
+    """The previous Web3Service.parse_transfer_events implementation"""
+    events = []
+    for log in logs:
+        try:
+            event = contract.events.Transfer().process_log(log)
+            events.append({
+                'from': event.args['from'],
+                'to': event.args['to'],
+                'value': event.args['value'],
+                'log_index': log.logIndex,
+            })
+        except Exception:
+            continue
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Transfer log decoding')
+    parser.add_argument('--logs', type=int, default=40, help='Logs per receipt')
+    parser.add_argument('--iterations', type=int, default=500, help='Receipts decoded per run')
+    args = parser.parse_args()
+
+    logs = build_logs(args.logs)
+    contract = Web3().eth.contract(address=USDC, abi=USDC_ABI)
+    decoder = TransferDecoder(USDC)
+
+    print("=" * 60)
+    print(f"Decoding {args.logs} logs x {args.iterations} receipts")
+    print("=" * 60)
+
+    fast_events = decoder.decode(logs)
+    print(f"ABI path events:     {len(abi_decode(contract, logs))} (matches any contract's Transfer)")
+    print(f"Fast decoder events: {len(fast_events)} (USDC only)")
+
+    abi_time = min(timeit.repeat(lambda: abi_decode(contract, logs), number=args.iterations, repeat=3))
+    fast_time = min(timeit.repeat(lambda: decoder.decode(logs), number=args.iterations, repeat=3))
+
+    print(f"\nABI process_log:  {abi_time / args.iterations * 1e6:10.1f} us/receipt")
+    print(f"TransferDecoder:  {fast_time / args.iterations * 1e6:10.1f} us/receipt")
+    print(f"Speedup:          {abi_time / fast_time:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+Throughput benchmark: one requests.post per webhook vs the pooled, concurrent dispatcher
+Usage: python bench_webhook_dispatch.py [--deliveries N] [--latency MS] [--concurrency N]
+
+Sends to a local stand-in receiver that answers after --latency ms, so no
+database or real webhook endpoint is involved.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myProject.settings')
+
+import django
+
+django.setup()
+
+import requests
+from django.conf import settings
+
+from myApp.models import WebhookDelivery
+from myApp.services import webhook_service
+
+
+class StandInReceiver:
+    """Keep-alive HTTP endpoint that answers 200 after `latency` seconds and counts connections"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # Headers and body go out as separate writes
+
+            def setup(self):
+                super().setup()
+                with receiver._lock:
+                    receiver.connections += 1
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers['Content-Length']))
+                time.sleep(receiver.latency)
+                with receiver._lock:
+                    receiver.requests += 1
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'ok')
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}/hook'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def reset(self):
+        self.requests = self.connections = 0
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def build_deliveries(url, count):
+    """Unsaved outbox rows with a realistic payload (the dispatcher only needs url, payload and pk)"""
+    with open(BASE_DIR / 'sample_webhook_payload.json') as f:
+        payload = json.load(f)
+    return [WebhookDelivery(pk=index + 1, url=url, payload=payload) for index in range(count)]
+
+
+def send_unpooled(deliveries):
+    """The previous sender: a new connection per webhook, one at a time"""
+    for delivery in deliveries:
+        requests.post(delivery.url, json=delivery.payload, headers={'Content-Type': 'application/json'}, timeout=10)
+
+
+def send_pooled(deliveries):
+    for _, response, error in webhook_service._send_all(deliveries):
+        if error is not None:
+            raise error
+
+
+def run(label, send, deliveries, receiver):
+    receiver.reset()
+    started = time.perf_counter()
+    send(deliveries)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed:8.2f} s {len(deliveries) / elapsed:10.1f} webhooks/s "
+          f"{receiver.connections:8d} connections")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark webhook delivery throughput')
+    parser.add_argument('--deliveries', type=int, default=200, help='Webhooks to send per run')
+    parser.add_argument('--latency', type=float, default=20, help='Receiver response time in ms')
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help='In-flight requests per destination (defaults to PAYMENT_WEBHOOK_CONCURRENCY_PER_HOST)')
+    args = parser.parse_args()
+
+    if args.concurrency:
+        settings.PAYMENT_WEBHOOK_CONCURRENCY_PER_HOST = args.concurrency
+        settings.PAYMENT_WEBHOOK_WORKERS = max(args.concurrency, settings.PAYMENT_WEBHOOK_WORKERS)
+    concurrency = settings.PAYMENT_WEBHOOK_CONCURRENCY_PER_HOST
+
+    receiver = StandInReceiver(args.latency / 1000)
+    deliveries = build_deliveries(receiver.url, args.deliveries)
+
+    print("=" * 72)
+    print(f"Sending {args.deliveries} webhooks to a receiver with {args.latency:.0f} ms latency "
+          f"({concurrency} per destination)")
+    print("=" * 72)
+    try:
+        unpooled = run('requests.post per webhook', send_unpooled, deliveries, receiver)
+        pooled = run('Pooled dispatcher', send_pooled, deliveries, receiver)
+    finally:
+        receiver.close()
+    print(f"\nSpeedup: {unpooled / pooled:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+WebSocket consumers (routed in myApp/routing.py, served by myProject/asgi.py).
+"""
+import asyncio
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+from .services.payment_events import ORG_RE, bind_consumer_loop, head_group, org_group, payment_event, tx_group
+from .services.payment_verification import TX_HASH_RE
+
+
+class PaymentEventsConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Live payment events on ws/payments/.
+
+    Clients send {"action": "subscribe" | "unsubscribe", "tx_hash": "0x..."}
+    or, as a staff user, {"action": ..., "org": "<org>"} for every payment of
+    an org (the live dashboard). Each subscribed payment arrives as
+    {"type": "payment", "payment": {...}}: its current state right away, then
+    every status change and confirmation count as the chain head advances.
+    """
+
+    async def connect(self):
+        bind_consumer_loop(asyncio.get_running_loop())
+        self.subscriptions = set()
+        self.head_groups = set()
+        self.watched = {}  # tx hash -> last payload sent, to derive confirmations on new heads
+        await self.accept()
+
+    async def disconnect(self, code):
+        for group in self.subscriptions | self.head_groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        action = content.get('action') if isinstance(content, dict) else None
+        if action not in ('subscribe', 'unsubscribe'):
+            return await self.send_json({'type': 'error', 'error': 'Unknown action'})
+
+        tx_hash, org = content.get('tx_hash'), content.get('org')
+        if isinstance(tx_hash, str) and TX_HASH_RE.match(tx_hash):
+            group = tx_group(tx_hash)
+        elif tx_hash is None and isinstance(org, str) and ORG_RE.match(org):
+            user = self.scope.get('user')
+            if not (user and user.is_staff):
+                return await self.send_json({'type': 'error', 'error': 'Org subscriptions require a staff login'})
+            group = org_group(org)
+        else:
+            return await self.send_json({'type': 'error', 'error': 'A valid tx_hash or org is required'})
+
+        if action == 'unsubscribe':
+            self.subscriptions.discard(group)
+            if tx_hash:
+                self.watched.pop(tx_hash.lower(), None)
+            await self.channel_layer.group_discard(group, self.channel_name)
+            return await self.send_json({'type': 'unsubscribed', 'group': group})
+
+        if group not in self.subscriptions:
+            max_subscriptions = getattr(settings, 'PAYMENT_EVENTS_MAX_SUBSCRIPTIONS', 50)
+            if len(self.subscriptions) >= max_subscriptions:
+                return await self.send_json({'type': 'error', 'error': f'At most {max_subscriptions} subscriptions'})
+            self.subscriptions.add(group)
+            await self.channel_layer.group_add(group, self.channel_name)
+        await self.send_json({'type': 'subscribed', 'group': group})
+
+        if tx_hash:
+            # Snapshot first, so clients don't wait for the next change
+            payment = await self._get_payment(tx_hash)
+            if payment is not None:
+                await self._forward(payment_event(payment))
+
+    async def payment_event(self, message):
+        """Layer message: a payment changed"""
+        await self._forward(message['payment'])
+
+    async def payment_head(self, message):
+        """Layer message: a new head; push the new confirmation counts of watched pending payments"""
+        head = message['head']
+        for payload in list(self.watched.values()):
+            if payload['chain_id'] != message['chain_id'] or payload['status'] != 'pending' or not payload['block_number']:
+                continue
+            confirmations = max(0, head - payload['block_number'])
+            if confirmations != payload['confirmations']:
+                await self._forward(dict(payload, confirmations=confirmations))
+
+    async def _forward(self, payload):
+        tx_hash = payload['transaction_hash'].lower()
+        if tx_group(tx_hash) in self.subscriptions:
+            self.watched[tx_hash] = payload
+            group = head_group(payload['chain_id'])
+            if group not in self.head_groups:
+                self.head_groups.add(group)
+                await self.channel_layer.group_add(group, self.channel_name)
+        await self.send_json({'type': 'payment', 'payment': payload})
+
+    @database_sync_to_async
+    def _get_payment(self, tx_hash):
+        from .models import TokenPayment
+        return TokenPayment.objects.filter(transaction_hash__iexact=tx_hash).first()
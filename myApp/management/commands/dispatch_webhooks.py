@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from myApp.services.webhook_service import WebhookDispatcher
+
+
+class Command(BaseCommand):
+    help = "Deliver payment webhooks from the outbox, retrying failures with backoff"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Send the deliveries due now and exit')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Seconds between outbox polls (defaults to PAYMENT_WEBHOOK_POLL_INTERVAL)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Deliveries claimed per poll (defaults to PAYMENT_WEBHOOK_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        dispatcher = WebhookDispatcher(interval=options['interval'], batch_size=options['batch_size'])
+        if options['once']:
+            self.stdout.write(f"Attempted {dispatcher.run_once()} delivery(ies)")
+            return
+        self.stdout.write(f"Dispatching webhooks every {dispatcher.interval}s (Ctrl+C to stop)")
+        try:
+            dispatcher.run_forever()
+        except KeyboardInterrupt:
+            dispatcher.stop()
@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from myApp.services.chain_registry import get_registry
+from myApp.services.transfer_indexer import TransferIndexer
+from myApp.services.web3_service import get_web3_service
+
+
+class Command(BaseCommand):
+    help = "Index token Transfer events to RECEIVER_WALLET into TokenPayment rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chain-id', type=int, default=None, help='Chain to index (defaults to WEB3_DEFAULT_CHAIN_ID)')
+        parser.add_argument('--token', default=None, help="Token contract to index (defaults to the chain's first token)")
+        parser.add_argument('--once', action='store_true', help='Index up to the current head and exit')
+        parser.add_argument('--from-block', type=int, default=None,
+                            help='Start from this block instead of the stored cursor')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Seconds between runs (defaults to WEB3_INDEXER_INTERVAL)')
+
+    def handle(self, *args, **options):
+        indexer = TransferIndexer(
+            service=get_web3_service(options['chain_id']),
+            token=get_registry().get_token(options['chain_id'], options['token']),
+        )
+        interval = options['interval'] or getattr(settings, 'WEB3_INDEXER_INTERVAL', 10)
+        start_block = options['from_block']
+
+        while True:
+            try:
+                scanned, found = indexer.run_once(start_block=start_block)
+                start_block = None  # Resume from the cursor after the first run
+                if scanned:
+                    self.stdout.write(f"Scanned {scanned} block(s), found {found} transfer(s)")
+            except Exception as e:
+                self.stderr.write(f"Indexer run failed: {e}")
+                if options['once']:
+                    raise
+            if options['once']:
+                break
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                break
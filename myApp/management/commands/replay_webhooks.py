@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from myApp.models import WebhookDelivery
+from myApp.services.webhook_service import replay_deliveries
+
+
+class Command(BaseCommand):
+    help = "Requeue payment webhook deliveries (dead-lettered ones by default) to be sent again"
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help='Delivery ids to replay')
+        parser.add_argument('--tx-hash', action='append', default=[],
+                            help="Replay the deliveries of this payment's transaction (repeatable)")
+        parser.add_argument('--status', choices=[choice for choice, _ in WebhookDelivery.STATUS_CHOICES],
+                            default=None, help="Only deliveries in this status (defaults to 'dead' without ids/hashes)")
+        parser.add_argument('--since', default=None, help='Only deliveries created at or after this ISO timestamp')
+        parser.add_argument('--dry-run', action='store_true', help='List the matching deliveries without requeueing')
+
+    def handle(self, *args, **options):
+        deliveries = WebhookDelivery.objects.all()
+        if options['ids']:
+            deliveries = deliveries.filter(id__in=options['ids'])
+        if options['tx_hash']:
+            deliveries = deliveries.filter(payment__transaction_hash__in=options['tx_hash'])
+        status = options['status']
+        if status is None and not (options['ids'] or options['tx_hash']):
+            status = 'dead'
+        if status:
+            deliveries = deliveries.filter(status=status)
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid --since timestamp: {options['since']}")
+            deliveries = deliveries.filter(created_at__gte=since)
+
+        if options['dry_run']:
+            for delivery in deliveries.order_by('created_at'):
+                self.stdout.write(f"{delivery.pk}\t{delivery.status}\t{delivery.attempts}\t{delivery.last_error[:80]}")
+            return
+        # Deliveries mid-send are left alone; they finish or their lease expires
+        replayed = replay_deliveries(deliveries.exclude(status='sending'))
+        self.stdout.write(f"Requeued {replayed} delivery(ies)")
@@ -0,0 +1,31 @@
+import functools
+
+from django.core.management.base import BaseCommand
+
+from myApp.services.chain_registry import get_registry
+from myApp.services.head_tracker import HeadTracker
+from myApp.services.payment_promoter import on_new_head
+
+
+class Command(BaseCommand):
+    help = "Poll the chain head once per block, publish it to the shared cache and promote confirmed payments"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chain-id', type=int, default=None, help='Chain to track (defaults to WEB3_DEFAULT_CHAIN_ID)')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Seconds between polls (defaults to WEB3_HEAD_POLL_INTERVAL)')
+        parser.add_argument('--no-promote', action='store_true',
+                            help='Only publish the head; do not promote or expire payments')
+
+    def handle(self, *args, **options):
+        # This command is the tracker: don't start an in-process one alongside it
+        service = get_registry().get_service(options['chain_id'], start_tracker=False)
+        tracker = HeadTracker(service=service, interval=options['interval'], dedicated=True)
+        tracker.add_listener(lambda block: self.stdout.write(f"Head block {block}"))
+        if not options['no_promote']:
+            tracker.add_listener(functools.partial(on_new_head, chain_id=service.chain_id))
+        self.stdout.write(f"Tracking chain head every {tracker.interval}s (Ctrl+C to stop)")
+        try:
+            tracker.run_forever()
+        except KeyboardInterrupt:
+            tracker.stop()
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.2 on 2026-10-17 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0002_alter_tokenpayment_payment_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_hash', models.CharField(db_index=True, max_length=66, unique=True)),
+                ('block_number', models.BigIntegerField()),
+                ('transaction', models.JSONField(default=dict)),
+                ('receipt', models.JSONField(default=dict)),
+                ('verdicts', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0004_transfer_indexer'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tokenpayment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('failed', 'Failed'), ('expired', 'Expired')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0005_payment_expired_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tokenpayment',
+            name='block_hash',
+            field=models.CharField(blank=True, max_length=66),
+        ),
+    ]
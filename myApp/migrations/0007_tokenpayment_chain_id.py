@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0006_tokenpayment_block_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tokenpayment',
+            name='chain_id',
+            field=models.PositiveIntegerField(default=8453),
+        ),
+    ]
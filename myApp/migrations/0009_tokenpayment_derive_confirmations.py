@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-17 18:33
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0008_verificationjob'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='tokenpayment',
+            name='confirmations',
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.2 on 2026-10-17 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0010_webhookdelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='verificationjob',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='verificationjob',
+            index=models.Index(fields=['status', 'locked_until'], name='myApp_verif_status_1027ca_idx'),
+        ),
+    ]
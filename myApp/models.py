@@ -1,12 +1,57 @@
+import uuid
+
 from django.db import models
 from django.utils import timezone
 from django.conf import settings
 
+
+class TokenPaymentQuerySet(models.QuerySet):
+    """
+    Status transitions as conditional UPDATEs.
+
+    Each one only touches rows still in an allowed status and writes just the
+    columns it changes (plus updated_at, which QuerySet.update() doesn't set).
+    It returns the number of rows moved, so a concurrent writer that got there
+    first shows up as 0 instead of being overwritten.
+    """
+
+    def transition(self, from_statuses, to_status, **fields):
+        now = timezone.now()
+        fields.setdefault('updated_at', now)
+        if to_status == 'confirmed':
+            fields.setdefault('confirmed_at', now)
+        elif 'confirmed_at' not in fields:
+            fields['confirmed_at'] = None
+        return self.filter(status__in=from_statuses).update(status=to_status, **fields)
+
+    def confirm(self, **fields):
+        """pending -> confirmed"""
+        return self.transition(['pending'], 'confirmed', **fields)
+
+    def expire(self, **fields):
+        """pending -> expired"""
+        return self.transition(['pending'], 'expired', **fields)
+
+    def fail(self, **fields):
+        """pending/confirmed -> failed (e.g. a reorged transfer no longer checks out)"""
+        return self.transition(['pending', 'confirmed'], 'failed', **fields)
+
+    def reopen(self, **fields):
+        """pending/confirmed -> pending, e.g. after a reorg; the promoter confirms it again"""
+        return self.transition(['pending', 'confirmed'], 'pending', **fields)
+
+
 class TokenPayment(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('confirmed', 'Confirmed'),
         ('failed', 'Failed'),
+        ('expired', 'Expired'),
+    ]
+    
+    SOURCE_CHOICES = [
+        ('client', 'Verified by Client'),
+        ('indexer', 'Found by Indexer'),
     ]
     
     PAYMENT_TYPE_CHOICES = [
@@ -24,12 +69,15 @@ class TokenPayment(models.Model):
     amount_usd = models.DecimalField(max_digits=10, decimal_places=2)  # USD equivalent
     payment_type = models.CharField(max_length=20, choices=PAYMENT_TYPE_CHOICES, default='course')
     token_contract = models.CharField(max_length=42, default='0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913')
+    chain_id = models.PositiveIntegerField(default=8453)  # EVM chain id (8453 = Base)
     
     # Status
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     block_number = models.BigIntegerField(null=True, blank=True)
-    confirmations = models.IntegerField(default=0)
+    block_hash = models.CharField(max_length=66, blank=True)  # Lets reorgs be detected without re-fetching receipts
     required_confirmations = models.IntegerField(default=2)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default='client')
+    claimed_at = models.DateTimeField(null=True, blank=True)  # When a client attached customer details to an indexed payment
     
     # Customer Information
     first_name = models.CharField(max_length=100, blank=True)
@@ -50,6 +98,8 @@ class TokenPayment(models.Model):
     gas_used = models.BigIntegerField(null=True, blank=True)
     transfer_event_index = models.IntegerField(null=True, blank=True)  # Which log index had the Transfer event
     
+    objects = TokenPaymentQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
@@ -62,7 +112,128 @@ class TokenPayment(models.Model):
     def __str__(self):
         return f"{self.transaction_hash[:10]}... - {self.amount_token} USDC - {self.status}"
     
+    @property
+    def confirmations(self):
+        """
+        Blocks on top of the payment's block, derived from the head the tracker publishes.
+
+        Not stored, so head changes never write the row. Code that has just read
+        the head from the node can pin a fresher count by assigning it.
+        """
+        if getattr(self, '_confirmations', None) is not None:
+            return self._confirmations
+        from .services.head_tracker import get_cached_head
+        return self.confirmations_at(get_cached_head(self.chain_id))
+    
+    @confirmations.setter
+    def confirmations(self, value):
+        self._confirmations = value
+    
+    def confirmations_at(self, head):
+        """Confirmations with `head` as the latest block"""
+        if not self.block_number:
+            return 0
+        if head is None:
+            # No published head: settled payments had at least what they needed
+            return self.required_confirmations if self.status == 'confirmed' else 0
+        return max(0, head - self.block_number)
+    
     @property
     def basescan_url(self):
-        """Generate Basescan URL for transaction"""
-        return f"https://basescan.org/tx/{self.transaction_hash}"
+        """Generate block explorer URL for transaction (Basescan on Base)"""
+        from .services.chain_registry import get_registry
+        try:
+            return get_registry().get_chain(self.chain_id).explorer_url(self.transaction_hash)
+        except ValueError:
+            return f"https://basescan.org/tx/{self.transaction_hash}"
+
+
+class CachedTransaction(models.Model):
+    """Receipts and negative verification verdicts for final transactions (optional persistent tier)"""
+    transaction_hash = models.CharField(max_length=66, unique=True, db_index=True)
+    block_number = models.BigIntegerField()
+    transaction = models.JSONField(default=dict)  # Compact transaction fields
+    receipt = models.JSONField(default=dict)  # Compact receipt (status, gas, logs)
+    verdicts = models.JSONField(default=dict)  # '<chain id>:<token>:<receiving wallet>' -> final verification failure message
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.transaction_hash[:10]}... @ {self.block_number}"
+
+
+class ChainCursor(models.Model):
+    """Last block processed by a chain indexer, so it can resume where it stopped"""
+    name = models.CharField(max_length=100, unique=True)
+    block_number = models.BigIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.block_number}"
+
+
+class VerificationJob(models.Model):
+    """A queued verify request, retried in the background until its transaction is mined"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('retrying', 'Waiting to Retry'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    transaction_hash = models.CharField(max_length=66, db_index=True)
+    request_data = models.JSONField(default=dict)  # The original verify request body
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)  # Lease on the next attempt; active jobs past it are resumed
+    error = models.TextField(blank=True)
+    payment = models.ForeignKey(TokenPayment, null=True, blank=True, on_delete=models.SET_NULL, related_name='verification_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['transaction_hash', 'status']),
+            models.Index(fields=['status', 'locked_until']),
+        ]
+    
+    def __str__(self):
+        return f"{self.transaction_hash[:10]}... - {self.status} ({self.attempts} attempts)"
+
+
+class WebhookDelivery(models.Model):
+    """An outbound payment webhook, written in the same transaction as the status change it reports"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('delivered', 'Delivered'),
+        ('dead', 'Dead-lettered'),
+    ]
+    
+    payment = models.ForeignKey(TokenPayment, on_delete=models.CASCADE, related_name='webhook_deliveries')
+    event = models.CharField(max_length=50, default='payment.confirmed')
+    url = models.URLField(max_length=500)
+    payload = models.JSONField(default=dict)  # The payment as of the status change
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)  # Due time, or the lease expiry while sending
+    last_error = models.TextField(blank=True)
+    response_status = models.IntegerField(null=True, blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['payment', 'event'], name='unique_webhook_per_payment_event'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.event} for payment {self.payment_id} - {self.status}"
@@ -0,0 +1,6 @@
+from django.urls import path
+from . import consumers
+
+websocket_urlpatterns = [
+    path("ws/payments/", consumers.PaymentEventsConsumer.as_asgi(), name="payment_events_ws"),
+]
@@ -0,0 +1,205 @@
+"""
+Asyncio counterpart of Web3Service built on AsyncWeb3.
+
+Used by the async crypto views under ASGI, so a single process can keep many
+verifications in flight while they wait on the RPC node. Caching, circuit
+breaking and transfer checks are shared with the sync service.
+"""
+import asyncio
+import logging
+import time
+import aiohttp
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from web3 import AsyncHTTPProvider, AsyncWeb3
+from web3.exceptions import TransactionNotFound, Web3Exception
+from .head_tracker import get_cached_head, publish_head
+from .web3_service import RPCError, TransferVerification, _format_rpc_result, check_usdc_transfer, get_web3_service
+from . import tx_cache
+
+logger = logging.getLogger(__name__)
+
+# One async service per chain id
+_async_services = {}
+
+
+def get_async_web3_service(chain_id=None):
+    """Return the shared AsyncWeb3Service for a chain (the default chain if None)"""
+    sync_service = get_web3_service(chain_id)
+    service = _async_services.get(sync_service.chain_id)
+    if service is None:
+        service = _async_services[sync_service.chain_id] = AsyncWeb3Service(sync_service)
+    return service
+
+
+class AsyncWeb3Service:
+    def __init__(self, sync_service):
+        # Reuse the sync service's endpoints, breaker and token decoder
+        self.chain_id = sync_service.chain_id
+        self.breaker = sync_service.pool.breaker
+        timeout = aiohttp.ClientTimeout(total=getattr(settings, 'WEB3_RPC_TIMEOUT', 10))
+        self.providers = [
+            AsyncWeb3(self._provider(endpoint.url, timeout))
+            for endpoint in sync_service.pool.ranked_endpoints()
+        ]
+        self.token = sync_service.token
+        self.usdc_contract = sync_service.usdc_contract
+        self.transfer_decoder = sync_service.transfer_decoder
+        self.usdc_to_raw = sync_service.usdc_to_raw
+        self.raw_to_usdc = sync_service.raw_to_usdc
+    
+    @staticmethod
+    def _provider(url, timeout):
+        provider = AsyncHTTPProvider(url, request_kwargs={'timeout': timeout})
+        # _call() fails over to the next provider itself; web3's retry middleware would
+        # first send the same request to a throttled or failing endpoint five times
+        provider.middlewares = ()
+        return provider
+    
+    async def _call(self, make_call):
+        """
+        Run make_call(w3) against each provider in turn, through the circuit breaker.
+        
+        Transport failures (including HTTP errors such as 429/5xx) fail over to
+        the next provider. Errors the node answered with (a JSON-RPC error
+        object, an unknown transaction) count as a success, as they do on the
+        sync path; anything else counts as a failure, so a half-open probe is
+        always settled.
+        """
+        if self.breaker is not None:
+            await sync_to_async(self.breaker.before_call, thread_sensitive=False)()
+        started = time.monotonic()
+        last_error = None
+        for w3 in self.providers:
+            try:
+                result = await make_call(w3)
+            except (OSError, asyncio.TimeoutError, aiohttp.ClientError) as e:
+                logger.warning(f"Async RPC call failed on {w3.provider.endpoint_uri[:30]}...: {e}")
+                last_error = e
+                continue
+            except (ValueError, Web3Exception):
+                # The node answered; what it said is for the caller
+                await self._record_success(started)
+                raise
+            except Exception:
+                await self._record_failure()
+                raise
+            await self._record_success(started)
+            return result
+        await self._record_failure()
+        raise ConnectionError(f"All RPC endpoints failed: {last_error}")
+    
+    async def _record_success(self, started):
+        if self.breaker is not None:
+            await sync_to_async(self.breaker.record_success, thread_sensitive=False)(time.monotonic() - started)
+    
+    async def _record_failure(self):
+        if self.breaker is not None:
+            await sync_to_async(self.breaker.record_failure, thread_sensitive=False)()
+    
+    async def get_current_block(self):
+        return await self._call(lambda w3: w3.eth.block_number)
+    
+    async def get_head_block(self):
+        """Head block from the head tracker, querying the node only if it is stale"""
+        head = await sync_to_async(get_cached_head, thread_sensitive=False)(self.chain_id)
+        if head is None:
+            head = await self.get_current_block()
+            await sync_to_async(publish_head, thread_sensitive=False)(head, self.chain_id)
+        return head
+    
+    async def get_confirmations(self, block_number):
+        if not block_number:
+            return 0
+        return max(0, await self.get_head_block() - block_number)
+    
+    async def get_transaction(self, tx_hash, include_transaction=True):
+        """Async get_transaction(): tx (optional), receipt and head block fetched concurrently"""
+        try:
+            cached = await sync_to_async(tx_cache.get_cached_transaction)(tx_hash)
+            if cached is not None and include_transaction and not cached['transaction']:
+                cached = None  # Only the receipt was cached
+            if cached is not None:
+                tx = _format_rpc_result(cached['transaction']) or None
+                receipt = _format_rpc_result(cached['receipt'])
+                current_block = await self.get_head_block()
+            else:
+                async def fetch(w3):
+                    calls = [w3.eth.get_transaction_receipt(tx_hash), w3.eth.block_number]
+                    if include_transaction:
+                        calls.append(w3.eth.get_transaction(tx_hash))
+                    return await asyncio.gather(*calls)
+                receipt, current_block, *tx = await self._call(fetch)
+                tx = tx[0] if tx else None
+                if tx is None and receipt.get('effectiveGasPrice') is None:
+                    # Pre-London style receipt: the gas price is only on the transaction
+                    tx = await self._call(lambda w3: w3.eth.get_transaction(tx_hash))
+                await sync_to_async(publish_head, thread_sensitive=False)(current_block, self.chain_id)
+            
+            confirmations = max(0, current_block - receipt.blockNumber)
+            if cached is None:
+                await sync_to_async(tx_cache.store_transaction)(
+                    tx_hash, tx, receipt, is_final=confirmations >= tx_cache.finality_depth(),
+                )
+            return {
+                'transaction': tx,
+                'receipt': receipt,
+                'status': receipt.status,
+                'block_number': receipt.blockNumber,
+                'gas_used': receipt.gasUsed,
+                'logs': receipt.logs,
+                'current_block': current_block,
+                'confirmations': confirmations,
+            }
+        except TransactionNotFound:
+            return None
+        except ConnectionError:
+            raise
+        except ValueError as e:
+            if e.args and isinstance(e.args[0], dict):
+                # web3 raises the node's JSON-RPC error object as a ValueError
+                raise RPCError(e.args[0]) from e
+            logger.error(f"Error fetching transaction {tx_hash}: {e}")
+            raise ConnectionError(f"Error fetching transaction {tx_hash}: {e}") from e
+        except Exception as e:
+            logger.error(f"Error fetching transaction {tx_hash}: {e}")
+            raise ConnectionError(f"Error fetching transaction {tx_hash}: {e}") from e
+    
+    async def verify_transfer(self, tx_hash, expected_to_address, expected_amount_raw=None, expected_from_address=None, token=None):
+        """Async verify_transfer(); returns a TransferVerification"""
+        token = token or self.token
+        verdict = await sync_to_async(tx_cache.get_verdict)(token, tx_hash, expected_to_address)
+        if verdict is not None:
+            return TransferVerification(tx_hash, False, verdict)
+        
+        try:
+            tx_data = await self.get_transaction(tx_hash, include_transaction=False)
+        except RPCError as e:
+            logger.warning(f"Node rejected lookup of {tx_hash}: {e}")
+            return TransferVerification(tx_hash, False, "Transaction not found")
+        if not tx_data:
+            return TransferVerification(tx_hash, False, "Transaction not found", pending=True)
+        
+        is_valid, message, transfer_event = await sync_to_async(check_usdc_transfer)(
+            token, tx_hash, tx_data, expected_to_address,
+            expected_amount_raw=expected_amount_raw,
+            expected_from_address=expected_from_address,
+        )
+        return TransferVerification(tx_hash, is_valid, message, transfer_event, tx_data)
+    
+    async def verify_usdc_transfer(self, tx_hash, expected_to_address, expected_amount_raw=None, expected_from_address=None, tx_data=None, token=None):
+        """Async verify_usdc_transfer(); returns (is_valid, message, transfer_event)"""
+        if tx_data is None:
+            result = await self.verify_transfer(tx_hash, expected_to_address, expected_amount_raw, expected_from_address, token)
+            return result.is_valid, result.message, result.transfer
+        
+        token = token or self.token
+        verdict = await sync_to_async(tx_cache.get_verdict)(token, tx_hash, expected_to_address)
+        if verdict is not None:
+            return False, verdict, None
+        
+        return await sync_to_async(check_usdc_transfer)(
+            token, tx_hash, tx_data, expected_to_address,
+            expected_amount_raw=expected_amount_raw,
+            expected_from_address=expected_from_address,
+        )
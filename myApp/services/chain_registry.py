@@ -0,0 +1,164 @@
+"""
+Registry of supported EVM chains and tokens.
+
+Holds one pooled Web3Service per chain and one Transfer decoder per token,
+all built once per process, so verification can be routed by chain id and
+token address without per-request setup. Chains come from settings.WEB3_CHAINS:
+
+    WEB3_CHAINS = {
+        8453: {
+            'name': 'Base',
+            'rpc_urls': ['https://base-mainnet.g.alchemy.com/v2/...'],
+            'explorer_tx_url': 'https://basescan.org/tx/{tx_hash}',
+            'tokens': {
+                '0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913': {'symbol': 'USDC', 'decimals': 6},
+            },
+        },
+    }
+
+The first token listed for a chain is its default.
+"""
+import functools
+import threading
+from decimal import Decimal
+from django.conf import settings
+from web3 import Web3
+from .transfer_decoder import TransferDecoder
+
+DEFAULT_CHAIN_ID = 8453  # Base mainnet
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+class TokenConfig:
+    def __init__(self, chain_id, address, symbol='USDC', decimals=6):
+        self.chain_id = chain_id
+        self.address = Web3.to_checksum_address(address)
+        self.symbol = symbol
+        self.decimals = int(decimals)
+        self.decoder = TransferDecoder(self.address)
+    
+    def __repr__(self):
+        return f"<TokenConfig {self.symbol} on {self.chain_id}>"
+    
+    def to_raw(self, amount):
+        """Convert a token amount to raw units"""
+        return int(Decimal(str(amount)) * Decimal(10 ** self.decimals))
+    
+    def from_raw(self, raw_amount):
+        """Convert raw units to a token amount"""
+        return Decimal(str(raw_amount)) / Decimal(10 ** self.decimals)
+
+
+class ChainConfig:
+    def __init__(self, chain_id, name, rpc_urls, explorer_tx_url='', tokens=None):
+        self.chain_id = int(chain_id)
+        self.name = name
+        self.rpc_urls = rpc_urls
+        self.explorer_tx_url = explorer_tx_url
+        self.tokens = {}
+        for address, token in (tokens or {}).items():
+            config = TokenConfig(self.chain_id, address, **token)
+            self.tokens[config.address.lower()] = config
+    
+    def __repr__(self):
+        return f"<ChainConfig {self.name} ({self.chain_id})>"
+    
+    @property
+    def default_token(self):
+        return next(iter(self.tokens.values()))
+    
+    def explorer_url(self, tx_hash):
+        return self.explorer_tx_url.format(tx_hash=tx_hash) if self.explorer_tx_url else ''
+
+
+class ChainRegistry:
+    def __init__(self, chains, default_chain_id=None):
+        self.chains = {int(chain_id): ChainConfig(chain_id, **config) for chain_id, config in chains.items()}
+        self.default_chain_id = int(default_chain_id or next(iter(self.chains)))
+        self._services = {}
+        self._lock = threading.Lock()
+    
+    def get_chain(self, chain_id=None):
+        """ChainConfig for chain_id (default chain if None); ValueError if unsupported"""
+        chain_id = self.default_chain_id if chain_id in (None, '') else int(chain_id)
+        try:
+            return self.chains[chain_id]
+        except KeyError:
+            raise ValueError(f"Unsupported chain id: {chain_id}")
+    
+    def get_token(self, chain_id=None, token_address=None):
+        """TokenConfig for a token on a chain (the chain's default token if None); ValueError if unsupported"""
+        chain = self.get_chain(chain_id)
+        if not token_address:
+            return chain.default_token
+        try:
+            return chain.tokens[token_address.lower()]
+        except KeyError:
+            raise ValueError(f"Unsupported token {token_address} on chain {chain.chain_id}")
+    
+    def get_service(self, chain_id=None, start_tracker=True):
+        """
+        The pooled Web3Service for a chain, created on first use.
+        
+        New services make no RPC call up front: the pool's error scores and
+        circuit breaker deal with unhealthy nodes as requests go out. When
+        WEB3_HEAD_TRACKER is 'thread' an in-process head tracker is started
+        that drives the payment promoter for that chain. A process that runs its own
+        tracker (track_chain_head) passes start_tracker=False.
+        """
+        chain = self.get_chain(chain_id)
+        service = self._services.get(chain.chain_id)
+        if service is not None:
+            return service
+        with self._lock:
+            service = self._services.get(chain.chain_id)
+            if service is None:
+                from .web3_service import Web3Service
+                service = Web3Service(rpc_urls=chain.rpc_urls, chain_id=chain.chain_id, token=chain.default_token)
+                self._services[chain.chain_id] = service
+                # 'thread' runs the head tracker in this process; 'command' expects
+                # a separate `manage.py track_chain_head` to publish the head block
+                if start_tracker and getattr(settings, 'WEB3_HEAD_TRACKER', 'thread') == 'thread':
+                    from .head_tracker import get_head_tracker
+                    from .payment_promoter import on_new_head
+                    tracker = get_head_tracker(chain.chain_id, service=service)
+                    tracker.add_listener(functools.partial(on_new_head, chain_id=chain.chain_id))
+                    tracker.start()
+        return service
+    
+    def reset(self):
+        """Drop every service (used when settings change, e.g. in tests)"""
+        with self._lock:
+            self._services = {}
+
+
+def get_registry():
+    """Return the process-wide ChainRegistry built from settings.WEB3_CHAINS"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ChainRegistry(
+                    getattr(settings, 'WEB3_CHAINS', None) or _chains_from_base_settings(),
+                    getattr(settings, 'WEB3_DEFAULT_CHAIN_ID', None),
+                )
+    return _registry
+
+
+def _chains_from_base_settings():
+    """Single-chain fallback built from the BASE_* / USDC_* settings"""
+    return {
+        DEFAULT_CHAIN_ID: {
+            'name': 'Base',
+            'rpc_urls': getattr(settings, 'BASE_RPC_URLS', None) or getattr(settings, 'BASE_RPC_URL', None),
+            'explorer_tx_url': 'https://basescan.org/tx/{tx_hash}',
+            'tokens': {
+                getattr(settings, 'USDC_CONTRACT_ADDRESS', '0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913'): {
+                    'symbol': 'USDC',
+                    'decimals': getattr(settings, 'USDC_DECIMALS', 6),
+                },
+            },
+        },
+    }
@@ -0,0 +1,95 @@
+"""
+Circuit breaker for calls to external services (the blockchain RPC path).
+
+State lives in the shared Django cache so every worker process trips, backs
+off and recovers together. After `failure_threshold` failed or slow calls
+within `window` seconds the circuit opens and calls fail fast with
+CircuitOpenError for `cooldown` seconds. It then half-opens: a single probe
+call is let through, and its outcome closes or re-opens the circuit.
+"""
+import logging
+import time
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of calling a service whose circuit is open"""
+    
+    def __init__(self, name, retry_after):
+        self.name = name
+        self.retry_after = max(1, int(round(retry_after)))
+        super().__init__(f"{name} is temporarily unavailable; try again in {self.retry_after}s")
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, window=30, cooldown=30, slow_call_threshold=None, probe_timeout=10):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.slow_call_threshold = slow_call_threshold
+        self.probe_timeout = probe_timeout
+        self._open_key = f'circuit:{name}:open_until'
+        self._failures_key = f'circuit:{name}:failures'
+        self._probe_key = f'circuit:{name}:probe'
+    
+    @property
+    def state(self):
+        open_until = cache.get(self._open_key)
+        if open_until is None:
+            return 'closed'
+        return 'open' if time.time() < open_until else 'half_open'
+    
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        open_until = cache.get(self._open_key)
+        if open_until is None:
+            return
+        remaining = open_until - time.time()
+        if remaining > 0:
+            raise CircuitOpenError(self.name, remaining)
+        # Half-open: only one probe at a time across all processes
+        if not cache.add(self._probe_key, True, timeout=self.probe_timeout):
+            raise CircuitOpenError(self.name, self.probe_timeout)
+    
+    def record_success(self, duration=None):
+        if self.slow_call_threshold is not None and duration is not None and duration > self.slow_call_threshold:
+            self.record_failure()
+            return
+        if cache.get(self._open_key) is not None:
+            logger.info(f"Circuit {self.name} closed after successful probe")
+            cache.delete_many([self._open_key, self._failures_key, self._probe_key])
+    
+    def record_failure(self):
+        if cache.get(self._open_key) is not None:
+            # A failed half-open probe re-opens the circuit
+            self._open()
+            return
+        cache.add(self._failures_key, 0, timeout=self.window)
+        try:
+            failures = cache.incr(self._failures_key)
+        except ValueError:
+            # Window expired between add() and incr()
+            cache.set(self._failures_key, 1, timeout=self.window)
+            failures = 1
+        if failures >= self.failure_threshold:
+            self._open()
+    
+    def _open(self):
+        logger.warning(f"Circuit {self.name} opened for {self.cooldown}s")
+        cache.set(self._open_key, time.time() + self.cooldown, timeout=self.cooldown + self.probe_timeout * 6)
+        cache.delete_many([self._failures_key, self._probe_key])
+    
+    def call(self, func, *args, **kwargs):
+        """Run func through the breaker; any exception counts as a failure"""
+        self.before_call()
+        started = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success(time.monotonic() - started)
+        return result
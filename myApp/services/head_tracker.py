@@ -0,0 +1,138 @@
+"""
+Chain head tracker.
+
+Polls the RPC node once per block and publishes the latest block number to the
+shared Django cache, so confirmation counts can be computed without an RPC call
+per request.
+
+Trackers hold a lease in the cache, so only one per chain polls (and runs its
+listeners) at a time however many web processes start one. A dedicated
+tracker (`manage.py track_chain_head`) always takes the lease, and in-process
+trackers stand by while it runs.
+"""
+import logging
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+HEAD_CACHE_KEY = 'web3:head_block'
+TRACKER_LEASE_KEY = 'web3:head-tracker'
+
+# One tracker per chain id
+_trackers = {}
+_tracker_lock = threading.Lock()
+
+
+def _head_key(chain_id):
+    if chain_id is None:
+        chain_id = getattr(settings, 'WEB3_DEFAULT_CHAIN_ID', 8453)
+    return f'{HEAD_CACHE_KEY}:{chain_id}'
+
+
+def get_cached_head(chain_id=None):
+    """Return the latest published head block number, or None if missing/stale"""
+    return cache.get(_head_key(chain_id))
+
+
+def publish_head(block_number, chain_id=None):
+    """Store the head block in the shared cache; it expires if the tracker stops"""
+    max_age = getattr(settings, 'WEB3_HEAD_MAX_AGE', 15)
+    cache.set(_head_key(chain_id), block_number, timeout=max_age)
+
+
+class HeadTracker:
+    def __init__(self, service=None, interval=None, chain_id=None, dedicated=False):
+        self._service = service
+        self.chain_id = chain_id if chain_id is not None else getattr(service, 'chain_id', None)
+        self.interval = interval or getattr(settings, 'WEB3_HEAD_POLL_INTERVAL', 2)
+        self.dedicated = dedicated
+        self.head = None
+        self._owner = uuid.uuid4().hex
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+    
+    @property
+    def service(self):
+        if self._service is None:
+            from .web3_service import get_web3_service
+            self._service = get_web3_service(self.chain_id)
+        return self._service
+    
+    def add_listener(self, callback):
+        """Register callback(block_number) to run whenever the head advances"""
+        self._listeners.append(callback)
+    
+    def hold_lease(self):
+        """Take or renew this chain's tracker lease; False while another tracker holds it"""
+        key = f'{TRACKER_LEASE_KEY}:{self.chain_id}'
+        timeout = max(3 * self.interval, 5)
+        if self.dedicated:
+            cache.set(key, self._owner, timeout=timeout)
+            return True
+        if cache.add(key, self._owner, timeout=timeout):
+            return True
+        if cache.get(key) == self._owner:
+            cache.touch(key, timeout=timeout)
+            return True
+        return False
+    
+    def poll_once(self):
+        """Fetch the head block once and publish it; returns the block number"""
+        block_number = self.service.get_current_block()
+        publish_head(block_number, self.service.chain_id)
+        if self.head is None or block_number > self.head:
+            self.head = block_number
+            for callback in self._listeners:
+                try:
+                    callback(block_number)
+                except Exception as e:
+                    logger.error(f"Head listener {callback!r} failed at block {block_number}: {e}", exc_info=True)
+        return block_number
+    
+    def run_forever(self):
+        """Poll until stop() is called"""
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                if self.hold_lease():
+                    self.poll_once()
+            except Exception as e:
+                logger.warning(f"Head tracker poll failed: {e}")
+            self._stop.wait(max(0, self.interval - (time.monotonic() - started)))
+    
+    def start(self):
+        """Run the tracker in a daemon thread (no-op if already running)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name='web3-head-tracker', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+
+
+def get_head_tracker(chain_id=None, service=None):
+    """Return the process-wide HeadTracker for a chain"""
+    if chain_id is None:
+        chain_id = getattr(settings, 'WEB3_DEFAULT_CHAIN_ID', 8453)
+    tracker = _trackers.get(chain_id)
+    if tracker is None:
+        with _tracker_lock:
+            tracker = _trackers.get(chain_id)
+            if tracker is None:
+                tracker = _trackers[chain_id] = HeadTracker(service=service, chain_id=chain_id)
+    return tracker
+
+
+def stop_head_trackers():
+    """Stop and forget every in-process tracker"""
+    with _tracker_lock:
+        for tracker in _trackers.values():
+            tracker.stop()
+        _trackers.clear()
@@ -0,0 +1,149 @@
+"""
+Head notifications for streaming and long-polling endpoints.
+
+Each event loop runs at most one watcher task per chain. It reads the head
+published by the head tracker every WEB3_HEAD_POLL_INTERVAL seconds (asking
+the node only when that is stale) and wakes every coroutine waiting in
+wait_for_head(). However many clients are streaming, the process does one
+head read per interval; the watcher stops once nobody is waiting.
+
+wait_for_head_sync() is the same for threads (sync views), with one daemon
+thread per chain notifying a Condition.
+"""
+import asyncio
+import logging
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_watchers = {}
+_blocking_watchers = {}
+_blocking_watchers_lock = threading.Lock()
+
+
+class HeadWatcher:
+    def __init__(self, chain_id, interval=None):
+        self.chain_id = chain_id
+        self.interval = interval or getattr(settings, 'WEB3_HEAD_POLL_INTERVAL', 2)
+        self.head = None
+        self._advanced = asyncio.Event()
+        self._waiters = 0
+        self._task = None
+
+    async def wait(self, after=None, timeout=None):
+        """
+        Wait until the head is past `after` (any known head if None).
+
+        Returns the head, which may still be `after` (or None) if the timeout
+        expired first.
+        """
+        self._waiters += 1
+        try:
+            if self._task is None or self._task.done():
+                self._task = asyncio.get_running_loop().create_task(self._run())
+            while self.head is None or (after is not None and self.head <= after):
+                try:
+                    await asyncio.wait_for(self._advanced.wait(), timeout)
+                except asyncio.TimeoutError:
+                    break
+        finally:
+            self._waiters -= 1
+        return self.head
+
+    async def _run(self):
+        from .async_web3_service import get_async_web3_service
+
+        service = await sync_to_async(get_async_web3_service, thread_sensitive=False)(self.chain_id)
+        while self._waiters:
+            try:
+                head = await service.get_head_block()
+            except Exception as e:
+                logger.warning(f"Head watcher for chain {self.chain_id} failed to read the head: {e}")
+            else:
+                if self.head is None or head > self.head:
+                    self.head = head
+                    # Wake everyone waiting on this head; later waits use a fresh event
+                    advanced, self._advanced = self._advanced, asyncio.Event()
+                    advanced.set()
+            await asyncio.sleep(self.interval)
+
+
+def get_head_watcher(chain_id=None):
+    """The HeadWatcher for a chain on the running event loop"""
+    if chain_id is None:
+        chain_id = getattr(settings, 'WEB3_DEFAULT_CHAIN_ID', 8453)
+    key = (id(asyncio.get_running_loop()), chain_id)
+    watcher = _watchers.get(key)
+    if watcher is None:
+        watcher = _watchers[key] = HeadWatcher(chain_id)
+    return watcher
+
+
+async def wait_for_head(chain_id=None, after=None, timeout=None):
+    """Wait for the chain's head to advance past `after`; see HeadWatcher.wait()"""
+    return await get_head_watcher(chain_id).wait(after, timeout)
+
+
+class BlockingHeadWatcher:
+    """HeadWatcher for threads: a daemon thread reads the head and wakes waiters through a Condition"""
+
+    def __init__(self, chain_id, interval=None):
+        self.chain_id = chain_id
+        self.interval = interval or getattr(settings, 'WEB3_HEAD_POLL_INTERVAL', 2)
+        self.head = None
+        self._advanced = threading.Condition()
+        self._waiters = 0
+        self._thread = None
+
+    def wait(self, after=None, timeout=None):
+        """Block until the head is past `after`; see HeadWatcher.wait()"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._advanced:
+            self._waiters += 1
+            try:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name=f'head-watcher-{self.chain_id}', daemon=True
+                    )
+                    self._thread.start()
+                while self.head is None or (after is not None and self.head <= after):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._advanced.wait(remaining)
+            finally:
+                self._waiters -= 1
+            return self.head
+
+    def _run(self):
+        from .web3_service import get_web3_service
+
+        while True:
+            with self._advanced:
+                if not self._waiters:
+                    self._thread = None
+                    return
+            try:
+                head = get_web3_service(self.chain_id).get_head_block()
+            except Exception as e:
+                logger.warning(f"Head watcher for chain {self.chain_id} failed to read the head: {e}")
+            else:
+                with self._advanced:
+                    if self.head is None or head > self.head:
+                        self.head = head
+                        self._advanced.notify_all()
+            time.sleep(self.interval)
+
+
+def wait_for_head_sync(chain_id=None, after=None, timeout=None):
+    """Blocking wait_for_head() for sync code, shared by every thread in the process"""
+    if chain_id is None:
+        chain_id = getattr(settings, 'WEB3_DEFAULT_CHAIN_ID', 8453)
+    with _blocking_watchers_lock:
+        watcher = _blocking_watchers.get(chain_id)
+        if watcher is None:
+            watcher = _blocking_watchers[chain_id] = BlockingHeadWatcher(chain_id)
+    return watcher.wait(after, timeout)
@@ -0,0 +1,154 @@
+"""
+Read-through cache for the polled payment endpoints.
+
+payment_status and payment_details serve a PaymentSnapshot (their JSON
+payloads plus what the HTTP validators and live confirmation counts need)
+looked up in two tiers: a small in-process LRU, then the shared Django
+cache, and only then the database. While a payment is unchanged, polls do
+no DB round trip.
+
+Writes invalidate both tiers once their transaction commits: TokenPayment
+save/delete signals (see myApp/signals.py) and the bulk updaters (promotion,
+expiry, reorg handling, claims) call invalidate_payments(). Other processes'
+LRUs are not reachable, so local entries also expire after
+PAYMENT_CACHE_LOCAL_TTL seconds.
+"""
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = 'payment-snapshot'
+
+
+class PaymentSnapshot:
+    """What the polled endpoints serve for a payment, detached from the ORM"""
+
+    def __init__(self, payment, status_payload, details_payload):
+        self.transaction_hash = payment.transaction_hash
+        self.chain_id = payment.chain_id
+        self.block_number = payment.block_number
+        self.status = payment.status
+        self.confirmations = payment.confirmations
+        self.updated_at = payment.updated_at
+        self.status_payload = status_payload
+        self.details_payload = details_payload
+
+    def with_confirmations(self, confirmations):
+        """A copy with a live confirmation count (snapshots are shared, never modify them)"""
+        snapshot = copy.copy(self)
+        snapshot.confirmations = confirmations
+        snapshot.status_payload = dict(self.status_payload, confirmations=confirmations)
+        return snapshot
+
+
+class LocalLRU:
+    """Thread-safe LRU of (expires_at, value) entries"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local = None
+_local_lock = threading.Lock()
+
+
+def _get_local():
+    global _local
+    if _local is None:
+        with _local_lock:
+            if _local is None:
+                _local = LocalLRU(
+                    max_entries=getattr(settings, 'PAYMENT_CACHE_LOCAL_SIZE', 1024),
+                    ttl=getattr(settings, 'PAYMENT_CACHE_LOCAL_TTL', 2),
+                )
+    return _local
+
+
+def _cache_key(tx_hash):
+    return f'{CACHE_KEY_PREFIX}:{tx_hash}'
+
+
+def get_payment_snapshot(tx_hash, build):
+    """
+    The PaymentSnapshot for a transaction hash, or None if there is no such payment.
+
+    Misses in both tiers load the payment and call build(payment) to make the
+    snapshot. Unknown hashes are not cached, so a payment recorded a moment
+    later is found immediately.
+    """
+    from ..models import TokenPayment
+
+    local = _get_local()
+    snapshot = local.get(tx_hash)
+    if snapshot is not None:
+        return snapshot
+
+    key = _cache_key(tx_hash)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        payment = TokenPayment.objects.filter(transaction_hash=tx_hash).first()
+        if payment is None:
+            return None
+        snapshot = build(payment)
+        # Pending payments are about to change; a short TTL bounds a racing writer's window
+        if payment.status == 'pending':
+            timeout = getattr(settings, 'PAYMENT_CACHE_PENDING_TTL', 30)
+        else:
+            timeout = getattr(settings, 'PAYMENT_CACHE_TTL', 300)
+        cache.set(key, snapshot, timeout)
+    local.set(tx_hash, snapshot)
+    return snapshot
+
+
+def invalidate_payments(tx_hashes):
+    """Drop cached snapshots for these transactions once the current transaction commits"""
+    tx_hashes = [tx_hash for tx_hash in tx_hashes if tx_hash]
+    if not tx_hashes:
+        return
+
+    def invalidate():
+        local = _get_local()
+        for tx_hash in tx_hashes:
+            local.delete(tx_hash)
+        try:
+            cache.delete_many([_cache_key(tx_hash) for tx_hash in tx_hashes])
+        except Exception as e:
+            logger.warning(f"Failed to invalidate cached payments: {e}")
+
+    transaction.on_commit(invalidate)
@@ -0,0 +1,137 @@
+"""
+Live payment events over the Channels layer.
+
+Verification, promotion, expiry and reorg handling call publish_payments()
+after they change payments, and the head listener calls publish_head_event() once
+per new block. PaymentEventsConsumer (myApp/consumers.py) forwards them to
+WebSocket clients subscribed to a transaction or an org, deriving
+confirmation counts from head events rather than a message per payment.
+
+The layer is CHANNEL_LAYERS['default']: in-memory for a single process,
+Redis (channels_redis) when several processes or nodes serve WebSockets.
+Publishing never raises; from request threads it doesn't wait for the layer.
+"""
+import asyncio
+import logging
+import re
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Event loop serving this process's consumers (in-memory layer queues live on it)
+_consumer_loop = None
+_pending_sends = set()
+
+# Orgs usable in a group name (Channels allows ASCII letters, digits, "-", "_" and ".")
+ORG_RE = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+
+def tx_group(tx_hash):
+    return f'payments.tx.{tx_hash.lower()}'
+
+
+def org_group(org):
+    return f'payments.org.{org}'
+
+
+def head_group(chain_id):
+    return f'payments.head.{chain_id}'
+
+
+def bind_consumer_loop(loop):
+    """Called by consumers on connect so publishers in other threads send on their loop"""
+    global _consumer_loop
+    _consumer_loop = loop
+
+
+def payment_event(payment):
+    """The JSON-safe payload sent to subscribers for a payment"""
+    from .payment_verification import required_confirmations
+
+    return {
+        'transaction_hash': payment.transaction_hash,
+        'chain_id': payment.chain_id,
+        'org': payment.org,
+        'payment_type': payment.payment_type,
+        'status': payment.status,
+        'block_number': payment.block_number,
+        'confirmations': payment.confirmations,
+        'required_confirmations': required_confirmations(),
+        'amount_usdc': str(payment.amount_token),
+        'basescan_url': payment.basescan_url,
+    }
+
+
+def publish_payments(payments):
+    """
+    Publish the current state of payments (instances or ids) once the transaction commits.
+    """
+    from ..models import TokenPayment
+
+    payments = list(payments)
+    if not payments or not _layer_reachable():
+        return
+    ids = [payment for payment in payments if not isinstance(payment, TokenPayment)]
+    if ids:
+        payments = [payment for payment in payments if isinstance(payment, TokenPayment)]
+        payments += list(TokenPayment.objects.filter(id__in=ids))
+
+    messages = []
+    for payment in payments:
+        message = {'type': 'payment.event', 'payment': payment_event(payment)}
+        messages.append((tx_group(payment.transaction_hash), message))
+        if ORG_RE.match(payment.org or ''):
+            messages.append((org_group(payment.org), message))
+    transaction.on_commit(lambda: _send(messages))
+
+
+def publish_head_event(head, chain_id=None):
+    """Publish a new head block so consumers can update confirmation counts"""
+    if chain_id is None:
+        chain_id = getattr(settings, 'WEB3_DEFAULT_CHAIN_ID', 8453)
+    if _layer_reachable():
+        _send([(head_group(chain_id), {'type': 'payment.head', 'chain_id': chain_id, 'head': head})])
+
+
+def _layer():
+    from channels.layers import get_channel_layer
+    return get_channel_layer()
+
+
+def _layer_reachable():
+    """False when nobody could receive: no layer, or an in-memory one without consumers in this process"""
+    from channels.layers import InMemoryChannelLayer
+
+    layer = _layer()
+    if layer is None:
+        return False
+    return not (isinstance(layer, InMemoryChannelLayer) and _consumer_loop is None)
+
+
+def _send(messages):
+    layer = _layer()
+
+    async def send_all():
+        for group, message in messages:
+            try:
+                await layer.group_send(group, message)
+            except Exception as e:
+                logger.warning(f"Failed to publish payment event to {group}: {e}")
+
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    try:
+        if running is not None:
+            task = running.create_task(send_all())
+            _pending_sends.add(task)  # The loop only keeps weak references to tasks
+            task.add_done_callback(_pending_sends.discard)
+        elif _consumer_loop is not None and _consumer_loop.is_running():
+            asyncio.run_coroutine_threadsafe(send_all(), _consumer_loop)
+        else:
+            async_to_sync(send_all)()
+    except Exception as e:
+        logger.warning(f"Failed to publish payment events: {e}")
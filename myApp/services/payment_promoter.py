@@ -0,0 +1,121 @@
+"""
+Bulk payment status transitions driven by the chain head.
+
+Each time the head advances, recent payments are checked for reorgs, pending
+payments that have enough confirmations are promoted with a single UPDATE and
+their webhooks written to the outbox. Pending payments that never confirm are
+expired in bulk. Status reads never write.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from .payment_cache import invalidate_payments
+from .payment_events import publish_head_event, publish_payments
+from .reorg_checker import check_reorgs
+from .web3_service import get_web3_service
+from .webhook_service import enqueue_payment_webhooks
+
+logger = logging.getLogger(__name__)
+
+PROMOTER_LOCK_KEY = 'payments:promoter-lock'
+EXPIRY_RUN_KEY = 'payments:expiry-last-run'
+
+
+@contextmanager
+def _chain_lock(chain_id):
+    """
+    One head sweep (reorg check and promotion) per chain at a time across
+    processes; yields whether the lock was taken.
+    """
+    lock_key = f'{PROMOTER_LOCK_KEY}:{chain_id}'
+    acquired = cache.add(lock_key, True, timeout=30)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            cache.delete(lock_key)
+
+
+def _default_chain(chain_id):
+    return chain_id if chain_id is not None else getattr(settings, 'WEB3_DEFAULT_CHAIN_ID', 8453)
+
+
+def promote_confirmed_payments(head, chain_id=None):
+    """
+    Confirm every pending payment on a chain with block_number <= head - required_confirmations.
+    
+    Returns the ids of the promoted payments.
+    """
+    chain_id = _default_chain(chain_id)
+    # The outbox also allows only one webhook per payment
+    with _chain_lock(chain_id) as acquired:
+        if not acquired:
+            return []
+        return _promote(head, chain_id)
+
+
+def _promote(head, chain_id):
+    from ..models import TokenPayment
+    
+    eligible = TokenPayment.objects.filter(
+        chain_id=chain_id,
+        status='pending',
+        block_number__isnull=False,
+        block_number__lte=head - F('required_confirmations'),
+    )
+    promoted = dict(eligible.values_list('id', 'transaction_hash'))
+    promoted_ids = list(promoted)
+    if not promoted_ids:
+        return []
+    # The webhooks go to the outbox in the same transaction as the status change
+    with transaction.atomic():
+        TokenPayment.objects.filter(id__in=promoted_ids).confirm()
+        enqueue_payment_webhooks(TokenPayment.objects.filter(id__in=promoted_ids, status='confirmed'))
+    
+    logger.info(f"Promoted {len(promoted_ids)} payment(s) to confirmed at block {head} on chain {chain_id}")
+    invalidate_payments(promoted.values())
+    publish_payments(promoted_ids)
+    return promoted_ids
+
+
+def expire_stale_payments():
+    """Mark pending payments older than WEB3_PENDING_EXPIRY seconds as expired; returns the count"""
+    from ..models import TokenPayment
+    
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'WEB3_PENDING_EXPIRY', 24 * 3600))
+    stale = dict(TokenPayment.objects.filter(status='pending', created_at__lt=cutoff).values_list('id', 'transaction_hash'))
+    if not stale:
+        return 0
+    expired = TokenPayment.objects.filter(id__in=stale).expire()
+    logger.warning(f"Expired {expired} payment(s) still pending after {cutoff.isoformat()}")
+    invalidate_payments(stale.values())
+    publish_payments(list(stale))
+    return expired
+
+
+def on_new_head(head, chain_id=None):
+    """Head tracker listener: re-check reorged payments, promote confirmed ones, expire stale ones"""
+    close_old_connections()
+    try:
+        publish_head_event(head, chain_id)
+        chain_id = _default_chain(chain_id)
+        # Reorg re-verification and promotion both move payments between statuses
+        with _chain_lock(chain_id) as acquired:
+            if acquired:
+                if getattr(settings, 'WEB3_REORG_CHECK', True):
+                    try:
+                        check_reorgs(head, service=get_web3_service(chain_id))
+                    except Exception as e:
+                        logger.error(f"Reorg check failed at block {head}: {e}")
+                _promote(head, chain_id)
+        interval = getattr(settings, 'WEB3_PENDING_EXPIRY_CHECK_INTERVAL', 60)
+        if cache.add(EXPIRY_RUN_KEY, time.time(), timeout=interval):
+            expire_stale_payments()
+    finally:
+        close_old_connections()
@@ -0,0 +1,384 @@
+"""
+Payment verification shared by the verify endpoints and background jobs.
+
+A verify request body is parsed once by parse_verify_request(), then
+verify_payment() fetches the transaction, checks its Transfer event and
+records the TokenPayment - so the views and the job workers apply exactly
+the same rules. Concurrent verifications of one transaction (double
+clicks, widget retries, several workers) are coalesced so only one of
+them talks to the node and writes the row; the rest share its outcome.
+"""
+import logging
+import re
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .chain_registry import get_registry
+from .payment_cache import invalidate_payments
+from .payment_events import publish_payments
+from .single_flight import SingleFlight
+from .webhook_service import enqueue_payment_webhooks, release_held_webhooks
+
+logger = logging.getLogger(__name__)
+
+TX_HASH_RE = re.compile(r'^0x[0-9a-fA-F]{64}$')
+
+
+class VerificationError(Exception):
+    """
+    A verify request that cannot (yet) produce a payment.
+
+    `retryable` is True when the transaction may simply not be mined yet;
+    `payment` is set when the transaction was already recorded.
+    """
+    def __init__(self, message, retryable=False, payment=None):
+        super().__init__(message)
+        self.message = message
+        self.retryable = retryable
+        self.payment = payment
+
+
+_verifications = None
+
+
+def _single_flight():
+    global _verifications
+    if _verifications is None:
+        _verifications = SingleFlight(
+            'verify-tx',
+            lock_timeout=getattr(settings, 'WEB3_VERIFY_LOCK_TIMEOUT', 30),
+            shared_errors=(VerificationError,),
+        )
+    return _verifications
+
+
+def required_confirmations():
+    return getattr(settings, 'REQUIRED_CONFIRMATIONS', 2)
+
+
+def receiver_wallet():
+    return getattr(settings, 'RECEIVER_WALLET', '0x918e03d7c59d61b6505fed486082419941ffd77f')
+
+
+def customer_from_data(data):
+    """Customer fields for a TokenPayment from a verify request body"""
+    return {
+        'first_name': data.get('first_name', ''),
+        'last_name': data.get('last_name', ''),
+        'email': data.get('email', ''),
+        'mobile': data.get('mobile', ''),
+        'company_name': data.get('company_name', ''),
+        'notes': data.get('message', ''),  # Frontend sends the notes as "message"
+        'payment_type': data.get('payment_type', 'course'),
+        'org': data.get('org', 'tanya-client'),
+    }
+
+
+def parse_verify_request(data):
+    """
+    Validate a verify request body.
+
+    Returns a dict with tx_hash, amount_usdc, from_address, token (a
+    TokenConfig, Base USDC unless chain_id/token_address say otherwise) and
+    customer. Raises ValueError with a client-facing message.
+    """
+    tx_hash = data.get('transaction_hash')
+    if not tx_hash:
+        raise ValueError('Transaction hash required')
+    # Malformed hashes would reach the node as invalid params (and be retried as outages)
+    if not isinstance(tx_hash, str) or not TX_HASH_RE.match(tx_hash):
+        raise ValueError('Invalid transaction hash')
+
+    try:
+        amount_usdc = Decimal(str(data.get('amount_usdc', 0)))
+    except InvalidOperation:
+        raise ValueError('Invalid amount')
+    if not amount_usdc.is_finite() or amount_usdc <= 0:
+        raise ValueError('Invalid amount')
+
+    return {
+        'tx_hash': tx_hash,
+        'amount_usdc': amount_usdc,
+        'from_address': (data.get('from_address') or '').strip(),
+        'token': get_registry().get_token(data.get('chain_id'), data.get('token_address')),
+        'customer': customer_from_data(data),
+    }
+
+
+def payment_fields(token, verification, amount_usdc):
+    """TokenPayment fields for a TransferVerification of `token`"""
+    transfer_event = verification.transfer
+    # Already deep enough: insert it confirmed instead of waiting for the promoter
+    confirmed = verification.confirmations >= required_confirmations()
+    return {
+        'transaction_hash': verification.tx_hash,
+        'chain_id': token.chain_id,
+        'token_contract': token.address,
+        'from_address': transfer_event['from'],
+        'to_address': transfer_event['to'],
+        'amount_raw': transfer_event['value'],
+        'amount_token': token.from_raw(transfer_event['value']),
+        'amount_usd': amount_usdc,  # USDC is 1:1 with USD
+        'status': 'confirmed' if confirmed else 'pending',
+        'confirmed_at': timezone.now() if confirmed else None,
+        'block_number': verification.block_number,
+        'block_hash': verification.block_hash,
+        'confirmations': verification.confirmations,  # Pins the count just read; not a column
+        'required_confirmations': required_confirmations(),
+        'gas_price': verification.gas_price,
+        'gas_used': verification.gas_used,
+        'transfer_event_index': transfer_event['log_index'],
+    }
+
+
+def claim_indexed_payment(payment, request):
+    """
+    Attach the client's customer details to a payment the indexer already recorded.
+
+    The transfer was decoded from chain logs, so only the amount and sender the
+    client claims need checking - no RPC calls.
+    """
+    from ..models import TokenPayment
+    from .web3_service import get_web3_service
+
+    token = get_registry().get_token(payment.chain_id, payment.token_contract)
+    expected_amount_raw = token.to_raw(request['amount_usdc'])
+    if abs(int(payment.amount_raw) - expected_amount_raw) > 1:
+        raise VerificationError(f"Amount mismatch: {payment.amount_raw} != {expected_amount_raw}")
+    from_address = request['from_address']
+    if from_address and payment.from_address.lower() != from_address.lower():
+        raise VerificationError(f"Sender mismatch: {payment.from_address} != {from_address}")
+
+    # Conditional update so two concurrent claims can't both succeed
+    now = timezone.now()
+    claimed = TokenPayment.objects.filter(pk=payment.pk, claimed_at__isnull=True).update(
+        claimed_at=now,
+        updated_at=now,
+        amount_usd=request['amount_usdc'],
+        **request['customer'],
+    )
+    payment.refresh_from_db()
+    if not claimed:
+        raise VerificationError('Transaction already processed', payment=payment)
+    release_held_webhooks(payment)
+    invalidate_payments([payment.transaction_hash])
+    publish_payments([payment])
+    try:
+        if payment.block_number:
+            payment.confirmations = get_web3_service(payment.chain_id).get_confirmations(payment.block_number)
+    except Exception:
+        pass  # Keep the confirmations recorded by the indexer
+    return payment
+
+
+def verify_payment(web3_service, request):
+    """
+    Verify a parsed verify request on chain and record its TokenPayment.
+
+    Returns the payment. Raises VerificationError when the transfer doesn't
+    check out (retryable while the transaction isn't found) and lets
+    CircuitOpenError through so callers can answer "try again later".
+    Concurrent calls for the same transaction share one verification.
+    """
+    return _single_flight().do(
+        request['tx_hash'].lower(),
+        lambda: _verify_payment(web3_service, request),
+    )
+
+
+async def averify_payment(web3_service, request):
+    """verify_payment() for the async views, using an AsyncWeb3Service"""
+    return await _single_flight().ado(
+        request['tx_hash'].lower(),
+        lambda: _averify_payment(web3_service, request),
+    )
+
+
+def verify_payments(requests):
+    """
+    Verify many parsed verify requests at once.
+
+    Uses one query to find already-recorded transactions and one batched RPC
+    request per chain for the rest. Returns (payment, error) pairs in request
+    order, where error is a VerificationError. Webhooks for payments that are
+    confirmed on creation are queued in the background.
+    """
+    from ..models import TokenPayment
+    from .web3_service import get_web3_service
+
+    existing = {
+        payment.transaction_hash: payment
+        for payment in TokenPayment.objects.filter(transaction_hash__in=[request['tx_hash'] for request in requests])
+    }
+    outcomes = [None] * len(requests)
+    by_chain = defaultdict(list)
+    for index, request in enumerate(requests):
+        payment = existing.get(request['tx_hash'])
+        if payment is None:
+            by_chain[request['token'].chain_id].append(index)
+        elif payment.source == 'indexer' and payment.claimed_at is None:
+            try:
+                outcomes[index] = (claim_indexed_payment(payment, request), None)
+            except VerificationError as e:
+                outcomes[index] = (None, e)
+        else:
+            outcomes[index] = (None, VerificationError('Transaction already processed', payment=payment))
+
+    new_payments = {}
+    for chain_id, indexes in by_chain.items():
+        verifications = get_web3_service(chain_id).verify_transfers([{
+            'tx_hash': requests[index]['tx_hash'],
+            'expected_to_address': receiver_wallet(),
+            'expected_amount_raw': requests[index]['token'].to_raw(requests[index]['amount_usdc']),
+            'expected_from_address': requests[index]['from_address'] or None,
+            'token': requests[index]['token'],
+        } for index in indexes])
+        for index, verification in zip(indexes, verifications):
+            request = requests[index]
+            if not verification.is_valid:
+                outcomes[index] = (None, VerificationError(verification.message, retryable=verification.pending))
+                continue
+            payment = TokenPayment(
+                **payment_fields(request['token'], verification, request['amount_usdc']),
+                **request['customer']
+            )
+            new_payments[index] = payment
+
+    created = _create_payments(new_payments, outcomes)
+    publish_payments(created)
+    return outcomes
+
+
+def _create_payments(new_payments, outcomes):
+    """
+    INSERT verified payments (index -> unsaved TokenPayment) in bulk.
+
+    Falls back to one INSERT per payment when some were recorded meanwhile.
+    Webhooks of payments confirmed on creation go to the outbox in the same
+    transaction. Fills in their outcomes and returns the payments actually created.
+    """
+    from ..models import TokenPayment
+
+    if not new_payments:
+        return []
+    try:
+        with transaction.atomic():
+            TokenPayment.objects.bulk_create(list(new_payments.values()))
+            enqueue_payment_webhooks([payment for payment in new_payments.values() if payment.status == 'confirmed'])
+    except IntegrityError:
+        created = []
+        for index, payment in new_payments.items():
+            try:
+                with transaction.atomic():
+                    payment.save(force_insert=True)
+                    if payment.status == 'confirmed':
+                        enqueue_payment_webhooks([payment])
+            except IntegrityError:
+                outcomes[index] = (None, _already_processed(payment.transaction_hash))
+                continue
+            outcomes[index] = (payment, None)
+            created.append(payment)
+        return created
+    for index, payment in new_payments.items():
+        outcomes[index] = (payment, None)
+    return list(new_payments.values())
+
+
+def _existing_payment(request):
+    """
+    The already-recorded payment for the request's transaction, if any.
+
+    Prevents replay; the indexer may have recorded the transfer already, in
+    which case verification is a local lookup (claim_indexed_payment).
+    """
+    from ..models import TokenPayment
+
+    existing = TokenPayment.objects.filter(transaction_hash=request['tx_hash']).first()
+    if existing is not None:
+        if existing.source == 'indexer' and existing.claimed_at is None:
+            return claim_indexed_payment(existing, request)
+        raise VerificationError('Transaction already processed', payment=existing)
+    return None
+
+
+def _check(verification):
+    """Raise VerificationError unless the TransferVerification checked out"""
+    if verification.is_valid:
+        return
+    if not verification.pending:
+        logger.warning(f"Transaction verification failed: {verification.tx_hash} - {verification.message}")
+    raise VerificationError(verification.message, retryable=verification.pending)
+
+
+def _already_processed(tx_hash):
+    from ..models import TokenPayment
+    return VerificationError('Transaction already processed', payment=TokenPayment.objects.get(transaction_hash=tx_hash))
+
+
+def _insert_payment(fields):
+    """INSERT a verified payment, with its webhook in the outbox if it's already confirmed"""
+    from ..models import TokenPayment
+
+    try:
+        with transaction.atomic():
+            payment = TokenPayment.objects.create(**fields)
+            if payment.status == 'confirmed':
+                enqueue_payment_webhooks([payment])
+    except IntegrityError:
+        # Recorded meanwhile by another process (or the indexer) that didn't share our flight
+        raise _already_processed(fields['transaction_hash'])
+    return payment
+
+
+def _verify_payment(web3_service, request):
+    tx_hash = request['tx_hash']
+    token = request['token']
+
+    existing = _existing_payment(request)
+    if existing is not None:
+        return existing
+
+    # Receipt and head block in one batched RPC round trip
+    verification = web3_service.verify_transfer(
+        tx_hash=tx_hash,
+        expected_to_address=receiver_wallet(),
+        expected_amount_raw=token.to_raw(request['amount_usdc']),
+        expected_from_address=request['from_address'] or None,
+        token=token
+    )
+    _check(verification)
+
+    payment = _insert_payment({
+        **payment_fields(token, verification, request['amount_usdc']),
+        **request['customer'],
+    })
+    publish_payments([payment])
+    return payment
+
+
+async def _averify_payment(web3_service, request):
+    tx_hash = request['tx_hash']
+    token = request['token']
+
+    existing = await sync_to_async(_existing_payment)(request)
+    if existing is not None:
+        return existing
+
+    verification = await web3_service.verify_transfer(
+        tx_hash=tx_hash,
+        expected_to_address=receiver_wallet(),
+        expected_amount_raw=token.to_raw(request['amount_usdc']),
+        expected_from_address=request['from_address'] or None,
+        token=token
+    )
+    _check(verification)
+
+    payment = await sync_to_async(_insert_payment)({
+        **payment_fields(token, verification, request['amount_usdc']),
+        **request['customer'],
+    })
+    await sync_to_async(publish_payments)([payment])
+    return payment
@@ -0,0 +1,223 @@
+"""
+Token-bucket rate limiting for the API views.
+
+Buckets live in Redis (RATE_LIMIT_REDIS_URL, REDIS_URL by default) so every
+worker shares the same budget. Each check is one Lua script that refills
+and debits all of a request's buckets (client IP, wallet) atomically. When
+Redis isn't configured or can't be reached, an in-process bucket store is
+used instead.
+
+Usage:
+
+    @rate_limit('verify')
+    def verify_token_transaction(request): ...
+
+Limits per scope come from settings.RATE_LIMITS, e.g.
+{'verify': {'ip': '10/m', 'wallet': '5/m'}} - "N/s|m|h" means a burst of N
+refilled at N per second/minute/hour. Rejected requests get a 429 with
+Retry-After.
+"""
+import asyncio
+import functools
+import json
+import logging
+import math
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+_PERIODS = {'s': 1, 'm': 60, 'h': 3600}
+
+# KEYS: one bucket per limit. ARGV: now, cost, then capacity and refill rate (tokens/s) per key.
+# Debits every bucket only if all of them have enough tokens; returns {allowed, retry_after}.
+_TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local tokens = {}
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[1 + i * 2])
+    local rate = tonumber(ARGV[2 + i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local available = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    available = math.min(capacity, available + math.max(0, now - updated) * rate)
+    if available < cost then
+        retry_after = math.max(retry_after, (cost - available) / rate)
+    end
+    tokens[i] = available
+end
+local allowed = retry_after == 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[1 + i * 2])
+    local rate = tonumber(ARGV[2 + i * 2])
+    local remaining = tokens[i]
+    if allowed then
+        remaining = remaining - cost
+    end
+    redis.call('HSET', key, 'tokens', tostring(remaining), 'ts', tostring(now))
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return {allowed and 1 or 0, tostring(retry_after)}
+"""
+
+
+def parse_rate(rate):
+    """'10/m' -> (capacity 10, refill 10/60 tokens per second)"""
+    count, _, period = rate.partition('/')
+    count = int(count)
+    seconds = _PERIODS[period[-1]] * int(period[:-1] or 1)
+    return count, count / seconds
+
+
+class LocalBuckets:
+    """In-process token buckets (per worker), used when Redis is unavailable"""
+    max_keys = 10000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def hit(self, limits, cost=1, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            if len(self._buckets) > self.max_keys:
+                self._buckets.clear()  # Crude bound; only ever forgets old debts
+            state = []
+            retry_after = 0.0
+            for key, capacity, rate in limits:
+                available, updated = self._buckets.get(key, (capacity, now))
+                available = min(capacity, available + max(0.0, now - updated) * rate)
+                if available < cost:
+                    retry_after = max(retry_after, (cost - available) / rate)
+                state.append((key, available))
+            allowed = retry_after == 0
+            for key, available in state:
+                self._buckets[key] = (available - cost if allowed else available, now)
+        return allowed, retry_after
+
+
+class RateLimiter:
+    def __init__(self, redis_url=None):
+        self.local = LocalBuckets()
+        self._script = None
+        if redis_url:
+            import redis
+            client = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+            self._script = client.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    def hit(self, limits, cost=1):
+        """
+        Take `cost` tokens from every (key, capacity, refill_per_second) bucket, or none.
+
+        Returns (allowed, retry_after_seconds).
+        """
+        if not limits:
+            return True, 0.0
+        if self._script is not None:
+            import redis
+            args = [time.time(), cost]
+            for _, capacity, rate in limits:
+                args += [capacity, rate]
+            try:
+                allowed, retry_after = self._script(keys=[key for key, _, _ in limits], args=args)
+                return bool(int(allowed)), float(retry_after)
+            except redis.RedisError as e:
+                logger.warning(f"Rate limiter Redis unavailable, using per-process buckets: {e}")
+        return self.local.hit(limits, cost)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(getattr(settings, 'RATE_LIMIT_REDIS_URL', None))
+    return _limiter
+
+
+def client_ip(request):
+    """
+    The client's IP address.
+
+    Behind RATE_LIMIT_TRUSTED_PROXIES reverse proxies (Railway's edge is one),
+    it is the entry that many hops from the right of X-Forwarded-For; entries
+    further left are client-supplied and can be spoofed.
+    """
+    trusted = getattr(settings, 'RATE_LIMIT_TRUSTED_PROXIES', 0)
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    if trusted and forwarded:
+        hops = [hop.strip() for hop in forwarded.split(',') if hop.strip()]
+        if hops:
+            return hops[-min(trusted, len(hops))]
+    return request.META.get('REMOTE_ADDR', 'unknown')
+
+
+def _wallet(request):
+    """from_address in a JSON request body, lowercased ('' if absent)"""
+    if request.method != 'POST':
+        return ''
+    try:
+        data = json.loads(request.body or b'{}')
+    except (ValueError, UnicodeDecodeError):
+        return ''
+    if not isinstance(data, dict):
+        return ''
+    return str(data.get('from_address') or '').strip().lower()
+
+
+def request_limits(scope, request):
+    """The (key, capacity, refill_per_second) buckets a request draws from"""
+    rates = getattr(settings, 'RATE_LIMITS', {}).get(scope, {})
+    limits = []
+    for kind, value in (('ip', client_ip(request)), ('wallet', _wallet(request))):
+        if kind in rates and value:
+            capacity, refill = parse_rate(rates[kind])
+            limits.append((f'ratelimit:{scope}:{kind}:{value}', capacity, refill))
+    return limits
+
+
+def _too_many_requests(retry_after):
+    retry_after = max(1, math.ceil(retry_after))
+    response = JsonResponse({
+        'error': 'Rate limit exceeded. Please wait a moment.',
+        'retry_after': retry_after,
+    }, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def rate_limit(scope):
+    """View decorator (sync or async views) applying settings.RATE_LIMITS[scope]"""
+    def decorator(view):
+        def check(request):
+            if not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+                return None
+            allowed, retry_after = get_rate_limiter().hit(request_limits(scope, request))
+            return None if allowed else _too_many_requests(retry_after)
+
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                rejected = await sync_to_async(check, thread_sensitive=False)(request)
+                if rejected is not None:
+                    return rejected
+                return await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            rejected = check(request)
+            if rejected is not None:
+                return rejected
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,153 @@
+"""
+Reorg detection for recorded payments.
+
+Payments store the hash of the block they were mined in. On each new head the
+blocks of recent payments are fetched in one batched eth_getBlockByNumber
+sweep, and only payments whose block hash no longer matches the canonical
+chain are re-verified. Payments whose transaction was dropped from the chain
+stay pending without a block; their receipts are looked up in one batch on
+each head until they are mined again (or expire).
+"""
+import logging
+from django.conf import settings
+from django.utils import timezone
+from . import tx_cache
+from .payment_cache import invalidate_payments
+from .payment_events import publish_payments
+from .web3_service import RPCError, check_usdc_transfer, get_web3_service
+
+logger = logging.getLogger(__name__)
+
+
+def _hex(value):
+    return '0x' + bytes(value).hex()
+
+
+def find_reorged_payments(head, service=None, depth=None):
+    """Return payments in the last `depth` blocks whose stored block hash is no longer canonical"""
+    from ..models import TokenPayment
+    
+    service = service or get_web3_service()
+    depth = depth or getattr(settings, 'WEB3_REORG_DEPTH', 64)
+    payments = list(
+        TokenPayment.objects.filter(
+            chain_id=service.chain_id,
+            status__in=['pending', 'confirmed'],
+            block_number__gt=head - depth,
+        ).exclude(block_hash='')
+    )
+    if not payments:
+        return []
+    
+    block_numbers = sorted({payment.block_number for payment in payments})
+    blocks = service.batch_request([
+        ('eth_getBlockByNumber', [hex(number), False]) for number in block_numbers
+    ])
+    canonical = {
+        number: _hex(block.hash).lower()
+        for number, block in zip(block_numbers, blocks) if block is not None
+    }
+    # Blocks the node didn't return (e.g. a lagging backend) are checked on the next head
+    return [
+        payment for payment in payments
+        if payment.block_number in canonical and canonical[payment.block_number] != payment.block_hash.lower()
+    ]
+
+
+def find_remined_payments(service=None):
+    """
+    Pending payments a reorg dropped from their block whose transaction has
+    been mined again, as (payment, tx_data) pairs.
+    
+    Their receipts are looked up in one batched round trip; ones still not
+    mined are looked up again on the next head.
+    """
+    from ..models import TokenPayment
+    
+    service = service or get_web3_service()
+    dropped = list(TokenPayment.objects.filter(chain_id=service.chain_id, status='pending', block_number__isnull=True))
+    if not dropped:
+        return []
+    receipts = service.get_receipts([payment.transaction_hash for payment in dropped])
+    return [
+        (payment, receipts[payment.transaction_hash]) for payment in dropped
+        if receipts[payment.transaction_hash] is not None and not isinstance(receipts[payment.transaction_hash], RPCError)
+    ]
+
+
+def reverify_payment(payment, service=None, tx_data=None):
+    """
+    Re-check a payment whose block was reorged and update it in place.
+    
+    Pass `tx_data` (from get_receipts()) to use a receipt already fetched.
+    Returns the payment's new status. If the node can't be reached the
+    payment is left as it is, to be re-checked on a later head.
+    """
+    from ..models import TokenPayment
+    
+    service = service or get_web3_service()
+    if tx_data is None:
+        tx_cache.invalidate_transaction(payment.transaction_hash)
+        try:
+            tx_data = service.get_transaction(payment.transaction_hash)
+        except ConnectionError as e:
+            logger.warning(f"Skipping re-verification of {payment.transaction_hash} for now: {e}")
+            return payment.status
+    rows = TokenPayment.objects.filter(pk=payment.pk, block_hash=payment.block_hash)
+    
+    if tx_data is None:
+        # Dropped from the canonical chain: find_remined_payments() picks it up once it is
+        # mined again, and expiry handles it if it never is
+        rows.reopen(block_number=None, block_hash='')
+        logger.warning(f"Payment {payment.transaction_hash} was reorged out; back to pending")
+        return 'pending'
+    
+    from .chain_registry import get_registry
+    
+    token = get_registry().get_token(payment.chain_id, payment.token_contract)
+    is_valid, message, _ = check_usdc_transfer(
+        token, payment.transaction_hash, tx_data, payment.to_address,
+        expected_amount_raw=int(payment.amount_raw),
+        expected_from_address=payment.from_address,
+    )
+    receipt = tx_data['receipt']
+    fields = {
+        'block_number': receipt.blockNumber,
+        'block_hash': _hex(receipt.blockHash),
+    }
+    status = payment.status
+    if not is_valid:
+        status = 'failed'
+        rows.fail(**fields)
+        logger.error(f"Payment {payment.transaction_hash} failed re-verification after reorg: {message}")
+    elif payment.status == 'confirmed' and tx_data['confirmations'] < payment.required_confirmations:
+        # Still valid but no longer deep enough; the promoter confirms it again
+        status = 'pending'
+        rows.reopen(**fields)
+    else:
+        rows.update(updated_at=timezone.now(), **fields)
+    logger.warning(f"Payment {payment.transaction_hash} moved to block {receipt.blockNumber} after reorg")
+    return status
+
+
+def check_reorgs(head, service=None):
+    """
+    Re-verify dropped payments that were mined again, then detect and
+    re-verify reorged ones; returns the number re-verified.
+    """
+    service = service or get_web3_service()
+    try:
+        remined = find_remined_payments(service=service)
+    except ConnectionError as e:
+        logger.warning(f"Skipping the dropped-payment lookup at block {head}: {e}")
+        remined = []
+    checks = remined + [(payment, None) for payment in find_reorged_payments(head, service=service)]
+    for payment, tx_data in checks:
+        try:
+            reverify_payment(payment, service=service, tx_data=tx_data)
+        except Exception as e:
+            logger.error(f"Re-verification of {payment.transaction_hash} failed: {e}", exc_info=True)
+    if checks:
+        invalidate_payments([payment.transaction_hash for payment, _ in checks])
+        publish_payments([payment.pk for payment, _ in checks])
+    return len(checks)
@@ -0,0 +1,227 @@
+"""
+Pool of JSON-RPC endpoints with latency-aware routing and hedged reads.
+
+Each endpoint keeps its own keep-alive session plus a moving latency/error
+score. Requests go to the fastest healthy endpoint and fail over to the next
+one on transport errors. Read-only calls can optionally be hedged: if the
+first endpoint has not answered within its p95 latency, the same request is
+sent to a second endpoint and whichever answers first wins.
+
+Endpoints that turn out not to accept JSON-RPC batches (HTTP 4xx, or an
+answer that isn't one response per call) are remembered, and later batches
+skip them; BatchNotSupported tells the caller to send the calls one by one.
+"""
+import collections
+import json
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+from web3._utils.encoding import Web3JsonEncoder
+from web3.providers.base import JSONBaseProvider
+
+logger = logging.getLogger(__name__)
+
+# Methods that never change chain state and are safe to send twice
+READ_METHODS = {
+    'eth_blockNumber', 'eth_chainId', 'eth_getBlockByNumber', 'eth_getLogs',
+    'eth_getTransactionByHash', 'eth_getTransactionReceipt', 'eth_call', 'web3_clientVersion',
+}
+
+
+class BatchNotSupported(Exception):
+    """No endpoint accepts this JSON-RPC batch; send the calls individually"""
+
+
+class RPCEndpoint:
+    # Smoothing factor for the moving latency/error averages
+    ALPHA = 0.2
+    
+    def __init__(self, url, pool_size=20):
+        self.url = url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.latency = 0.0  # Moving average, seconds
+        self.error_rate = 0.0  # Moving average of failures, 0..1
+        self.last_failure = 0.0
+        self.supports_batch = True  # Until it rejects one
+        self._samples = collections.deque(maxlen=200)
+        self._lock = threading.Lock()
+    
+    def __repr__(self):
+        return f"<RPCEndpoint {self.url[:30]}... latency={self.latency * 1000:.0f}ms errors={self.error_rate:.2f}>"
+    
+    def record_success(self, latency):
+        with self._lock:
+            self._samples.append(latency)
+            self.latency = latency if self.latency == 0 else (1 - self.ALPHA) * self.latency + self.ALPHA * latency
+            self.error_rate = (1 - self.ALPHA) * self.error_rate
+    
+    def record_failure(self):
+        with self._lock:
+            self.error_rate = (1 - self.ALPHA) * self.error_rate + self.ALPHA
+            self.last_failure = time.monotonic()
+    
+    def is_healthy(self, cooldown):
+        return self.error_rate < 0.5 or time.monotonic() - self.last_failure > cooldown
+    
+    def p95(self):
+        """95th percentile of recent latencies, or None until enough samples exist"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < 20:
+            return None
+        return samples[int(0.95 * (len(samples) - 1))]
+
+
+class RPCPool:
+    def __init__(self, urls, timeout=10, pool_size=20, hedge=False, hedge_min_delay=0.05, cooldown=30, breaker=None):
+        if isinstance(urls, str):
+            urls = [urls]
+        self.endpoints = [RPCEndpoint(url, pool_size=pool_size) for url in urls]
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.cooldown = cooldown
+        self.breaker = breaker
+        self._executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(self.endpoints)), thread_name_prefix='rpc-hedge')
+    
+    def ranked_endpoints(self):
+        """Endpoints ordered healthiest/fastest first; each recent error costs roughly a timeout"""
+        return sorted(
+            self.endpoints,
+            key=lambda e: (not e.is_healthy(self.cooldown), e.latency + e.error_rate * self.timeout),
+        )
+    
+    def _post(self, endpoint, payload):
+        started = time.monotonic()
+        is_batch = isinstance(payload, list)
+        try:
+            response = endpoint.session.post(
+                endpoint.url,
+                data=json.dumps(payload, cls=Web3JsonEncoder),
+                headers={'Content-Type': 'application/json'},
+                timeout=self.timeout,
+            )
+            if is_batch and 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                self._reject_batches(endpoint, f"HTTP {response.status_code}")
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError):
+            endpoint.record_failure()
+            raise
+        if is_batch and not _is_batch_response(data, payload):
+            self._reject_batches(endpoint, str(data)[:200])
+        endpoint.record_success(time.monotonic() - started)
+        return data
+    
+    def _reject_batches(self, endpoint, answer):
+        endpoint.supports_batch = False
+        logger.warning(f"{endpoint!r} does not accept JSON-RPC batches ({answer}); sending its calls individually")
+        raise BatchNotSupported(f"{endpoint!r} answered a batch with {answer}")
+    
+    def post(self, payload, hedge=None):
+        """
+        Send a JSON-RPC request or batch and return the decoded JSON response.
+        
+        Transport failures fail over to the next endpoint; the last error is
+        raised if every endpoint fails. With a circuit breaker attached, calls
+        fail fast with CircuitOpenError while the whole pool is unhealthy.
+        
+        Batches (a list payload) only go to endpoints that accept them, and
+        raise BatchNotSupported when none does.
+        """
+        if self.breaker is None:
+            return self._post_any(payload, hedge)
+        # A rejected batch means the node answered, so it doesn't count against the breaker
+        result = self.breaker.call(self._post_or_rejection, payload, hedge)
+        if isinstance(result, BatchNotSupported):
+            raise result
+        return result
+    
+    def _post_or_rejection(self, payload, hedge):
+        try:
+            return self._post_any(payload, hedge)
+        except BatchNotSupported as e:
+            return e
+    
+    def _post_any(self, payload, hedge=None):
+        if hedge is None:
+            hedge = self.hedge and _is_read_only(payload)
+        endpoints = self.ranked_endpoints()
+        if isinstance(payload, list):
+            endpoints = [endpoint for endpoint in endpoints if endpoint.supports_batch]
+            if not endpoints:
+                raise BatchNotSupported("No RPC endpoint accepts batches")
+        if hedge and len(endpoints) > 1:
+            return self._post_hedged(endpoints, payload)
+        
+        last_error = None
+        for endpoint in endpoints:
+            try:
+                return self._post(endpoint, payload)
+            except (requests.RequestException, ValueError) as e:
+                logger.warning(f"RPC request to {endpoint!r} failed: {e}")
+                last_error = e
+            except BatchNotSupported as e:
+                last_error = e
+        if isinstance(last_error, BatchNotSupported):
+            raise last_error
+        raise ConnectionError(f"All RPC endpoints failed: {last_error}")
+    
+    def _post_hedged(self, endpoints, payload):
+        primary, backup = endpoints[0], endpoints[1]
+        # Hedge once the primary is slower than its p95 (or twice its average until enough samples exist)
+        delay = max(primary.p95() or 2 * primary.latency, self.hedge_min_delay)
+        pending = {self._executor.submit(self._post, primary, payload)}
+        done, _ = wait(pending, timeout=delay)
+        backup_submitted = not done
+        if backup_submitted:
+            pending.add(self._executor.submit(self._post, backup, payload))
+        
+        last_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except (requests.RequestException, ValueError, BatchNotSupported) as e:
+                    last_error = e
+            if not pending and not backup_submitted:
+                # Primary failed before the hedge fired; fall back to the backup once
+                backup_submitted = True
+                pending = {self._executor.submit(self._post, backup, payload)}
+        if isinstance(last_error, BatchNotSupported):
+            raise last_error
+        raise ConnectionError(f"All RPC endpoints failed: {last_error}")
+
+
+def _is_batch_response(data, payload):
+    """One response per call; a batch-wide Invalid Request error counts as a rejection"""
+    if not isinstance(data, list) or len(data) != len(payload):
+        return False
+    return not any(isinstance(item, dict) and (item.get('error') or {}).get('code') == -32600 for item in data)
+
+
+def _is_read_only(payload):
+    calls = payload if isinstance(payload, list) else [payload]
+    return all(call.get('method') in READ_METHODS for call in calls)
+
+
+class PooledHTTPProvider(JSONBaseProvider):
+    """web3 provider that sends every request through an RPCPool"""
+    
+    def __init__(self, pool):
+        self.pool = pool
+        super().__init__()
+    
+    def __str__(self):
+        return f"RPC pool of {len(self.pool.endpoints)} endpoint(s)"
+    
+    def make_request(self, method, params):
+        request_id = next(self.request_counter)
+        return self.pool.post({'jsonrpc': '2.0', 'method': method, 'params': params or [], 'id': request_id})
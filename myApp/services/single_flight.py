@@ -0,0 +1,192 @@
+"""
+Single-flight call coalescing.
+
+Concurrent calls for the same key run the underlying function once and
+share its outcome. Within a process, callers wait on the leader directly
+and get its return value (or exception). Across processes, a cache lock
+elects one leader per key; leaders publish their outcome under the flight
+id stored in the lock, and callers in other processes pick it up from there.
+
+Only return values and the exception types listed in `shared_errors` are
+passed between processes. For any other failure, each waiting process runs
+the function itself.
+"""
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    def __init__(self, name, lock_timeout=30, poll_interval=0.05, shared_errors=()):
+        self.name = name
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.shared_errors = tuple(shared_errors)
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+
+    def _lock_key(self, key):
+        return f'single-flight:{self.name}:{key}'
+
+    def _result_key(self, flight_id):
+        return f'single-flight:{self.name}:result:{flight_id}'
+
+    def do(self, key, fn):
+        """Run fn() unless a call for `key` is already in flight; either way return its outcome"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(self.lock_timeout):
+                return call.outcome()
+            logger.warning(f"Gave up waiting for {self.name} flight {key}; running it again")
+            return fn()
+
+        try:
+            call.result = self._run_shared(key, fn)
+        except Exception as e:
+            call.error = e
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.outcome()
+
+    async def ado(self, key, coro_fn):
+        """Async do(): await coro_fn() unless a call for `key` is already in flight"""
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+        future = self._async_calls.get(call_key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = self._async_calls[call_key] = loop.create_future()
+        try:
+            result = await self._arun_shared(key, coro_fn)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved so lone leaders don't log "never retrieved"
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._async_calls[call_key]
+
+    def _run_shared(self, key, fn):
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            flight_id = uuid.uuid4().hex
+            if cache.add(self._lock_key(key), flight_id, self.lock_timeout):
+                try:
+                    return self._lead(flight_id, fn)
+                finally:
+                    cache.delete(self._lock_key(key))
+
+            # Another process is leading: wait for it to publish its outcome
+            leader_id = cache.get(self._lock_key(key))
+            while leader_id is not None and time.monotonic() < deadline:
+                outcome = cache.get(self._result_key(leader_id), _MISSING)
+                if outcome is not _MISSING:
+                    return self._unpack(outcome, fn)
+                time.sleep(self.poll_interval)
+                if cache.get(self._lock_key(key)) != leader_id:
+                    # Released (or expired) just now; its outcome may have been published meanwhile
+                    outcome = cache.get(self._result_key(leader_id), _MISSING)
+                    if outcome is not _MISSING:
+                        return self._unpack(outcome, fn)
+                    break
+            if time.monotonic() >= deadline:
+                logger.warning(f"Gave up waiting for {self.name} flight {key}; running it here")
+                return fn()
+
+    async def _arun_shared(self, key, coro_fn):
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            flight_id = uuid.uuid4().hex
+            if await cache.aadd(self._lock_key(key), flight_id, self.lock_timeout):
+                try:
+                    return await self._alead(flight_id, coro_fn)
+                finally:
+                    await cache.adelete(self._lock_key(key))
+
+            leader_id = await cache.aget(self._lock_key(key))
+            while leader_id is not None and time.monotonic() < deadline:
+                outcome = await cache.aget(self._result_key(leader_id), _MISSING)
+                if outcome is not _MISSING:
+                    return await self._aunpack(outcome, coro_fn)
+                await asyncio.sleep(self.poll_interval)
+                if await cache.aget(self._lock_key(key)) != leader_id:
+                    outcome = await cache.aget(self._result_key(leader_id), _MISSING)
+                    if outcome is not _MISSING:
+                        return await self._aunpack(outcome, coro_fn)
+                    break
+            if time.monotonic() >= deadline:
+                logger.warning(f"Gave up waiting for {self.name} flight {key}; running it here")
+                return await coro_fn()
+
+    def _lead(self, flight_id, fn):
+        try:
+            result = fn()
+        except self.shared_errors as e:
+            cache.set(self._result_key(flight_id), ('error', e), self.lock_timeout)
+            raise
+        except Exception:
+            cache.set(self._result_key(flight_id), ('retry', None), self.lock_timeout)
+            raise
+        cache.set(self._result_key(flight_id), ('ok', result), self.lock_timeout)
+        return result
+
+    async def _alead(self, flight_id, coro_fn):
+        try:
+            result = await coro_fn()
+        except self.shared_errors as e:
+            await cache.aset(self._result_key(flight_id), ('error', e), self.lock_timeout)
+            raise
+        except Exception:
+            await cache.aset(self._result_key(flight_id), ('retry', None), self.lock_timeout)
+            raise
+        await cache.aset(self._result_key(flight_id), ('ok', result), self.lock_timeout)
+        return result
+
+    def _unpack(self, outcome, fn):
+        kind, value = outcome
+        if kind == 'ok':
+            return value
+        if kind == 'error':
+            raise value
+        return fn()
+
+    async def _aunpack(self, outcome, coro_fn):
+        kind, value = outcome
+        if kind == 'ok':
+            return value
+        if kind == 'error':
+            raise value
+        return await coro_fn()
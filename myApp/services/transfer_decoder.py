@@ -0,0 +1,57 @@
+"""
+Fast decoder for ERC-20 Transfer logs.
+
+Logs are filtered on the emitting contract and topic0 before any decoding, and
+matching logs are decoded straight from their topics and 32-byte data word
+instead of going through the contract ABI machinery.
+"""
+from web3 import Web3
+
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = bytes(Web3.keccak(text='Transfer(address,address,uint256)'))
+
+
+def _to_bytes(value):
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    return bytes.fromhex(value[2:] if value.startswith('0x') else value)
+
+
+def _get(log, field):
+    # Logs may be AttributeDicts from web3 or plain dicts from raw RPC/cache data
+    return log[field] if field in log else None
+
+
+class TransferDecoder:
+    def __init__(self, token_address):
+        self.token_address = token_address.lower()
+    
+    def decode_log(self, log):
+        """Return the decoded Transfer dict for a log, or None if it is not a token Transfer"""
+        address = _get(log, 'address')
+        if address is None or address.lower() != self.token_address:
+            return None
+        topics = _get(log, 'topics') or []
+        if len(topics) != 3 or _to_bytes(topics[0]) != TRANSFER_TOPIC:
+            return None
+        data = _to_bytes(_get(log, 'data') or b'')
+        if len(data) != 32:
+            return None
+        log_index = _get(log, 'logIndex')
+        if isinstance(log_index, str):
+            log_index = int(log_index, 16)
+        return {
+            'from': Web3.to_checksum_address(_to_bytes(topics[1])[-20:]),
+            'to': Web3.to_checksum_address(_to_bytes(topics[2])[-20:]),
+            'value': int.from_bytes(data, 'big'),
+            'log_index': log_index,
+        }
+    
+    def decode(self, logs):
+        """Decode every token Transfer in a list of receipt logs"""
+        events = []
+        for log in logs:
+            event = self.decode_log(log)
+            if event is not None:
+                events.append(event)
+        return events
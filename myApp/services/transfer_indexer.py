@@ -0,0 +1,146 @@
+"""
+Indexer for USDC Transfer events sent to the receiving wallet.
+
+Scans eth_getLogs in block ranges (filtered on the Transfer topic and the
+receiver as the `to` topic), upserts TokenPayment rows in bulk and keeps a
+block cursor in the database so it resumes where it stopped. Each run
+rescans WEB3_INDEXER_REORG_OVERLAP blocks behind the cursor, so transfers
+re-mined after a short reorg are picked up; rows that already exist are
+left alone, except that ones a reorg dropped from their block (pending, no
+block) get the block the transfer was re-mined in. Payments whose browser closed before calling verify-transaction
+are still recorded, and verification of indexed payments becomes a local DB
+lookup.
+"""
+import logging
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .payment_cache import invalidate_payments
+from .transfer_decoder import TRANSFER_TOPIC
+from .web3_service import get_web3_service
+
+logger = logging.getLogger(__name__)
+
+
+def _address_topic(address):
+    return '0x' + '0' * 24 + address.lower()[2:]
+
+
+class TransferIndexer:
+    def __init__(self, service=None, receiver_wallet=None, block_range=None, token=None):
+        self.service = service or get_web3_service()
+        self.token = token or self.service.token
+        self.receiver_wallet = receiver_wallet or getattr(
+            settings, 'RECEIVER_WALLET', '0x918e03d7c59d61b6505fed486082419941ffd77f'
+        )
+        self.block_range = block_range or getattr(settings, 'WEB3_INDEXER_BLOCK_RANGE', 2000)
+        self.cursor_name = f'xfer:{self.service.chain_id}:{self.token.address.lower()}:{self.receiver_wallet.lower()}'
+    
+    def get_logs(self, from_block, to_block):
+        """Token Transfer logs to the receiving wallet in [from_block, to_block]"""
+        return self.service.w3.eth.get_logs({
+            'fromBlock': from_block,
+            'toBlock': to_block,
+            'address': self.token.address,
+            'topics': ['0x' + TRANSFER_TOPIC.hex(), None, _address_topic(self.receiver_wallet)],
+        })
+    
+    def build_payments(self, logs, head):
+        """Unsaved TokenPayment rows for the given logs (first transfer per tx wins)"""
+        from ..models import TokenPayment
+        
+        required = getattr(settings, 'REQUIRED_CONFIRMATIONS', 2)
+        payments = {}
+        for log in logs:
+            event = self.token.decoder.decode_log(log)
+            if event is None:
+                continue
+            tx_hash = '0x' + bytes(log['transactionHash']).hex()
+            if tx_hash in payments:
+                continue
+            amount_token = self.token.from_raw(event['value'])
+            payments[tx_hash] = TokenPayment(
+                transaction_hash=tx_hash,
+                from_address=event['from'],
+                to_address=event['to'],
+                amount_raw=event['value'],
+                amount_token=amount_token,
+                amount_usd=amount_token.quantize(Decimal('0.01')),  # USDC is 1:1 with USD
+                token_contract=self.token.address,
+                chain_id=self.service.chain_id,
+                status='pending',
+                block_number=log['blockNumber'],
+                block_hash='0x' + bytes(log['blockHash']).hex(),
+                required_confirmations=required,
+                transfer_event_index=event['log_index'],
+                source='indexer',
+            )
+        return list(payments.values())
+    
+    def index_range(self, from_block, to_block, head):
+        """Index one block range; returns the number of transfers found"""
+        from ..models import TokenPayment
+        
+        logs = self.get_logs(from_block, to_block)
+        payments = self.build_payments(logs, head)
+        if payments:
+            # Rows the client already verified keep their customer details
+            TokenPayment.objects.bulk_create(payments, ignore_conflicts=True)
+            self.restore_dropped(payments)
+        return len(payments)
+    
+    def restore_dropped(self, payments):
+        """
+        Give existing rows that a reorg dropped from their block the block the
+        transfer was found in; the promoter then confirms them again.
+        """
+        from ..models import TokenPayment
+        
+        found = {payment.transaction_hash: payment for payment in payments}
+        dropped = TokenPayment.objects.filter(transaction_hash__in=found, status='pending', block_number__isnull=True)
+        restored = []
+        for tx_hash in dropped.values_list('transaction_hash', flat=True):
+            payment = found[tx_hash]
+            # Conditional, so a concurrent reorg check that got there first wins
+            if dropped.filter(transaction_hash=tx_hash).update(
+                block_number=payment.block_number, block_hash=payment.block_hash, updated_at=timezone.now(),
+            ):
+                restored.append(tx_hash)
+        if restored:
+            invalidate_payments(restored)
+            logger.info(f"Restored {len(restored)} payment(s) re-mined after a reorg")
+        return restored
+    
+    def run_once(self, start_block=None):
+        """
+        Index from the stored cursor up to the current head.
+        
+        Returns (blocks_scanned, transfers_found).
+        """
+        from ..models import ChainCursor
+        
+        head = self.service.get_head_block()
+        cursor = ChainCursor.objects.filter(name=self.cursor_name).first()
+        if start_block is None:
+            if cursor is not None:
+                overlap = getattr(settings, 'WEB3_INDEXER_REORG_OVERLAP', 10)
+                start_block = max(0, cursor.block_number + 1 - overlap)
+            else:
+                start_block = max(0, head - getattr(settings, 'WEB3_INDEXER_START_LOOKBACK', 43200))
+        
+        scanned = found = 0
+        from_block = start_block
+        while from_block <= head:
+            to_block = min(from_block + self.block_range - 1, head)
+            with transaction.atomic():
+                found += self.index_range(from_block, to_block, head)
+                ChainCursor.objects.update_or_create(
+                    name=self.cursor_name, defaults={'block_number': to_block}
+                )
+            scanned += to_block - from_block + 1
+            from_block = to_block + 1
+        
+        if found:
+            logger.info(f"Indexed {found} {self.token.symbol} transfer(s) to {self.receiver_wallet} in {scanned} block(s)")
+        return scanned, found
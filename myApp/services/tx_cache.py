@@ -0,0 +1,154 @@
+"""
+Cache for mined transaction receipts and verification verdicts.
+
+Receipts are stored in a compact JSON form (no logs bloom or unused fields).
+Entries for transactions that are not yet final expire after a short TTL;
+final entries are kept in the Django cache long-term and, when
+WEB3_TX_CACHE_DB is enabled, persisted to the CachedTransaction table.
+"""
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+
+logger = logging.getLogger(__name__)
+
+_RECEIPT_FIELDS = ('blockHash', 'blockNumber', 'effectiveGasPrice', 'gasUsed', 'status', 'transactionHash')
+_LOG_FIELDS = ('address', 'topics', 'data', 'logIndex', 'transactionIndex', 'transactionHash', 'blockHash', 'blockNumber')
+_TRANSACTION_FIELDS = ('hash', 'from', 'to', 'gasPrice', 'blockNumber')
+
+
+def _json_value(value):
+    if isinstance(value, (bytes, bytearray)):
+        return '0x' + bytes(value).hex()
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    return value
+
+
+def _compact(source, fields):
+    return {field: _json_value(source.get(field)) for field in fields if source.get(field) is not None}
+
+
+def compact_receipt(receipt):
+    """Reduce a web3 receipt to the JSON-safe fields verification needs"""
+    data = _compact(receipt, _RECEIPT_FIELDS)
+    data['logs'] = [_compact(log, _LOG_FIELDS) for log in receipt.get('logs', [])]
+    return data
+
+
+def compact_transaction(tx):
+    """Compact transaction fields; {} when only the receipt was fetched"""
+    return _compact(tx, _TRANSACTION_FIELDS) if tx else {}
+
+
+def finality_depth():
+    """Confirmations after which a receipt is treated as immutable"""
+    return getattr(settings, 'WEB3_FINALITY_CONFIRMATIONS', 10)
+
+
+def _db_enabled():
+    return getattr(settings, 'WEB3_TX_CACHE_DB', False)
+
+
+def _tx_key(tx_hash):
+    return f'web3:tx:{tx_hash.lower()}'
+
+
+def _verdict_field(token, to_address):
+    """Verdicts are token-specific: a tx with no Transfer of one token may still pay in another"""
+    return f'{token.chain_id}:{token.address.lower()}:{to_address.lower()}'
+
+
+def _verdict_key(token, tx_hash, to_address):
+    return f'web3:verdict:{tx_hash.lower()}:{_verdict_field(token, to_address)}'
+
+
+def get_cached_transaction(tx_hash):
+    """
+    Return {'transaction': ..., 'receipt': ..., 'final': bool} in compact JSON form, or None.
+    """
+    entry = cache.get(_tx_key(tx_hash))
+    if entry is not None or not _db_enabled():
+        return entry
+    
+    from ..models import CachedTransaction
+    try:
+        row = CachedTransaction.objects.filter(transaction_hash=tx_hash.lower()).first()
+    except DatabaseError as e:
+        logger.warning(f"Transaction cache DB lookup failed for {tx_hash}: {e}")
+        return None
+    if row is None:
+        return None
+    entry = {'transaction': row.transaction, 'receipt': row.receipt, 'final': True}
+    cache.set(_tx_key(tx_hash), entry, timeout=getattr(settings, 'WEB3_TX_CACHE_FINAL_TTL', 7 * 24 * 3600))
+    return entry
+
+
+def store_transaction(tx_hash, tx, receipt, is_final):
+    """Cache a fetched transaction/receipt pair; only final entries are kept long-term"""
+    entry = {
+        'transaction': compact_transaction(tx),
+        'receipt': compact_receipt(receipt),
+        'final': is_final,
+    }
+    if not is_final:
+        cache.set(_tx_key(tx_hash), entry, timeout=getattr(settings, 'WEB3_TX_CACHE_TTL', 30))
+        return entry
+    
+    cache.set(_tx_key(tx_hash), entry, timeout=getattr(settings, 'WEB3_TX_CACHE_FINAL_TTL', 7 * 24 * 3600))
+    if _db_enabled():
+        from ..models import CachedTransaction
+        try:
+            CachedTransaction.objects.get_or_create(
+                transaction_hash=tx_hash.lower(),
+                defaults={
+                    'block_number': receipt.get('blockNumber'),
+                    'transaction': entry['transaction'],
+                    'receipt': entry['receipt'],
+                },
+            )
+        except DatabaseError as e:
+            logger.warning(f"Could not persist transaction cache entry for {tx_hash}: {e}")
+    return entry
+
+
+def invalidate_transaction(tx_hash):
+    """Forget a cached receipt, e.g. after its block was reorged out"""
+    cache.delete(_tx_key(tx_hash))
+    if _db_enabled():
+        from ..models import CachedTransaction
+        CachedTransaction.objects.filter(transaction_hash=tx_hash.lower()).delete()
+
+
+def get_verdict(token, tx_hash, to_address):
+    """Return a cached final verification failure for this tx, token (a TokenConfig) and receiving wallet, or None"""
+    verdict = cache.get(_verdict_key(token, tx_hash, to_address))
+    if verdict is not None or not _db_enabled():
+        return verdict
+    
+    from ..models import CachedTransaction
+    try:
+        verdicts = CachedTransaction.objects.filter(
+            transaction_hash=tx_hash.lower()
+        ).values_list('verdicts', flat=True).first()
+    except DatabaseError:
+        return None
+    verdict = (verdicts or {}).get(_verdict_field(token, to_address))
+    if verdict is not None:
+        cache.set(_verdict_key(token, tx_hash, to_address), verdict, timeout=None)
+    return verdict
+
+
+def store_verdict(token, tx_hash, to_address, message):
+    """Remember a verification failure that can never change (tx is final)"""
+    cache.set(_verdict_key(token, tx_hash, to_address), message, timeout=None)
+    if _db_enabled():
+        from ..models import CachedTransaction
+        try:
+            row = CachedTransaction.objects.filter(transaction_hash=tx_hash.lower()).first()
+            if row is not None:
+                row.verdicts[_verdict_field(token, to_address)] = message
+                row.save(update_fields=['verdicts'])
+        except DatabaseError as e:
+            logger.warning(f"Could not persist verdict for {tx_hash}: {e}")
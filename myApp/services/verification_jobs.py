@@ -0,0 +1,184 @@
+"""
+Background verification jobs.
+
+In job mode the verify endpoint only validates the request, stores a
+VerificationJob and answers 202 with its id. A worker then runs the normal
+verification and, while the transaction isn't mined yet (or the RPC circuit
+is open), reschedules itself with exponential backoff. Clients poll the job
+status endpoint instead of re-posting, and re-posts for a transaction that
+already has an active job get that job back.
+
+Every active job holds a lease (locked_until) covering its next attempt.
+Thread-backend retries only live in in-process timers, so jobs stranded by
+a restart outlive their lease; submitting or polling picks them up again.
+
+Workers run on an in-process thread pool by default, or on Celery when
+WEB3_VERIFY_JOB_BACKEND is 'celery' (see myApp/tasks.py).
+"""
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .circuit_breaker import CircuitOpenError
+from .payment_verification import VerificationError, parse_verify_request, verify_payment
+from .web3_service import get_web3_service
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running', 'retrying')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'WEB3_VERIFY_JOB_WORKERS', 4),
+                    thread_name_prefix='verify-job',
+                )
+    return _executor
+
+
+def retry_delay(attempts):
+    """Seconds to wait after the given number of attempts: exponential with jitter, capped"""
+    base = getattr(settings, 'WEB3_VERIFY_JOB_BACKOFF', 2)
+    cap = getattr(settings, 'WEB3_VERIFY_JOB_MAX_BACKOFF', 30)
+    delay = min(base * 2 ** max(attempts - 1, 0), cap)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _lease_expiry(start=None):
+    """When a lease taken at `start` (default now) lapses"""
+    lease = getattr(settings, 'WEB3_VERIFY_JOB_LEASE', 120)
+    return (start or timezone.now()) + timedelta(seconds=lease)
+
+
+def submit_verification(data):
+    """
+    Queue verification of a verify request body.
+
+    Returns (job, created); an active job for the same transaction is
+    returned instead of queueing a duplicate.
+    """
+    from ..models import VerificationJob
+
+    resume_overdue_jobs()
+    tx_hash = data['transaction_hash']
+    job = VerificationJob.objects.filter(transaction_hash=tx_hash, status__in=ACTIVE_STATUSES).first()
+    if job is not None:
+        return job, False
+
+    job = VerificationJob.objects.create(transaction_hash=tx_hash, request_data=data, locked_until=_lease_expiry())
+    # Workers may run in another thread or process: only hand over committed rows
+    transaction.on_commit(lambda: enqueue_job(job.pk))
+    return job, True
+
+
+def resume_overdue_jobs(limit=100, **filters):
+    """
+    Re-enqueue active jobs whose lease has lapsed and return their ids.
+
+    Each job is taken with a conditional update on its old lease, so only one
+    process resumes it.
+    """
+    from ..models import VerificationJob
+
+    now = timezone.now()
+    overdue = (VerificationJob.objects
+               .filter(status__in=ACTIVE_STATUSES, **filters)
+               .filter(Q(locked_until__lt=now) | Q(locked_until__isnull=True))
+               .values_list('pk', 'locked_until')[:limit])
+    resumed = []
+    for job_id, locked_until in overdue:
+        taken = VerificationJob.objects.filter(
+            pk=job_id, status__in=ACTIVE_STATUSES, locked_until=locked_until,
+        ).update(locked_until=_lease_expiry(now))
+        if taken:
+            logger.warning(f"Resuming verification job {job_id}: its lease lapsed")
+            transaction.on_commit(lambda job_id=job_id: enqueue_job(job_id))
+            resumed.append(job_id)
+    return resumed
+
+
+def enqueue_job(job_id, delay=0):
+    """Run a job on the configured backend, after `delay` seconds"""
+    if getattr(settings, 'WEB3_VERIFY_JOB_BACKEND', 'thread') == 'celery':
+        from ..tasks import verify_payment_job
+        verify_payment_job.apply_async((str(job_id),), countdown=delay)
+        return
+
+    if delay:
+        timer = threading.Timer(delay, _get_executor().submit, (run_job, job_id))
+        timer.daemon = True
+        timer.start()
+    else:
+        _get_executor().submit(run_job, job_id)
+
+
+def run_job(job_id):
+    """Make one verification attempt for a job and reschedule it if the tx isn't mined yet"""
+    from ..models import VerificationJob
+
+    close_old_connections()
+    try:
+        job = VerificationJob.objects.filter(pk=job_id, status__in=ACTIVE_STATUSES).first()
+        if job is None:
+            return None
+        job.status = 'running'
+        job.attempts += 1
+        job.locked_until = _lease_expiry()
+        job.save(update_fields=['status', 'attempts', 'locked_until', 'updated_at'])
+
+        try:
+            request = parse_verify_request(job.request_data)
+            payment = verify_payment(get_web3_service(request['token'].chain_id), request)
+        except VerificationError as e:
+            if e.retryable:
+                return _retry_or_fail(job, e.message)
+            return _finish(job, 'failed', error=e.message, payment=e.payment)
+        except CircuitOpenError as e:
+            return _retry_or_fail(job, str(e), min_delay=e.retry_after)
+        except ConnectionError as e:
+            return _retry_or_fail(job, f'Blockchain connection error: {e}')
+        except ValueError as e:
+            return _finish(job, 'failed', error=str(e))
+        except Exception as e:
+            logger.error(f"Verification job {job.pk} crashed: {e}", exc_info=True)
+            return _finish(job, 'failed', error=f'Server error: {e}')
+        return _finish(job, 'succeeded', payment=payment)
+    finally:
+        close_old_connections()
+
+
+def _retry_or_fail(job, message, min_delay=0):
+    max_attempts = getattr(settings, 'WEB3_VERIFY_JOB_MAX_ATTEMPTS', 20)
+    if job.attempts >= max_attempts:
+        return _finish(job, 'failed', error=f'{message} after {job.attempts} attempts')
+
+    delay = max(retry_delay(job.attempts), min_delay)
+    job.status = 'retrying'
+    job.error = message
+    job.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    job.locked_until = _lease_expiry(job.next_attempt_at)
+    job.save(update_fields=['status', 'error', 'next_attempt_at', 'locked_until', 'updated_at'])
+    enqueue_job(job.pk, delay=delay)
+    return job
+
+
+def _finish(job, status, error='', payment=None):
+    job.status = status
+    job.error = error
+    job.payment = payment
+    job.next_attempt_at = None
+    job.locked_until = None
+    job.save(update_fields=['status', 'error', 'payment', 'next_attempt_at', 'locked_until', 'updated_at'])
+    return job
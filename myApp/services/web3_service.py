@@ -1,147 +1,522 @@
 from web3 import Web3
 from django.conf import settings
-from decimal import Decimal
 import logging
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
 from .erc20_abi import USDC_ABI
+from .circuit_breaker import CircuitBreaker
+from .rpc_pool import BatchNotSupported, PooledHTTPProvider, RPCPool
+from .chain_registry import TokenConfig, get_registry
+from .head_tracker import get_cached_head, publish_head, stop_head_trackers
+from . import tx_cache
 
 logger = logging.getLogger(__name__)
 
+def get_web3_service(chain_id=None):
+    """
+    Return the shared Web3Service for a chain (the default chain if None).
+    
+    Services live in the chain registry: each is created on first use and
+    reused afterwards, so requests share keep-alive HTTP sessions and
+    precompiled token decoders instead of rebuilding them (and paying a
+    connectivity round trip) on every call.
+    """
+    return get_registry().get_service(chain_id)
+
+
+# Hex quantity fields that web3 would normally convert to int
+_INT_FIELDS = {
+    'blockNumber', 'chainId', 'cumulativeGasUsed', 'effectiveGasPrice', 'gas', 'gasPrice',
+    'gasUsed', 'logIndex', 'maxFeePerGas', 'maxPriorityFeePerGas', 'nonce', 'status',
+    'transactionIndex', 'type', 'v', 'value', 'number', 'timestamp', 'baseFeePerGas',
+}
+_BYTES_FIELDS = {'blockHash', 'hash', 'transactionHash', 'data', 'input', 'r', 's', 'parentHash'}
+
+
+def _format_rpc_result(value):
+    """Convert a raw JSON-RPC result into the AttributeDict shape web3 returns"""
+    if isinstance(value, list):
+        return [_format_rpc_result(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    formatted = {}
+    for key, item in value.items():
+        if item is None:
+            formatted[key] = None
+        elif key in _INT_FIELDS and isinstance(item, str):
+            formatted[key] = int(item, 16)
+        elif key in _BYTES_FIELDS and isinstance(item, str):
+            formatted[key] = HexBytes(item)
+        elif key == 'topics':
+            formatted[key] = [HexBytes(topic) for topic in item]
+        elif key in ('address', 'from', 'to', 'contractAddress') and isinstance(item, str):
+            formatted[key] = Web3.to_checksum_address(item)
+        else:
+            formatted[key] = _format_rpc_result(item)
+    return AttributeDict(formatted)
+
+
+class RPCError(ValueError):
+    """
+    A JSON-RPC error object returned by the node (e.g. -32602 invalid params).
+    
+    Unlike ConnectionError the node did answer, so retrying won't help.
+    """
+    def __init__(self, error):
+        super().__init__(f"RPC error: {error}")
+        self.error = error
+
+
+def reset_web3_service():
+    """Drop the shared services so the next call to get_web3_service() rebuilds them"""
+    stop_head_trackers()
+    get_registry().reset()
+
+
 class Web3Service:
-    def __init__(self):
-        rpc_url = getattr(settings, 'BASE_RPC_URL', None)
-        if not rpc_url or rpc_url.strip() == "":
+    def __init__(self, rpc_urls=None, chain_id=None, token=None):
+        if rpc_urls is None:
+            rpc_urls = getattr(settings, 'BASE_RPC_URLS', None) or getattr(settings, 'BASE_RPC_URL', None)
+        if isinstance(rpc_urls, str):
+            rpc_urls = [url.strip() for url in rpc_urls.split(',')]
+        rpc_urls = [url for url in (rpc_urls or []) if url and url.strip()]
+        if not rpc_urls:
             raise ValueError(
                 "BASE_RPC_URL must be set in settings. "
                 "Please add BASE_RPC_URL to your .env file. "
                 "Format: BASE_RPC_URL=https://base-mainnet.g.alchemy.com/v2/YOUR_API_KEY"
             )
+        self.rpc_url = rpc_urls[0]
+        self.chain_id = chain_id or getattr(settings, 'WEB3_DEFAULT_CHAIN_ID', 8453)
         
-        try:
-            self.w3 = Web3(Web3.HTTPProvider(rpc_url))
-            if not self.w3.is_connected():
-                raise ConnectionError(
-                    f"Failed to connect to Base network using RPC URL. "
-                    f"Please check your BASE_RPC_URL in .env file. "
-                    f"URL starts with: {rpc_url[:30]}..."
-                )
-        except Exception as e:
-            raise ConnectionError(
-                f"Error connecting to Base network: {str(e)}. "
-                f"Please verify your BASE_RPC_URL is correct."
-            )
-        
-        # Initialize USDC contract
-        usdc_address = getattr(settings, 'USDC_CONTRACT_ADDRESS', '0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913')
-        self.usdc_contract = self.w3.eth.contract(
-            address=Web3.to_checksum_address(usdc_address),
-            abi=USDC_ABI
+        # Keep-alive sessions per endpoint, routed to the fastest healthy provider
+        self.pool = RPCPool(
+            rpc_urls,
+            timeout=getattr(settings, 'WEB3_RPC_TIMEOUT', 10),
+            pool_size=getattr(settings, 'WEB3_HTTP_POOL_SIZE', 20),
+            hedge=getattr(settings, 'WEB3_RPC_HEDGE', False),
+            hedge_min_delay=getattr(settings, 'WEB3_RPC_HEDGE_MIN_DELAY', 0.05),
+            breaker=CircuitBreaker(
+                f'web3-rpc:{self.chain_id}',
+                failure_threshold=getattr(settings, 'WEB3_CIRCUIT_FAILURE_THRESHOLD', 5),
+                window=getattr(settings, 'WEB3_CIRCUIT_WINDOW', 30),
+                cooldown=getattr(settings, 'WEB3_CIRCUIT_COOLDOWN', 30),
+                slow_call_threshold=getattr(settings, 'WEB3_CIRCUIT_SLOW_CALL', 5),
+            ),
         )
+        self.w3 = Web3(PooledHTTPProvider(self.pool))
+        
+        # JSON-RPC batching, with a thread-pool fan-out for providers that reject batches
+        self.batching_enabled = getattr(settings, 'WEB3_RPC_BATCHING', True)
+        self._batch_ids = itertools.count(1)
+        self._fanout_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='web3-rpc')
+        
+        # Token contract and Transfer decoder (USDC from settings unless given)
+        if token is None:
+            token = TokenConfig(
+                self.chain_id,
+                getattr(settings, 'USDC_CONTRACT_ADDRESS', '0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913'),
+                decimals=getattr(settings, 'USDC_DECIMALS', 6),
+            )
+        self.token = token
+        self.usdc_contract = self.w3.eth.contract(address=token.address, abi=USDC_ABI)
+        self.transfer_decoder = token.decoder
     
     def usdc_to_raw(self, usdc_amount):
-        """Convert USDC amount to raw units (with 6 decimals)"""
-        decimals = getattr(settings, 'USDC_DECIMALS', 6)
-        return int(Decimal(str(usdc_amount)) * Decimal(10 ** decimals))
+        """Convert USDC amount to raw units (with the token's decimals, 6 for USDC)"""
+        return self.token.to_raw(usdc_amount)
     
     def raw_to_usdc(self, raw_amount):
         """Convert raw units to USDC amount"""
-        decimals = getattr(settings, 'USDC_DECIMALS', 6)
-        return Decimal(str(raw_amount)) / Decimal(10 ** decimals)
+        return self.token.from_raw(raw_amount)
     
-    def get_transaction(self, tx_hash):
-        """Get transaction details from blockchain"""
+    def batch_request(self, calls, return_errors=False):
+        """
+        Send several JSON-RPC calls and return their formatted results in order.
+        
+        Args:
+            calls: list of (method, params) tuples
+            return_errors: put the RPCError of a call the node rejects in its
+                place in the results instead of raising it for the whole batch
+        
+        The calls go out as one JSON-RPC batch over the shared session. If no
+        endpoint accepts batches (the pool remembers which ones rejected
+        them), they are fanned out concurrently instead.
+        """
+        if self.batching_enabled:
+            try:
+                return self._send_batch(calls, return_errors)
+            except BatchNotSupported as e:
+                logger.debug(f"Sending {len(calls)} RPC call(s) individually: {e}")
+        return self._send_concurrent(calls, return_errors)
+    
+    def _send_batch(self, calls, return_errors=False):
+        requests_by_id = {}
+        payload = []
+        for method, params in calls:
+            request_id = next(self._batch_ids)
+            requests_by_id[request_id] = len(payload)
+            payload.append({'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params})
+        
+        data = self.pool.post(payload)
+        results = [None] * len(payload)
+        for item in data:
+            if 'error' in item:
+                if not return_errors:
+                    raise RPCError(item['error'])
+                results[requests_by_id[item['id']]] = RPCError(item['error'])
+            else:
+                results[requests_by_id[item['id']]] = _format_rpc_result(item.get('result'))
+        return results
+    
+    def _send_concurrent(self, calls, return_errors=False):
+        def send(call):
+            method, params = call
+            response = self.w3.provider.make_request(method, params)
+            if 'error' in response:
+                if not return_errors:
+                    raise RPCError(response['error'])
+                return RPCError(response['error'])
+            return _format_rpc_result(response.get('result'))
+        return list(self._fanout_pool.map(send, calls))
+    
+    def get_transaction(self, tx_hash, include_transaction=True):
+        """
+        Get transaction details from blockchain.
+        
+        Cached receipts are served without touching the node (only the head
+        block is needed). Otherwise the transaction, its receipt and the current
+        head block are fetched in a single batched round trip.
+        
+        Returns None only when the node doesn't know the transaction. Transport
+        failures raise ConnectionError (CircuitOpenError while the circuit is
+        open); error objects the node answers with raise RPCError.
+        
+        With include_transaction=False only the receipt and head block are
+        fetched; the receipt's effectiveGasPrice covers the gas data, so the
+        transaction itself is only requested from nodes that don't report it.
+        """
         try:
-            tx = self.w3.eth.get_transaction(tx_hash)
-            receipt = self.w3.eth.get_transaction_receipt(tx_hash)
-            return {
-                'transaction': tx,
-                'receipt': receipt,
-                'status': receipt.status,  # 1 = success, 0 = failed
-                'block_number': receipt.blockNumber,
-                'gas_used': receipt.gasUsed,
-                'logs': receipt.logs,
-            }
+            cached = tx_cache.get_cached_transaction(tx_hash)
+            if cached is not None and (cached['transaction'] or not include_transaction):
+                return self._build_tx_data(
+                    _format_rpc_result(cached['transaction']) or None,
+                    _format_rpc_result(cached['receipt']),
+                    self.get_head_block(),
+                )
+            
+            if include_transaction:
+                tx, receipt, current_block = self.batch_request([
+                    ('eth_getTransactionByHash', [tx_hash]),
+                    ('eth_getTransactionReceipt', [tx_hash]),
+                    ('eth_blockNumber', []),
+                ])
+                if tx is None:
+                    return None
+            else:
+                receipt, current_block = self.batch_request([
+                    ('eth_getTransactionReceipt', [tx_hash]),
+                    ('eth_blockNumber', []),
+                ])
+                tx = None
+                if receipt is not None and receipt.get('effectiveGasPrice') is None:
+                    # Pre-London style receipt: the gas price is only on the transaction
+                    tx = self.batch_request([('eth_getTransactionByHash', [tx_hash])])[0]
+            if receipt is None:
+                return None
+            current_block = int(current_block, 16)
+            publish_head(current_block, self.chain_id)
+            tx_data = self._build_tx_data(tx, receipt, current_block)
+            tx_cache.store_transaction(
+                tx_hash, tx, receipt,
+                is_final=tx_data['confirmations'] >= tx_cache.finality_depth(),
+            )
+            return tx_data
+        except (ConnectionError, RPCError):
+            # Transport failures and open circuits: callers answer "try again", not "not found";
+            # the node rejecting the call isn't an outage and is reported as such
+            raise
         except Exception as e:
             logger.error(f"Error fetching transaction {tx_hash}: {e}")
-            return None
+            raise ConnectionError(f"Error fetching transaction {tx_hash}: {e}") from e
+    
+    def get_receipts(self, tx_hashes):
+        """
+        Receipt data for many transactions, as get_transaction(include_transaction=False).
+        
+        Cached receipts are reused; every other receipt and the head block are
+        fetched in one batched round trip. Returns {tx_hash: tx_data or None},
+        or the RPCError for a hash whose lookup the node rejected, so one bad
+        call doesn't fail the others.
+        """
+        results = {}
+        missing = []
+        for tx_hash in tx_hashes:
+            cached = tx_cache.get_cached_transaction(tx_hash)
+            if cached is not None:
+                results[tx_hash] = (_format_rpc_result(cached['transaction']) or None, _format_rpc_result(cached['receipt']))
+            else:
+                missing.append(tx_hash)
+        
+        if missing:
+            *receipts, current_block = self.batch_request(
+                [('eth_getTransactionReceipt', [tx_hash]) for tx_hash in missing] + [('eth_blockNumber', [])],
+                return_errors=True,
+            )
+            if isinstance(current_block, RPCError):
+                raise current_block
+            current_block = int(current_block, 16)
+            publish_head(current_block, self.chain_id)
+            # Pre-London style receipts carry no effectiveGasPrice: fetch those transactions in one more batch
+            legacy = [tx_hash for tx_hash, receipt in zip(missing, receipts)
+                      if receipt is not None and not isinstance(receipt, RPCError)
+                      and receipt.get('effectiveGasPrice') is None]
+            txs = dict(zip(legacy, self.batch_request([('eth_getTransactionByHash', [h]) for h in legacy], return_errors=True))) if legacy else {}
+            for tx_hash, receipt in zip(missing, receipts):
+                if isinstance(receipt, RPCError):
+                    logger.warning(f"Node rejected lookup of {tx_hash}: {receipt}")
+                    results[tx_hash] = receipt
+                    continue
+                if receipt is None:
+                    continue
+                tx = txs.get(tx_hash)
+                if isinstance(tx, RPCError):
+                    tx = None  # Only needed for the gas price
+                tx_cache.store_transaction(
+                    tx_hash, tx, receipt,
+                    is_final=current_block - receipt.blockNumber >= tx_cache.finality_depth(),
+                )
+                results[tx_hash] = (tx, receipt)
+        else:
+            current_block = self.get_head_block()
+        
+        tx_data = {}
+        for tx_hash in tx_hashes:
+            found = results.get(tx_hash)
+            tx_data[tx_hash] = self._build_tx_data(*found, current_block) if isinstance(found, tuple) else found
+        return tx_data
+    
+    def _build_tx_data(self, tx, receipt, current_block):
+        return {
+            'transaction': tx,
+            'receipt': receipt,
+            'status': receipt.status,  # 1 = success, 0 = failed
+            'block_number': receipt.blockNumber,
+            'gas_used': receipt.gasUsed,
+            'logs': receipt.logs,
+            'current_block': current_block,
+            'confirmations': max(0, current_block - receipt.blockNumber),
+        }
     
     def get_current_block(self):
         """Get current block number"""
         return self.w3.eth.block_number
     
+    def get_head_block(self):
+        """Get the head block published by the head tracker, querying the node only if it is stale"""
+        head = get_cached_head(self.chain_id)
+        if head is None:
+            head = self.get_current_block()
+            publish_head(head, self.chain_id)
+        return head
+    
     def get_confirmations(self, block_number):
         """Get number of confirmations for a block"""
-        current_block = self.get_current_block()
+        current_block = self.get_head_block()
         if block_number:
             return max(0, current_block - block_number)
         return 0
     
     def parse_transfer_events(self, receipt_logs):
-        """Parse Transfer events from transaction logs"""
-        transfer_events = []
-        
-        for log in receipt_logs:
-            try:
-                # Try to decode as Transfer event
-                event = self.usdc_contract.events.Transfer().process_log(log)
-                transfer_events.append({
-                    'from': event.args['from'],
-                    'to': event.args['to'],
-                    'value': event.args['value'],
-                    'log_index': log.logIndex,
-                })
-            except Exception:
-                # Not a Transfer event, skip
-                continue
-        
-        return transfer_events
-    
-    def verify_usdc_transfer(self, tx_hash, expected_to_address, expected_amount_raw=None, expected_from_address=None):
+        """Parse USDC Transfer events from transaction logs"""
+        return self.transfer_decoder.decode(receipt_logs)
+    
+    def verify_transfer(self, tx_hash, expected_to_address, expected_amount_raw=None, expected_from_address=None, token=None):
         """
-        Verify USDC Transfer event matches expected parameters.
+        Verify a token transfer in one pass.
         
-        Returns: (is_valid, message, transfer_event)
+        Fetches the receipt and head block once (no transaction fetch when the
+        receipt carries effectiveGasPrice), checks the Transfer event and
+        returns a TransferVerification holding everything needed to record the
+        payment. `token` (a TokenConfig) defaults to the chain's default token.
         """
-        tx_data = self.get_transaction(tx_hash)
-        if not tx_data:
-            return False, "Transaction not found", None
-        
-        receipt = tx_data['receipt']
-        
-        # Check transaction status
-        if receipt.status != 1:
-            return False, "Transaction failed", None
+        token = token or self.token
+        # Final negative verdicts never change, so skip the chain entirely
+        verdict = tx_cache.get_verdict(token, tx_hash, expected_to_address)
+        if verdict is not None:
+            return TransferVerification(tx_hash, False, verdict)
         
-        # Parse Transfer events
-        transfer_events = self.parse_transfer_events(receipt.logs)
-        
-        if not transfer_events:
-            return False, "No Transfer events found in transaction", None
+        try:
+            tx_data = self.get_transaction(tx_hash, include_transaction=False)
+        except RPCError as e:
+            # The node rejected the lookup itself; asking again won't find it
+            logger.warning(f"Node rejected lookup of {tx_hash}: {e}")
+            return TransferVerification(tx_hash, False, "Transaction not found")
+        if not tx_data:
+            return TransferVerification(tx_hash, False, "Transaction not found", pending=True)
         
-        # Find Transfer event to our receiving wallet
-        target_transfer = None
-        for event in transfer_events:
-            if event['to'].lower() == expected_to_address.lower():
-                target_transfer = event
-                break
+        is_valid, message, transfer_event = check_usdc_transfer(
+            token, tx_hash, tx_data, expected_to_address,
+            expected_amount_raw=expected_amount_raw,
+            expected_from_address=expected_from_address,
+        )
+        return TransferVerification(tx_hash, is_valid, message, transfer_event, tx_data)
+    
+    def verify_transfers(self, checks):
+        """
+        verify_transfer() for many transactions with a single batched RPC request.
         
-        if not target_transfer:
-            return False, f"No Transfer event found to receiving wallet {expected_to_address}", None
+        `checks` is a list of dicts with verify_transfer()'s keyword arguments;
+        returns TransferVerifications in the same order.
+        """
+        verdicts = [
+            tx_cache.get_verdict(check.get('token') or self.token, check['tx_hash'], check['expected_to_address'])
+            for check in checks
+        ]
+        tx_data = self.get_receipts([
+            check['tx_hash'] for check, verdict in zip(checks, verdicts) if verdict is None
+        ])
         
-        # Verify recipient
-        if target_transfer['to'].lower() != expected_to_address.lower():
-            return False, f"Recipient mismatch: {target_transfer['to']} != {expected_to_address}", None
+        results = []
+        for check, verdict in zip(checks, verdicts):
+            tx_hash = check['tx_hash']
+            if verdict is not None:
+                results.append(TransferVerification(tx_hash, False, verdict))
+            elif isinstance(tx_data[tx_hash], RPCError):
+                results.append(TransferVerification(tx_hash, False, "Transaction not found"))
+            elif tx_data[tx_hash] is None:
+                results.append(TransferVerification(tx_hash, False, "Transaction not found", pending=True))
+            else:
+                is_valid, message, transfer_event = check_usdc_transfer(
+                    check.get('token') or self.token, tx_hash, tx_data[tx_hash], check['expected_to_address'],
+                    expected_amount_raw=check.get('expected_amount_raw'),
+                    expected_from_address=check.get('expected_from_address'),
+                )
+                results.append(TransferVerification(tx_hash, is_valid, message, transfer_event, tx_data[tx_hash]))
+        return results
+    
+    def verify_usdc_transfer(self, tx_hash, expected_to_address, expected_amount_raw=None, expected_from_address=None, tx_data=None, token=None):
+        """
+        Verify USDC Transfer event matches expected parameters.
         
-        # Verify amount if provided
-        if expected_amount_raw is not None:
-            # Allow small tolerance for rounding (1 unit = 0.000001 USDC)
-            tolerance = 1
-            if abs(target_transfer['value'] - expected_amount_raw) > tolerance:
-                return False, f"Amount mismatch: {target_transfer['value']} != {expected_amount_raw}", None
+        Pass `tx_data` from get_transaction() to reuse an earlier fetch, and
+        `token` (a TokenConfig) to check a token other than the chain's default.
         
-        # Verify from address if provided
-        if expected_from_address is not None:
-            if target_transfer['from'].lower() != expected_from_address.lower():
-                return False, f"Sender mismatch: {target_transfer['from']} != {expected_from_address}", None
+        Returns: (is_valid, message, transfer_event)
+        """
+        if tx_data is None:
+            result = self.verify_transfer(tx_hash, expected_to_address, expected_amount_raw, expected_from_address, token)
+            return result.is_valid, result.message, result.transfer
         
-        return True, "Transfer verified", target_transfer
+        token = token or self.token
+        verdict = tx_cache.get_verdict(token, tx_hash, expected_to_address)
+        if verdict is not None:
+            return False, verdict, None
+        return check_usdc_transfer(
+            token, tx_hash, tx_data, expected_to_address,
+            expected_amount_raw=expected_amount_raw,
+            expected_from_address=expected_from_address,
+        )
+
+
+class TransferVerification:
+    """
+    Outcome of one verification pass.
+    
+    Holds the receipt, the matched Transfer event, confirmations and gas data
+    from a single fetch, so recording a payment never goes back to the node.
+    `pending` is True when the transaction wasn't found (it may not be mined yet).
+    """
+    def __init__(self, tx_hash, is_valid, message, transfer=None, tx_data=None, pending=False):
+        self.tx_hash = tx_hash
+        self.is_valid = is_valid
+        self.message = message
+        self.transfer = transfer
+        self.pending = pending
+        self.receipt = tx_data['receipt'] if tx_data else None
+        self.transaction = tx_data.get('transaction') if tx_data else None
+        self.current_block = tx_data['current_block'] if tx_data else None
+        self.confirmations = tx_data['confirmations'] if tx_data else 0
+    
+    def __repr__(self):
+        return f"<TransferVerification {self.tx_hash[:10]}... valid={self.is_valid} {self.message!r}>"
+    
+    @property
+    def block_number(self):
+        return self.receipt.blockNumber if self.receipt else None
+    
+    @property
+    def block_hash(self):
+        return '0x' + bytes(self.receipt.blockHash).hex() if self.receipt else ''
+    
+    @property
+    def gas_used(self):
+        return self.receipt.gasUsed if self.receipt else None
+    
+    @property
+    def gas_price(self):
+        """Price actually paid per gas: the receipt's effectiveGasPrice, else the transaction's gasPrice"""
+        if self.receipt is not None and self.receipt.get('effectiveGasPrice') is not None:
+            return self.receipt.effectiveGasPrice
+        if self.transaction:
+            return self.transaction.get('gasPrice')
+        return None
+
+
+def check_usdc_transfer(token, tx_hash, tx_data, expected_to_address, expected_amount_raw=None, expected_from_address=None):
+    """
+    Check fetched transaction data for a USDC Transfer matching the expected parameters.
+    
+    `token` is the TokenConfig whose Transfer events count. Shared by the sync
+    and async services; final failures are cached as verdicts for that token.
+    
+    Returns: (is_valid, message, transfer_event)
+    """
+    receipt = tx_data['receipt']
+    is_final = tx_data['confirmations'] >= tx_cache.finality_depth()
+    
+    def final_failure(message):
+        if is_final:
+            tx_cache.store_verdict(token, tx_hash, expected_to_address, message)
+        return False, message, None
+    
+    # Check transaction status
+    if receipt.status != 1:
+        return final_failure("Transaction failed")
+    
+    # Parse Transfer events
+    transfer_events = token.decoder.decode(receipt.logs)
+    
+    if not transfer_events:
+        return final_failure("No Transfer events found in transaction")
+    
+    # Find Transfer event to our receiving wallet
+    target_transfer = None
+    for event in transfer_events:
+        if event['to'].lower() == expected_to_address.lower():
+            target_transfer = event
+            break
+    
+    if not target_transfer:
+        return final_failure(f"No Transfer event found to receiving wallet {expected_to_address}")
+    
+    # Verify recipient
+    if target_transfer['to'].lower() != expected_to_address.lower():
+        return False, f"Recipient mismatch: {target_transfer['to']} != {expected_to_address}", None
+    
+    # Verify amount if provided
+    if expected_amount_raw is not None:
+        # Allow small tolerance for rounding (1 unit = 0.000001 USDC)
+        tolerance = 1
+        if abs(target_transfer['value'] - expected_amount_raw) > tolerance:
+            return False, f"Amount mismatch: {target_transfer['value']} != {expected_amount_raw}", None
+    
+    # Verify from address if provided
+    if expected_from_address is not None:
+        if target_transfer['from'].lower() != expected_from_address.lower():
+            return False, f"Sender mismatch: {target_transfer['from']} != {expected_from_address}", None
+    
+    return True, "Transfer verified", target_transfer
 
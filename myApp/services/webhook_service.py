@@ -1,103 +1,416 @@
 """
-Webhook service for sending payment notifications
+Webhook service for sending payment notifications.
+
+Webhooks go through an outbox. Whatever confirms a payment calls
+enqueue_payment_webhooks() inside the transaction that changes its status,
+which writes a WebhookDelivery row. A dispatcher then POSTs due deliveries
+and retries failures with exponential backoff and jitter. After
+PAYMENT_WEBHOOK_MAX_ATTEMPTS a delivery is dead-lettered, and
+`manage.py replay_webhooks` requeues it. Request handlers never make webhook
+HTTP calls, and a crash can't lose a notification.
+
+With PAYMENT_WEBHOOK_DISPATCHER = 'thread' (the default) each serving
+process starts a dispatcher thread when myProject/wsgi.py or asgi.py loads
+(so a backlog left by earlier processes drains without waiting for a new
+enqueue), woken after commits that enqueue. With 'worker' only `manage.py dispatch_webhooks` delivers. Deliveries are claimed with a
+conditional UPDATE, so several dispatchers can run at once. A delivery
+whose sender died is picked up again once its lease expires.
+
+Payments the transfer indexer recorded before the customer's browser
+verified them have no customer details yet. Their deliveries are held until
+the client claims the payment, or for PAYMENT_WEBHOOK_CLAIM_GRACE seconds,
+and customer fields are read from the payment when a delivery is sent.
+
+Each claimed batch is sent on a shared thread pool through one keep-alive
+session, so repeat deliveries skip DNS, TCP and TLS setup. At most
+PAYMENT_WEBHOOK_CONCURRENCY_PER_HOST requests are in flight per destination
+(see bench_webhook_dispatch.py for the throughput this buys).
 """
 import requests
 import logging
+import math
+import queue
+import random
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
 from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
 from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
+CONFIRMED_EVENT = 'payment.confirmed'
+# Read from the payment at send time; the rest of a payload describes the event
+CLIENT_FIELDS = (
+    'payment_type', 'amount_usd', 'customer_name', 'first_name', 'last_name', 'email',
+    'mobile', 'company_name', 'notes', 'org',
+)
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+_session = None
+_executor = None
+
+
+def build_payload(payment):
+    """The webhook body for a payment (webhook_sent_at is filled in per attempt)"""
+    customer_name = f"{payment.first_name} {payment.last_name}".strip()
+    if not customer_name:
+        customer_name = "N/A"
+
+    return {
+        # Payment Details
+        'transaction_hash': payment.transaction_hash,
+        'payment_id': payment.id,
+        'payment_type': payment.payment_type,
+        'status': payment.status,
+        'amount_usdc': str(payment.amount_token),
+        'amount_usd': str(payment.amount_usd),
+        'currency': 'USDC',
+
+        # Customer Information
+        'customer_name': customer_name,
+        'first_name': payment.first_name,
+        'last_name': payment.last_name,
+        'email': payment.email or '',
+        'mobile': payment.mobile or '',
+        'company_name': payment.company_name or '',
+        'notes': payment.notes or '',
+
+        # Blockchain Details
+        'from_address': payment.from_address,
+        'to_address': payment.to_address,
+        'block_number': payment.block_number,
+        'confirmations': payment.confirmations,
+        'required_confirmations': payment.required_confirmations,
+        'basescan_url': payment.basescan_url,
+
+        # Timestamps
+        'created_at': payment.created_at.isoformat() if payment.created_at else None,
+        'confirmed_at': payment.confirmed_at.isoformat() if payment.confirmed_at else None,
+
+        # Additional Metadata
+        'org': payment.org,
+        'chain_id': payment.chain_id,
+        'token_contract': payment.token_contract,
+    }
+
+
+def client_fields(payment):
+    """The webhook fields a client's verify request supplies (an indexed payment gets them when claimed)"""
+    payload = build_payload(payment)
+    return {key: payload[key] for key in CLIENT_FIELDS}
+
+
+def _first_attempt_at(payment, now):
+    """Unclaimed indexed payments wait for the client's customer details, up to the grace period"""
+    if payment.source != 'indexer' or payment.claimed_at is not None:
+        return now
+    grace = timedelta(seconds=getattr(settings, 'PAYMENT_WEBHOOK_CLAIM_GRACE', 600))
+    return max(now, payment.created_at + grace)
+
+
+def enqueue_payment_webhooks(payments, event=CONFIRMED_EVENT):
+    """
+    Write outbox rows for payments; call inside the transaction that changed them.
+
+    A payment gets at most one delivery per event, so a re-confirmation
+    after a reorg (or a racing promoter) doesn't notify twice.
+    """
+    from ..models import WebhookDelivery
+
+    webhook_url = getattr(settings, 'PAYMENT_WEBHOOK_URL', None)
+    if not webhook_url:
+        logger.warning("PAYMENT_WEBHOOK_URL not configured, skipping webhook")
+        return
+
+    now = timezone.now()
+    deliveries = [
+        WebhookDelivery(payment=payment, event=event, url=webhook_url, payload=build_payload(payment),
+                        next_attempt_at=_first_attempt_at(payment, now))
+        for payment in payments
+    ]
+    if not deliveries:
+        return
+    WebhookDelivery.objects.bulk_create(deliveries, ignore_conflicts=True)
+    transaction.on_commit(wake_webhook_dispatcher)
+
+
+def release_held_webhooks(payment):
+    """Send a payment's held deliveries now (its customer details were just attached)"""
+    from ..models import WebhookDelivery
+
+    now = timezone.now()
+    released = WebhookDelivery.objects.filter(
+        payment=payment, status='pending', attempts=0, next_attempt_at__gt=now,
+    ).update(next_attempt_at=now, updated_at=now)
+    if released:
+        transaction.on_commit(wake_webhook_dispatcher)
+    return released
+
+
+def wake_webhook_dispatcher():
+    """Have this process's dispatcher thread look for due deliveries now ('thread' mode only)"""
+    if getattr(settings, 'PAYMENT_WEBHOOK_DISPATCHER', 'thread') == 'thread':
+        get_webhook_dispatcher().wake()
+
+
+def retry_delay(attempts):
+    """Seconds to wait after the given number of attempts: exponential with jitter, capped"""
+    base = getattr(settings, 'PAYMENT_WEBHOOK_BACKOFF', 5)
+    cap = getattr(settings, 'PAYMENT_WEBHOOK_MAX_BACKOFF', 3600)
+    delay = min(base * 2 ** max(attempts - 1, 0), cap)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def dispatch_due_webhooks(limit=None):
+    """Claim and send deliveries that are due; returns how many were attempted"""
+    from ..models import WebhookDelivery
+
+    limit = limit or getattr(settings, 'PAYMENT_WEBHOOK_BATCH_SIZE', 50)
+    per_host = getattr(settings, 'PAYMENT_WEBHOOK_CONCURRENCY_PER_HOST', 4)
+    now = timezone.now()
+    # 'sending' rows are only due again once their lease ran out (the sender died)
+    due = WebhookDelivery.objects.filter(status__in=('pending', 'sending'), next_attempt_at__lte=now)
+    # Long enough for a whole batch queued behind one slow destination
+    lease = timedelta(seconds=getattr(settings, 'PAYMENT_WEBHOOK_TIMEOUT', 10) * (math.ceil(limit / per_host) + 1))
+    claimed = []
+    for delivery_id in list(due.order_by('next_attempt_at').values_list('id', flat=True)[:limit]):
+        if due.filter(pk=delivery_id).update(
+            status='sending',
+            attempts=F('attempts') + 1,
+            next_attempt_at=timezone.now() + lease,
+            updated_at=timezone.now(),
+        ):
+            claimed.append(delivery_id)
+
+    deliveries = list(WebhookDelivery.objects.filter(id__in=claimed).select_related('payment'))
+    for delivery in deliveries:
+        # Customer details as of now: an indexed payment may have been claimed since enqueueing
+        delivery.payload = {**delivery.payload, **client_fields(delivery.payment)}
+    # HTTP runs on the sender pool; outcomes are recorded here, as they arrive
+    for delivery, response, error in _send_all(deliveries):
+        _record_outcome(delivery, response, error)
+    return len(claimed)
+
+
+def _get_session():
+    """Keep-alive session shared by all senders, so deliveries reuse connections"""
+    global _session
+    if _session is None:
+        with _dispatcher_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=getattr(settings, 'PAYMENT_WEBHOOK_MAX_HOSTS', 10),
+                    pool_maxsize=getattr(settings, 'PAYMENT_WEBHOOK_CONCURRENCY_PER_HOST', 4),
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _dispatcher_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'PAYMENT_WEBHOOK_WORKERS', 8),
+                    thread_name_prefix='payment-webhook',
+                )
+    return _executor
+
+
+def _send_all(deliveries):
+    """
+    POST deliveries concurrently; yields (delivery, response, error) as each completes.
+
+    Each destination gets at most PAYMENT_WEBHOOK_CONCURRENCY_PER_HOST lanes,
+    each sending that destination's deliveries one after another, so one slow
+    receiver can't take every sender and isn't flooded either.
+    """
+    per_host = getattr(settings, 'PAYMENT_WEBHOOK_CONCURRENCY_PER_HOST', 4)
+    by_host = defaultdict(deque)
+    for delivery in deliveries:
+        by_host[urlsplit(delivery.url).netloc].append(delivery)
+    results = queue.Queue()
+
+    def lane(pending):
+        while True:
+            try:
+                delivery = pending.popleft()
+            except IndexError:
+                return
+            try:
+                # The delivery id is stable across retries, for receiver-side dedup
+                response = _post(delivery.url, delivery.payload, headers={'X-Webhook-Delivery': str(delivery.pk)})
+            except Exception as e:
+                results.put((delivery, None, e))
+            else:
+                results.put((delivery, response, None))
+
+    executor = _get_executor()
+    for pending in by_host.values():
+        for _ in range(min(per_host, len(pending))):
+            executor.submit(lane, pending)
+    for _ in range(len(deliveries)):
+        yield results.get()
+
+
+def _post(url, payload, headers=None):
+    return _get_session().post(
+        url,
+        json=dict(payload, webhook_sent_at=timezone.now().isoformat()),
+        headers={'Content-Type': 'application/json', **(headers or {})},
+        timeout=getattr(settings, 'PAYMENT_WEBHOOK_TIMEOUT', 10),
+    )
+
 
 def send_payment_webhook(payment):
     """
-    Send payment confirmation data to webhook URL
-    
-    Args:
-        payment: TokenPayment instance
-        
-    Returns:
-        bool: True if webhook was sent successfully, False otherwise
+    POST a payment's webhook right away, bypassing the outbox (manual tests of the receiver).
+
+    Returns True if the receiver accepted it (any 2xx).
     """
     webhook_url = getattr(settings, 'PAYMENT_WEBHOOK_URL', None)
-    
     if not webhook_url:
         logger.warning("PAYMENT_WEBHOOK_URL not configured, skipping webhook")
         return False
-    
     try:
-        # Prepare webhook payload
-        customer_name = f"{payment.first_name} {payment.last_name}".strip()
-        if not customer_name:
-            customer_name = "N/A"
-        
-        payload = {
-            # Payment Details
-            'transaction_hash': payment.transaction_hash,
-            'payment_id': payment.id,
-            'payment_type': payment.payment_type,
-            'status': payment.status,
-            'amount_usdc': str(payment.amount_token),
-            'amount_usd': str(payment.amount_usd),
-            'currency': 'USDC',
-            
-            # Customer Information
-            'customer_name': customer_name,
-            'first_name': payment.first_name,
-            'last_name': payment.last_name,
-            'email': payment.email or '',
-            'mobile': payment.mobile or '',
-            'company_name': payment.company_name or '',
-            'notes': payment.notes or '',
-            
-            # Blockchain Details
-            'from_address': payment.from_address,
-            'to_address': payment.to_address,
-            'block_number': payment.block_number,
-            'confirmations': payment.confirmations,
-            'required_confirmations': payment.required_confirmations,
-            'basescan_url': payment.basescan_url,
-            
-            # Timestamps
-            'created_at': payment.created_at.isoformat() if payment.created_at else None,
-            'confirmed_at': payment.confirmed_at.isoformat() if payment.confirmed_at else None,
-            'webhook_sent_at': timezone.now().isoformat(),
-            
-            # Additional Metadata
-            'org': payment.org,
-            'token_contract': payment.token_contract,
-        }
-        
-        # Send POST request to webhook
-        response = requests.post(
-            webhook_url,
-            json=payload,
-            headers={
-                'Content-Type': 'application/json',
-            },
-            timeout=10  # 10 second timeout
-        )
-        
-        # Check response
-        if response.status_code == 200:
-            logger.info(f"Webhook sent successfully for payment {payment.transaction_hash}")
-            return True
-        else:
-            logger.warning(
-                f"Webhook returned status {response.status_code} for payment {payment.transaction_hash}. "
-                f"Response: {response.text[:200]}"
-            )
-            return False
-            
-    except requests.exceptions.Timeout:
-        logger.error(f"Webhook timeout for payment {payment.transaction_hash}")
-        return False
+        response = _post(webhook_url, build_payload(payment))
     except requests.exceptions.RequestException as e:
         logger.error(f"Webhook request failed for payment {payment.transaction_hash}: {str(e)}")
         return False
-    except Exception as e:
-        logger.error(f"Unexpected error sending webhook for payment {payment.transaction_hash}: {str(e)}", exc_info=True)
+    if not 200 <= response.status_code < 300:
+        logger.warning(
+            f"Webhook returned status {response.status_code} for payment {payment.transaction_hash}. "
+            f"Response: {response.text[:200]}"
+        )
         return False
+    return True
+
+
+def _record_outcome(delivery, response, error):
+    """Record a claimed delivery's attempt; returns True if the receiver accepted it (any 2xx)"""
+    if isinstance(error, requests.exceptions.Timeout):
+        return _record_failure(delivery, 'Timeout')
+    if isinstance(error, requests.exceptions.RequestException):
+        return _record_failure(delivery, f'Request failed: {error}')
+    if error is not None:
+        logger.error(f"Unexpected error sending webhook {delivery.pk}: {error}", exc_info=error)
+        return _record_failure(delivery, f'Unexpected error: {error}')
 
+    if 200 <= response.status_code < 300:
+        _record(delivery, status='delivered', response_status=response.status_code, last_error='',
+                delivered_at=timezone.now())
+        logger.info(f"Webhook {delivery.event} delivered for payment {delivery.payload.get('transaction_hash')}")
+        return True
+    return _record_failure(
+        delivery, f'HTTP {response.status_code}: {response.text[:200]}', response_status=response.status_code
+    )
+
+
+def _record_failure(delivery, error, response_status=None):
+    max_attempts = getattr(settings, 'PAYMENT_WEBHOOK_MAX_ATTEMPTS', 12)
+    tx_hash = delivery.payload.get('transaction_hash')
+    if delivery.attempts >= max_attempts:
+        logger.error(f"Webhook {delivery.pk} for payment {tx_hash} dead-lettered after {delivery.attempts} attempts: {error}")
+        _record(delivery, status='dead', last_error=error, response_status=response_status)
+    else:
+        delay = retry_delay(delivery.attempts)
+        logger.warning(f"Webhook {delivery.pk} for payment {tx_hash} failed ({error}); retrying in {delay:.0f}s")
+        _record(delivery, status='pending', last_error=error, response_status=response_status,
+                next_attempt_at=timezone.now() + timedelta(seconds=delay))
+    return False
+
+
+def _record(delivery, **fields):
+    from ..models import WebhookDelivery
+
+    # Only while still ours: a replay may have reset it meanwhile
+    WebhookDelivery.objects.filter(pk=delivery.pk, status='sending', attempts=delivery.attempts).update(
+        payload=delivery.payload, updated_at=timezone.now(), **fields
+    )
+
+
+def replay_deliveries(deliveries):
+    """Requeue deliveries (a WebhookDelivery queryset) to be sent again now; returns the count"""
+    return deliveries.update(
+        status='pending', attempts=0, next_attempt_at=timezone.now(), last_error='', updated_at=timezone.now()
+    )
+
+
+class WebhookDispatcher:
+    """Delivers due webhooks in a loop, every `interval` seconds or when woken"""
+
+    def __init__(self, interval=None, batch_size=None):
+        self.interval = interval or getattr(settings, 'PAYMENT_WEBHOOK_POLL_INTERVAL', 2)
+        self.batch_size = batch_size or getattr(settings, 'PAYMENT_WEBHOOK_BATCH_SIZE', 50)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def wake(self):
+        if self._thread is None:
+            self.start()
+        self._wake.set()
+
+    def run_once(self):
+        close_old_connections()
+        try:
+            return dispatch_due_webhooks(self.batch_size)
+        finally:
+            close_old_connections()
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                attempted = self.run_once()
+            except Exception as e:
+                logger.error(f"Webhook dispatcher failed: {e}", exc_info=True)
+                attempted = 0
+            # A full batch means more are probably due
+            if attempted < self.batch_size:
+                self._wake.wait(self.interval)
+
+    def start(self):
+        with _dispatcher_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run_forever, name='webhook-dispatcher', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+def start_webhook_dispatcher():
+    """
+    Start this process's dispatcher at startup in 'thread' mode; returns it, or None in 'worker' mode.
+    
+    Called by the WSGI and ASGI entry points only: scripts, shells, tests and
+    celery workers that just call django.setup() don't claim outbox rows.
+    """
+    if getattr(settings, 'PAYMENT_WEBHOOK_DISPATCHER', 'thread') != 'thread':
+        return None
+    dispatcher = get_webhook_dispatcher()
+    dispatcher.start()
+    return dispatcher
 
 
+def get_webhook_dispatcher():
+    """This process's dispatcher thread ('thread' mode)"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = WebhookDispatcher()
+    return _dispatcher
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import TokenPayment
+from .services.payment_cache import invalidate_payments
+
+
+@receiver(post_save, sender=TokenPayment)
+@receiver(post_delete, sender=TokenPayment)
+def invalidate_cached_payment(sender, instance, **kwargs):
+    """Drop the cached status/details snapshot of a saved or deleted payment"""
+    invalidate_payments([instance.transaction_hash])
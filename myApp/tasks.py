@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from .services.verification_jobs import run_job
+
+
+@shared_task(ignore_result=True)
+def verify_payment_job(job_id):
+    """Celery entry point for background payment verification (WEB3_VERIFY_JOB_BACKEND='celery')"""
+    run_job(job_id)
@@ -1,3 +1,1321 @@
-from django.test import TestCase
+import asyncio
+import json
+import runpy
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from datetime import timedelta
+from io import StringIO
+
+import requests
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.datastructures import AttributeDict
+
+from . import views
+from .consumers import PaymentEventsConsumer
+from .models import CachedTransaction, ChainCursor, TokenPayment, VerificationJob, WebhookDelivery
+from .services.chain_registry import ChainRegistry
+from .services.async_web3_service import AsyncWeb3Service
+from .services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from .services.head_tracker import HeadTracker, publish_head
+from .services.head_watcher import HeadWatcher
+from .services.chain_registry import TokenConfig
+from .services import payment_cache, tx_cache
+from .services.payment_events import publish_head_event
+from .services.payment_verification import (
+    VerificationError, claim_indexed_payment, parse_verify_request, verify_payment, verify_payments,
+)
+from .services.payment_promoter import expire_stale_payments, on_new_head, promote_confirmed_payments
+from .services.reorg_checker import check_reorgs, find_reorged_payments, reverify_payment
+from .services.rate_limiter import LocalBuckets, client_ip, get_rate_limiter
+from .services.rpc_pool import RPCPool
+from .services.single_flight import SingleFlight
+from .services.verification_jobs import run_job
+from .services.webhook_service import WebhookDispatcher, dispatch_due_webhooks, enqueue_payment_webhooks
+from .services.transfer_decoder import TRANSFER_TOPIC, TransferDecoder
+from .services.transfer_indexer import TransferIndexer
+from .services.web3_service import RPCError, Web3Service
+
+
+class FakeRPCServer:
+    """
+    Local JSON-RPC server that answers eth_blockNumber (or canned `results`) after an injected delay.
+
+    Methods (or (method, first param) pairs) in `errors` get that JSON-RPC
+    error object instead of a result; any other `http_status` fails every request.
+    With `reject_batches` (an HTTP status) batches get that status, or a
+    single Invalid Request error object for 200.
+    """
+
+    def __init__(self, delay=0.0, block_number=100, results=None, reject_batches=None, errors=None, http_status=200):
+        self.delay = delay
+        self.http_status = http_status
+        self.reject_batches = reject_batches
+        self.block_number = block_number
+        self.results = results or {}
+        self.errors = errors or {}
+        self.requests = 0
+        self.methods = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                server.requests += 1
+                time.sleep(server.delay)
+                if server.http_status != 200:
+                    self.send_response(server.http_status)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if isinstance(body, list) and server.reject_batches:
+                    error = {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600, 'message': 'batch not supported'}}
+                    data = json.dumps(error).encode()
+                    self.send_response(server.reject_batches)
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                    return
+                calls = body if isinstance(body, list) else [body]
+                server.methods.extend(call['method'] for call in calls)
+                results = []
+                for call in calls:
+                    error = server.errors.get((call['method'], *call['params'][:1]), server.errors.get(call['method']))
+                    if error is not None:
+                        results.append({'jsonrpc': '2.0', 'id': call['id'], 'error': error})
+                    else:
+                        results.append({'jsonrpc': '2.0', 'id': call['id'],
+                                        'result': server.results.get(call['method'], hex(server.block_number))})
+                data = json.dumps(results if isinstance(body, list) else results[0]).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeWebhookReceiver:
+    """Local webhook endpoint answering each POST with the next of `statuses` (the last one repeats)"""
+
+    def __init__(self, statuses=(200,), delay=0.0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.bodies = []
+        self.headers = []
+        self.connections = 0
+        self.in_flight = self.max_in_flight = 0
+        lock = threading.Lock()
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, so clients can reuse connections
+            disable_nagle_algorithm = True  # Headers and body go out as separate writes
+
+            def setup(self):
+                super().setup()
+                with lock:
+                    receiver.connections += 1
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with lock:
+                    receiver.bodies.append(body)
+                    receiver.headers.append(dict(self.headers))
+                    status = receiver.statuses[min(len(receiver.bodies), len(receiver.statuses)) - 1]
+                    receiver.in_flight += 1
+                    receiver.max_in_flight = max(receiver.max_in_flight, receiver.in_flight)
+                time.sleep(receiver.delay)
+                with lock:
+                    receiver.in_flight -= 1
+                self.send_response(status)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'ok')
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}/hook'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def make_payment(tx_number, **fields):
+    defaults = {
+        'transaction_hash': '0x' + f'{tx_number:064x}',
+        'from_address': '0x' + '11' * 20,
+        'to_address': '0x' + '22' * 20,
+        'amount_raw': 5_000_000,
+        'amount_token': '5',
+        'amount_usd': '5',
+        'status': 'pending',
+        'block_number': 100,
+        'required_confirmations': 2,
+    }
+    defaults.update(fields)
+    return TokenPayment.objects.create(**defaults)
+
+
+def block_number_request(request_id=1):
+    return {'jsonrpc': '2.0', 'id': request_id, 'method': 'eth_blockNumber', 'params': []}
+
+
+class RPCPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.slow = FakeRPCServer(delay=0.3, block_number=1)
+        self.fast = FakeRPCServer(delay=0.0, block_number=2)
+        self.addCleanup(self.slow.close)
+        self.addCleanup(self.fast.close)
+
+    def test_routes_to_fastest_endpoint(self):
+        pool = RPCPool([self.slow.url, self.fast.url], timeout=5)
+        results = [pool.post(block_number_request(i))['result'] for i in range(6)]
+        self.assertEqual(results[-5:], [hex(2)] * 5)
+        self.assertEqual(self.slow.requests, 1)
+
+    def test_fails_over_to_next_endpoint(self):
+        dead = FakeRPCServer()
+        dead.close()
+        pool = RPCPool([dead.url, self.fast.url], timeout=1)
+        self.assertEqual(pool.post(block_number_request())['result'], hex(2))
+        self.assertGreater(pool.endpoints[0].error_rate, 0)
+        self.assertEqual(pool.ranked_endpoints()[0].url, self.fast.url)
+
+    def test_hedged_read_returns_second_endpoint_when_first_is_slow(self):
+        pool = RPCPool([self.slow.url, self.fast.url], timeout=5, hedge=True, hedge_min_delay=0.05)
+        started = time.monotonic()
+        response = pool.post(block_number_request())
+        self.assertEqual(response['result'], hex(2))
+        self.assertLess(time.monotonic() - started, 0.25)
+        self.assertEqual(self.fast.requests, 1)
+
+    def test_writes_are_not_hedged(self):
+        pool = RPCPool([self.slow.url, self.fast.url], timeout=5, hedge=True, hedge_min_delay=0.05)
+        pool.post({'jsonrpc': '2.0', 'id': 1, 'method': 'eth_sendRawTransaction', 'params': ['0x']})
+        self.assertEqual(self.fast.requests, 0)
+
+    def test_hedged_read_gives_up_when_every_endpoint_fails(self):
+        pool = RPCPool([self.slow.url, self.fast.url], timeout=5, hedge=True, hedge_min_delay=1)
+        with mock.patch.object(pool, '_post', side_effect=requests.ConnectionError('down')) as post:
+            with self.assertRaises(ConnectionError):
+                pool.post(block_number_request())
+        self.assertEqual(post.call_count, 2)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.breaker = CircuitBreaker('test', failure_threshold=2, window=30, cooldown=30)
+
+    def fail(self):
+        raise ConnectionError('boom')
+
+    def test_opens_after_threshold_and_fails_fast(self):
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                self.breaker.call(self.fail)
+        self.assertEqual(self.breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError) as ctx:
+            self.breaker.call(lambda: 'never called')
+        self.assertGreater(ctx.exception.retry_after, 0)
+
+    def test_half_open_probe_closes_circuit(self):
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                self.breaker.call(self.fail)
+        with mock.patch('myApp.services.circuit_breaker.time.time', return_value=time.time() + 31):
+            self.assertEqual(self.breaker.state, 'half_open')
+            self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_half_open_allows_single_probe(self):
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                self.breaker.call(self.fail)
+        with mock.patch('myApp.services.circuit_breaker.time.time', return_value=time.time() + 31):
+            self.breaker.before_call()
+            with self.assertRaises(CircuitOpenError):
+                self.breaker.before_call()
+
+    def test_async_http_errors_fail_over_and_settle_the_half_open_probe(self):
+        throttled, healthy = FakeRPCServer(http_status=429), FakeRPCServer(block_number=7)
+        self.addCleanup(throttled.close)
+        self.addCleanup(healthy.close)
+        endpoints = [mock.Mock(url=throttled.url), mock.Mock(url=healthy.url)]
+        service = AsyncWeb3Service(mock.Mock(chain_id=8453, pool=mock.Mock(
+            breaker=self.breaker, ranked_endpoints=mock.Mock(return_value=endpoints))))
+
+        self.assertEqual(async_to_sync(service.get_current_block)(), 7)
+        self.assertEqual(throttled.requests, 1)
+
+        healthy.http_status = 503
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                async_to_sync(service.get_current_block)()
+        self.assertEqual(self.breaker.state, 'open')
+        with mock.patch('myApp.services.circuit_breaker.time.time', return_value=time.time() + 31):
+            with self.assertRaises(ConnectionError):
+                async_to_sync(service.get_current_block)()
+            # The failed probe re-opened the circuit instead of holding the probe slot
+            self.assertEqual(self.breaker.state, 'open')
+
+    def test_slow_calls_count_as_failures(self):
+        breaker = CircuitBreaker('slow', failure_threshold=1, slow_call_threshold=0.0)
+        breaker.call(lambda: 'ok')
+        self.assertEqual(breaker.state, 'open')
+
+
+@mock.patch('myApp.services.webhook_service.wake_webhook_dispatcher')
+class PaymentPromoterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_promotes_only_payments_with_enough_confirmations(self, wake_dispatcher):
+        ready = make_payment(1, block_number=100)
+        waiting = make_payment(2, block_number=101)
+        deeper_requirement = make_payment(3, block_number=100, required_confirmations=5)
+
+        promoted = promote_confirmed_payments(head=102)
+
+        self.assertEqual(promoted, [ready.id])
+        self.assertEqual(list(WebhookDelivery.objects.values_list('payment_id', flat=True)), [ready.id])
+        statuses = dict(TokenPayment.objects.values_list('id', 'status'))
+        self.assertEqual(statuses, {ready.id: 'confirmed', waiting.id: 'pending', deeper_requirement.id: 'pending'})
+        ready.refresh_from_db()
+        self.assertIsNotNone(ready.confirmed_at)
+
+    def test_already_confirmed_payments_are_not_requeued(self, wake_dispatcher):
+        make_payment(1, status='confirmed')
+        self.assertEqual(promote_confirmed_payments(head=200), [])
+        self.assertFalse(WebhookDelivery.objects.exists())
+
+    def test_expires_stale_pending_payments(self, wake_dispatcher):
+        stale = make_payment(1)
+        fresh = make_payment(2)
+        TokenPayment.objects.filter(id=stale.id).update(created_at=timezone.now() - timedelta(days=2))
+
+        self.assertEqual(expire_stale_payments(), 1)
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, fresh.status), ('expired', 'pending'))
+
+    def test_transitions_are_conditional_updates_of_the_changed_columns(self, wake_dispatcher):
+        payment = make_payment(1, notes='x' * 10_000)
+
+        with self.assertNumQueries(1) as queries:
+            self.assertEqual(TokenPayment.objects.filter(pk=payment.pk).confirm(), 1)
+        sql = queries.captured_queries[0]['sql']
+        self.assertIn('"status" IN', sql)
+        self.assertNotIn('"notes"', sql)
+        # Lost the race: a concurrent writer already moved it
+        self.assertEqual(TokenPayment.objects.filter(pk=payment.pk).expire(), 0)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'confirmed')
+        self.assertIsNotNone(payment.confirmed_at)
+
+    def test_confirmations_are_derived_from_the_published_head(self, wake_dispatcher):
+        payment = make_payment(1, block_number=100)
+        self.assertEqual(payment.confirmations, 0)
+        publish_head(103, 8453)
+        self.assertEqual(TokenPayment.objects.get(pk=payment.pk).confirmations, 3)
+
+    def test_head_sweep_is_skipped_while_another_process_holds_the_chain_lock(self, wake_dispatcher):
+        make_payment(1, block_number=100)
+        with mock.patch('myApp.services.payment_promoter.check_reorgs') as check_reorgs, \
+                mock.patch('myApp.services.payment_promoter.get_web3_service'):
+            cache.add('payments:promoter-lock:8453', True)
+            on_new_head(102, chain_id=8453)
+            check_reorgs.assert_not_called()
+            self.assertEqual(TokenPayment.objects.get().status, 'pending')
+
+            cache.delete('payments:promoter-lock:8453')
+            on_new_head(103, chain_id=8453)
+            check_reorgs.assert_called_once()
+        self.assertEqual(TokenPayment.objects.get().status, 'confirmed')
+
+
+class HeadTrackerTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tracker(self, **kwargs):
+        return HeadTracker(service=mock.Mock(chain_id=8453), interval=1, **kwargs)
+
+    def test_one_tracker_per_chain_polls_and_a_dedicated_one_takes_over(self):
+        web, other_web, dedicated = self.tracker(), self.tracker(), self.tracker(dedicated=True)
+        self.assertTrue(web.hold_lease())
+        self.assertFalse(other_web.hold_lease())
+        self.assertTrue(web.hold_lease())
+
+        self.assertTrue(dedicated.hold_lease())
+        self.assertFalse(web.hold_lease())
+        self.assertFalse(other_web.hold_lease())
+
+    def test_track_chain_head_does_not_start_an_in_process_tracker(self):
+        registry = mock.Mock()
+        registry.get_service.return_value = mock.Mock(chain_id=8453)
+        with mock.patch('myApp.management.commands.track_chain_head.get_registry', return_value=registry), \
+                mock.patch.object(HeadTracker, 'run_forever', autospec=True) as run_forever:
+            call_command('track_chain_head', stdout=StringIO())
+        registry.get_service.assert_called_once_with(None, start_tracker=False)
+        self.assertTrue(run_forever.call_args.args[0].dedicated)
+
+
+class RPCBatchTests(SimpleTestCase):
+    calls = [('eth_blockNumber', []), ('eth_chainId', [])]
+
+    def setUp(self):
+        cache.clear()
+
+    def service(self, *servers):
+        for server in servers:
+            self.addCleanup(server.close)
+        return Web3Service(rpc_urls=[server.url for server in servers], chain_id=8453)
+
+    def test_batches_go_out_as_one_request(self):
+        server = FakeRPCServer(block_number=100)
+        self.assertEqual(self.service(server).batch_request(self.calls), ['0x64', '0x64'])
+        self.assertEqual(server.requests, 1)
+
+    def test_rejected_batches_fall_back_to_single_calls_and_are_not_retried(self):
+        for status in (400, 405, 200):
+            with self.subTest(status=status):
+                server = FakeRPCServer(block_number=100, reject_batches=status)
+                service = self.service(server)
+
+                self.assertEqual(service.batch_request(self.calls), ['0x64', '0x64'])
+                self.assertEqual(server.requests, 3)  # The rejected batch, then one call each
+                self.assertEqual(service.batch_request(self.calls), ['0x64', '0x64'])
+                self.assertEqual(server.requests, 5)
+                self.assertEqual(service.pool.breaker.state, 'closed')
+
+    def test_batching_is_remembered_per_endpoint(self):
+        rejecting = FakeRPCServer(block_number=100, reject_batches=400)
+        batching = FakeRPCServer(block_number=100)
+        service = self.service(rejecting, batching)
+
+        service.batch_request(self.calls)
+        service.batch_request(self.calls)
+        self.assertEqual((rejecting.requests, batching.requests), (1, 2))
+        self.assertEqual([endpoint.supports_batch for endpoint in service.pool.endpoints], [False, True])
+
+
+class TransferDecoderTests(SimpleTestCase):
+    usdc = '0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913'
+
+    def setUp(self):
+        self.decoder = TransferDecoder(self.usdc)
+
+    def log(self, **fields):
+        log = {
+            'address': self.usdc.lower(), 'logIndex': '0x3',
+            'topics': ['0x' + TRANSFER_TOPIC.hex(), _topic_address('0x' + '11' * 20), _topic_address('0x' + '22' * 20)],
+            'data': '0x' + f'{5_000_000:064x}',
+        }
+        log.update(fields)
+        return log
+
+    def test_decodes_addresses_value_and_log_index(self):
+        self.assertEqual(self.decoder.decode_log(self.log()), {
+            'from': Web3.to_checksum_address('0x' + '11' * 20),
+            'to': Web3.to_checksum_address('0x' + '22' * 20),
+            'value': 5_000_000,
+            'log_index': 3,
+        })
+        # web3-formatted logs (HexBytes, int log index) decode the same
+        formatted = AttributeDict({**self.log(), 'logIndex': 3, 'data': HexBytes(f'0x{2 ** 255:064x}'),
+                                   'topics': [HexBytes(topic) for topic in self.log()['topics']]})
+        self.assertEqual(self.decoder.decode_log(formatted)['value'], 2 ** 255)
+
+    def test_skips_logs_that_are_not_this_tokens_transfers(self):
+        approval = '0x' + bytes(Web3.keccak(text='Approval(address,address,uint256)')).hex()
+        topics = self.log()['topics']
+        for name, log in [
+            ('other contract', self.log(address='0x' + '33' * 20)),
+            ('wrong topic0', self.log(topics=[approval] + topics[1:])),
+            ('too few topics', self.log(topics=topics[:2])),
+            ('no data word', self.log(data='0x')),
+        ]:
+            with self.subTest(name):
+                self.assertIsNone(self.decoder.decode_log(log))
+        self.assertEqual(len(self.decoder.decode([self.log(address='0x' + '33' * 20), self.log()])), 1)
+
+
+class ReorgCheckerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.service = mock.Mock(chain_id=8453)
+
+    def test_only_payments_with_changed_block_hash_are_reported(self):
+        kept = make_payment(1, block_number=100, block_hash='0x' + 'aa' * 32)
+        reorged = make_payment(2, block_number=101, block_hash='0x' + 'bb' * 32)
+        self.service.batch_request.return_value = [
+            AttributeDict({'hash': HexBytes('0x' + 'aa' * 32)}),
+            AttributeDict({'hash': HexBytes('0x' + 'cc' * 32)}),
+        ]
+
+        result = find_reorged_payments(head=110, service=self.service, depth=64)
+
+        self.assertEqual([payment.id for payment in result], [reorged.id])
+        calls = self.service.batch_request.call_args.args[0]
+        self.assertEqual(calls, [('eth_getBlockByNumber', ['0x64', False]), ('eth_getBlockByNumber', ['0x65', False])])
+        self.assertNotEqual(kept.id, reorged.id)
+
+    def test_no_rpc_when_no_recent_payments(self):
+        make_payment(1, block_number=10, block_hash='0x' + 'aa' * 32)
+        self.assertEqual(find_reorged_payments(head=1000, service=self.service, depth=64), [])
+        self.service.batch_request.assert_not_called()
+
+    def test_dropped_transaction_goes_back_to_pending(self):
+        payment = make_payment(1, status='confirmed', block_number=100, block_hash='0x' + 'aa' * 32,
+                               confirmed_at=timezone.now())
+        self.service.get_transaction.return_value = None
+
+        self.assertEqual(reverify_payment(payment, service=self.service), 'pending')
+        payment.refresh_from_db()
+        self.assertEqual((payment.status, payment.block_number, payment.block_hash), ('pending', None, ''))
+
+    @mock.patch('myApp.services.reorg_checker.check_usdc_transfer', return_value=(True, 'Transfer verified', {}))
+    def test_dropped_transaction_is_looked_up_each_head_until_it_is_mined_again(self, check_usdc_transfer):
+        payment = make_payment(1, block_number=None, block_hash='')
+        self.service.get_receipts.return_value = {payment.transaction_hash: None}
+
+        check_reorgs(head=110, service=self.service)
+        payment.refresh_from_db()
+        self.assertIsNone(payment.block_number)
+
+        receipt = AttributeDict({'blockNumber': 105, 'blockHash': HexBytes('0x' + 'dd' * 32)})
+        self.service.get_receipts.return_value = {payment.transaction_hash: {'receipt': receipt, 'confirmations': 5}}
+        self.assertEqual(check_reorgs(head=110, service=self.service), 1)
+        payment.refresh_from_db()
+        self.assertEqual((payment.status, payment.block_number, payment.block_hash), ('pending', 105, '0x' + 'dd' * 32))
+        self.assertEqual(self.service.get_receipts.call_count, 2)
+        self.service.get_transaction.assert_not_called()
+
+    def test_transient_rpc_error_is_not_mistaken_for_a_dropped_transaction(self):
+        payment = make_payment(1, status='confirmed', block_number=100, block_hash='0x' + 'aa' * 32,
+                               confirmed_at=timezone.now())
+        service = Web3Service(rpc_urls=['http://127.0.0.1:1'], chain_id=8453)
+        with mock.patch.object(service, 'batch_request', side_effect=ValueError('RPC error: header not found')):
+            with self.assertRaises(ConnectionError):
+                service.get_transaction(payment.transaction_hash)
+            self.assertEqual(reverify_payment(payment, service=service), 'confirmed')
+
+        payment.refresh_from_db()
+        self.assertEqual((payment.status, payment.block_number), ('confirmed', 100))
+
+
+class ChainRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.registry = ChainRegistry({
+            8453: {'name': 'Base', 'rpc_urls': ['http://127.0.0.1:1'],
+                   'tokens': {'0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913': {'symbol': 'USDC', 'decimals': 6}}},
+            1: {'name': 'Ethereum', 'rpc_urls': ['http://127.0.0.1:2'],
+                'tokens': {'0xdAC17F958D2ee523a2206206994597C13D831ec7': {'symbol': 'USDT', 'decimals': 6},
+                           '0x6B175474E89094C44Da98b954EedeAC495271d0F': {'symbol': 'DAI', 'decimals': 18}}},
+        }, default_chain_id=8453)
+
+    def test_defaults_to_first_chain_and_token(self):
+        self.assertEqual(self.registry.get_token().symbol, 'USDC')
+        self.assertEqual(self.registry.get_token('1').symbol, 'USDT')
+
+    def test_token_lookup_is_case_insensitive_and_shares_decoder(self):
+        token = self.registry.get_token(1, '0x6b175474e89094c44da98b954eedeac495271d0f')
+        self.assertEqual(token.to_raw('1.5'), 15 * 10 ** 17)
+        self.assertIs(token.decoder, self.registry.get_token(1, token.address).decoder)
+
+    def test_unsupported_chain_or_token_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            self.registry.get_token(10)
+        with self.assertRaises(ValueError):
+            self.registry.get_token(8453, '0xdAC17F958D2ee523a2206206994597C13D831ec7')
+
+    @override_settings(WEB3_HEAD_TRACKER='command')
+    def test_services_are_shared_per_chain_and_built_without_rpc_calls(self):
+        cache.clear()
+        server = FakeRPCServer(block_number=100)
+        self.addCleanup(server.close)
+        registry = ChainRegistry({8453: {'name': 'Base', 'rpc_urls': [server.url], 'tokens': {
+            '0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913': {'symbol': 'USDC', 'decimals': 6}}}})
+
+        service = registry.get_service(8453)
+        self.assertIs(registry.get_service(), service)
+        self.assertEqual(server.requests, 0)  # No connectivity probe, in line or in the background
+        self.assertEqual(service.get_current_block(), 100)
+        self.assertEqual(server.requests, 1)
+
+
+@mock.patch('myApp.services.verification_jobs.get_web3_service')
+@mock.patch('myApp.services.verification_jobs.enqueue_job')
+class VerificationJobTests(TestCase):
+    body = {'transaction_hash': '0x' + 'ab' * 32, 'amount_usdc': '5', 'from_address': '0x' + '11' * 20}
+
+    def setUp(self):
+        cache.clear()
+        get_rate_limiter().local = LocalBuckets()
+
+    def post(self, body=None):
+        return self.client.post('/api/crypto/verify-transaction/', data=json.dumps(body or self.body),
+                                content_type='application/json', HTTP_PREFER='respond-async')
+
+    def test_job_mode_answers_202_and_reuses_the_active_job(self, enqueue_job, get_web3_service):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post()
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job_id']
+        self.assertEqual(response['Location'], f'/api/crypto/verification-jobs/{job_id}/')
+        enqueue_job.assert_called_once()
+
+        self.assertEqual(self.post().json()['job_id'], job_id)
+        self.assertEqual(VerificationJob.objects.count(), 1)
+        get_web3_service.assert_not_called()
+
+    def test_malformed_hashes_are_rejected_before_reaching_the_node_or_a_job(self, enqueue_job, get_web3_service):
+        for tx_hash in (12, '0x1234', 'ab' * 32):
+            get_rate_limiter().local = LocalBuckets()
+            body = {**self.body, 'transaction_hash': tx_hash}
+            for response in (self.post(body), self.client.post('/api/crypto/verify-transaction/', data=json.dumps(body),
+                                                               content_type='application/json')):
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['error'], 'Invalid transaction hash')
+        self.assertFalse(VerificationJob.objects.exists())
+        get_web3_service.assert_not_called()
+
+    def test_unmined_transaction_is_retried_with_backoff_until_it_verifies(self, enqueue_job, get_web3_service):
+        job = VerificationJob.objects.create(transaction_hash=self.body['transaction_hash'], request_data=self.body)
+        payment = make_payment(1)
+
+        with mock.patch('myApp.services.verification_jobs.verify_payment',
+                        side_effect=[VerificationError('Transaction not found', retryable=True), payment]):
+            run_job(job.pk)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ('retrying', 1))
+            self.assertGreater(enqueue_job.call_args.kwargs['delay'], 0)
+
+            run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.payment_id), ('succeeded', 2, payment.id))
+
+        status = self.client.get(f'/api/crypto/verification-jobs/{job.pk}/').json()
+        self.assertEqual(status['payment']['payment_id'], payment.id)
+
+    def test_definitive_failure_is_not_retried(self, enqueue_job, get_web3_service):
+        job = VerificationJob.objects.create(transaction_hash=self.body['transaction_hash'], request_data=self.body)
+
+        with mock.patch('myApp.services.verification_jobs.verify_payment',
+                        side_effect=VerificationError('Transaction failed')):
+            run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', 'Transaction failed'))
+        enqueue_job.assert_not_called()
+
+    def test_jobs_stranded_by_a_restart_are_resumed_once_their_lease_lapses(self, enqueue_job, get_web3_service):
+        # A retry timer that died with its process: the lease ran out a minute ago
+        stranded = VerificationJob.objects.create(
+            transaction_hash=self.body['transaction_hash'], request_data=self.body, status='retrying',
+            attempts=3, locked_until=timezone.now() - timedelta(minutes=1))
+        fresh = VerificationJob.objects.create(
+            transaction_hash='0x' + 'cd' * 32, request_data=self.body, status='retrying',
+            locked_until=timezone.now() + timedelta(minutes=1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.post().json()['job_id'], str(stranded.pk))
+        enqueue_job.assert_called_once_with(stranded.pk)
+        stranded.refresh_from_db()
+        self.assertGreater(stranded.locked_until, timezone.now())
+
+        # The renewed lease keeps other pollers from resuming it again
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(f'/api/crypto/verification-jobs/{stranded.pk}/')
+            self.client.get(f'/api/crypto/verification-jobs/{fresh.pk}/')
+        enqueue_job.assert_called_once()
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.flight = SingleFlight('test', lock_timeout=5, poll_interval=0.01, shared_errors=(VerificationError,))
+
+    def test_concurrent_calls_in_one_process_share_one_run(self):
+        calls = []
+        release = threading.Event()
+
+        def verify():
+            calls.append(1)
+            release.wait(5)
+            return 'payment'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.flight.do('0xabc', verify))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['payment'] * 5)
+
+    def test_waits_for_the_outcome_published_by_another_process(self):
+        cache.add('single-flight:test:0xabc', 'other-flight', 5)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(self.flight.do('0xabc', lambda: 'ran here')))
+        thread.start()
+        time.sleep(0.05)
+        cache.set('single-flight:test:result:other-flight', ('ok', 'shared'), 5)
+        cache.delete('single-flight:test:0xabc')
+        thread.join(5)
+
+        self.assertEqual(results, ['shared'])
+
+    def test_shared_errors_reach_waiters_in_other_processes(self):
+        cache.add('single-flight:test:0xabc', 'other-flight', 5)
+        cache.set('single-flight:test:result:other-flight',
+                  ('error', VerificationError('Transaction failed')), 5)
+
+        with self.assertRaisesMessage(VerificationError, 'Transaction failed'):
+            self.flight.do('0xabc', lambda: 'ran here')
+
+
+def _topic_address(address):
+    return '0x' + '0' * 24 + address[2:].lower()
+
+
+@override_settings(PAYMENT_WEBHOOK_URL='', REQUIRED_CONFIRMATIONS=2,
+                   RECEIVER_WALLET='0x918e03d7c59d61b6505fed486082419941ffd77f')
+class VerificationPipelineTests(TestCase):
+    tx_hash = '0x' + 'ab' * 32
+    usdc = '0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913'
+
+    def setUp(self):
+        cache.clear()
+        receipt = {
+            'transactionHash': self.tx_hash, 'blockNumber': hex(100), 'blockHash': '0x' + 'cd' * 32,
+            'status': '0x1', 'gasUsed': hex(52000), 'effectiveGasPrice': hex(7),
+            'logs': [{
+                'address': self.usdc.lower(), 'logIndex': '0x0', 'transactionIndex': '0x0',
+                'blockNumber': hex(100), 'blockHash': '0x' + 'cd' * 32, 'transactionHash': self.tx_hash,
+                'topics': ['0x' + TRANSFER_TOPIC.hex(), _topic_address('0x' + '11' * 20),
+                           _topic_address('0x918e03d7c59d61b6505fed486082419941ffd77f')],
+                'data': '0x' + f'{5_000_000:064x}',
+            }],
+        }
+        self.server = FakeRPCServer(block_number=101, results={'eth_getTransactionReceipt': receipt})
+        self.addCleanup(self.server.close)
+        self.service = Web3Service(rpc_urls=[self.server.url], chain_id=8453, token=TokenConfig(8453, self.usdc))
+        self.request = parse_verify_request({
+            'transaction_hash': self.tx_hash, 'amount_usdc': '5', 'from_address': '0x' + '11' * 20,
+        })
+
+    def test_one_rpc_round_trip_and_one_insert_per_verification(self):
+        # Replay check, then the INSERT inside its savepoint
+        with self.assertNumQueries(4):
+            payment = verify_payment(self.service, self.request)
+
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(self.server.methods, ['eth_getTransactionReceipt', 'eth_blockNumber'])
+        self.assertEqual((payment.block_number, payment.confirmations), (100, 1))
+        self.assertEqual((payment.gas_price, payment.gas_used), (7, 52000))
+        self.assertEqual(payment.block_hash, '0x' + 'cd' * 32)
+
+    @override_settings(WEB3_FINALITY_CONFIRMATIONS=1, WEB3_TX_CACHE_DB=True)
+    def test_final_verdict_for_one_token_does_not_reject_another(self):
+        weth = TokenConfig(8453, '0x4200000000000000000000000000000000000006', symbol='WETH', decimals=18)
+        receiver = '0x918e03d7c59d61b6505fed486082419941ffd77f'
+
+        wrong_token = self.service.verify_transfer(self.tx_hash, receiver, token=weth)
+        self.assertFalse(wrong_token.is_valid)
+        self.assertIn('No Transfer event', wrong_token.message)
+
+        verification = self.service.verify_transfer(self.tx_hash, receiver, expected_amount_raw=5_000_000)
+        self.assertTrue(verification.is_valid, verification.message)
+        # The negative verdict stays cached for the token it was about
+        self.server.methods.clear()
+        self.assertFalse(self.service.verify_transfer(self.tx_hash, receiver, token=weth).is_valid)
+        self.assertEqual(self.server.methods, [])
+
+    @override_settings(WEB3_FINALITY_CONFIRMATIONS=1, WEB3_TX_CACHE_DB=True)
+    def test_final_receipt_is_served_from_the_cache_without_rpc(self):
+        fetched = self.service.get_transaction(self.tx_hash, include_transaction=False)
+        self.assertTrue(CachedTransaction.objects.filter(transaction_hash=self.tx_hash).exists())
+
+        # Even with the Django cache gone the persisted receipt is used; only the head is read
+        cache.clear()
+        publish_head(101, 8453)
+        self.server.methods.clear()
+        cached = self.service.get_transaction(self.tx_hash, include_transaction=False)
+        self.assertEqual(self.server.methods, [])
+        self.assertEqual((cached['block_number'], cached['confirmations']), (fetched['block_number'], 1))
+        self.assertEqual(cached['logs'][0]['topics'], fetched['logs'][0]['topics'])
+
+    @override_settings(WEB3_FINALITY_CONFIRMATIONS=10, WEB3_TX_CACHE_DB=True)
+    def test_receipt_that_is_not_final_yet_is_not_persisted(self):
+        self.service.get_transaction(self.tx_hash, include_transaction=False)
+        self.assertFalse(CachedTransaction.objects.exists())
+        self.assertFalse(tx_cache.get_cached_transaction(self.tx_hash)['final'])
+
+    def test_async_views_answer_like_the_sync_views(self):
+        factory = RequestFactory()
+        body = json.dumps({'transaction_hash': self.tx_hash, 'amount_usdc': '5', 'from_address': '0x' + '11' * 20})
+
+        def call(view, request, *args):
+            if asyncio.iscoroutinefunction(view):
+                return async_to_sync(view)(request, *args)
+            return view(request, *args)
+
+        def verify(view):
+            cache.clear()
+            TokenPayment.objects.all().delete()
+            request = factory.post('/api/crypto/verify-transaction/', body, content_type='application/json')
+            response = call(view, request)
+            payload = json.loads(response.content)
+            payload.pop('payment_id')
+            return response.status_code, payload
+
+        def get(view):
+            response = call(view, factory.get('/'), self.tx_hash)
+            return response.status_code, json.loads(response.content), response['ETag']
+
+        with mock.patch('myApp.views.get_web3_service', return_value=self.service), \
+                mock.patch('myApp.views.get_async_web3_service', return_value=AsyncWeb3Service(self.service)):
+            self.assertEqual(verify(views.verify_token_transaction_async), verify(views.verify_token_transaction))
+            self.assertEqual(get(views.payment_status_async), get(views.payment_status))
+            self.assertEqual(get(views.payment_details_async), get(views.payment_details))
+
+    def test_node_rejecting_the_lookup_is_not_reported_as_an_outage(self):
+        self.server.errors['eth_getTransactionReceipt'] = {'code': -32602, 'message': 'invalid argument 0'}
+
+        with self.assertRaises(RPCError):
+            self.service.get_transaction(self.tx_hash, include_transaction=False)
+        with self.assertRaisesMessage(VerificationError, 'Transaction not found') as caught:
+            verify_payment(self.service, self.request)
+        self.assertFalse(caught.exception.retryable)
+        verification = async_to_sync(AsyncWeb3Service(self.service).verify_transfer)(
+            self.tx_hash, '0x918e03d7c59d61b6505fed486082419941ffd77f')
+        self.assertEqual((verification.message, verification.pending), ('Transaction not found', False))
+
+        with mock.patch('myApp.views.get_web3_service', return_value=self.service):
+            response = self.client.post('/api/crypto/verify-transaction/', content_type='application/json',
+                                        data={'transaction_hash': self.tx_hash, 'amount_usdc': '5'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Transaction not found', response.json()['error'])
+
+    def test_replay_is_rejected_with_one_query_and_no_rpc(self):
+        verify_payment(self.service, self.request)
+        self.server.methods.clear()
+
+        with self.assertNumQueries(1), self.assertRaisesMessage(VerificationError, 'already processed'):
+            verify_payment(self.service, self.request)
+        self.assertEqual(self.server.methods, [])
+
+    def test_batch_uses_one_lookup_one_rpc_round_trip_and_one_insert(self):
+        recorded = make_payment(1, status='confirmed')
+        requests = [self.request] + [
+            parse_verify_request({'transaction_hash': tx_hash, 'amount_usdc': '5'})
+            for tx_hash in ('0x' + 'ef' * 32, recorded.transaction_hash)
+        ]
+
+        with mock.patch('myApp.services.web3_service.get_web3_service', return_value=self.service):
+            # Lookup, then the bulk INSERT inside its savepoint
+            with self.assertNumQueries(4):
+                outcomes = verify_payments(requests)
+
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(self.server.methods, ['eth_getTransactionReceipt'] * 2 + ['eth_blockNumber'])
+        (first, _), (second, _), (_, replay) = outcomes
+        self.assertEqual((first.transaction_hash, second.transaction_hash), (self.tx_hash, '0x' + 'ef' * 32))
+        self.assertEqual(replay.message, 'Transaction already processed')
+        self.assertEqual(TokenPayment.objects.count(), 3)
+
+
+    def test_batch_reports_malformed_and_rejected_hashes_per_item(self):
+        rejected = '0x' + 'ee' * 32
+        self.server.errors[('eth_getTransactionReceipt', rejected)] = {'code': -32602, 'message': 'invalid params'}
+        body = {'transactions': [
+            {'transaction_hash': tx_hash, 'amount_usdc': '5'} for tx_hash in (self.tx_hash, '0x1234', rejected)
+        ]}
+
+        with mock.patch('myApp.services.web3_service.get_web3_service', return_value=self.service):
+            response = self.client.post('/api/crypto/verify-transactions/', data=body, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        verified, malformed, not_found = response.json()['results']
+        self.assertTrue(verified['success'])
+        self.assertEqual((malformed['error'], malformed['retryable']), ('Invalid transaction hash', False))
+        self.assertEqual((not_found['error'], not_found['retryable']), ('Transaction not found', False))
+        # The malformed hash never reached the node
+        self.assertEqual(self.server.methods, ['eth_getTransactionReceipt'] * 2 + ['eth_blockNumber'])
+
+class RateLimiterTests(TestCase):
+    def setUp(self):
+        get_rate_limiter().local = LocalBuckets()
+
+    def test_bucket_refills_at_its_rate_and_debits_all_keys_or_none(self):
+        buckets = LocalBuckets()
+        limits = [('ip', 2, 1.0), ('wallet', 1, 0.5)]
+
+        self.assertEqual(buckets.hit(limits, now=0), (True, 0.0))
+        allowed, retry_after = buckets.hit(limits, now=0)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 2.0)
+        # The rejected request did not spend the IP bucket's remaining token
+        self.assertEqual(buckets.hit([('ip', 2, 1.0)], now=0), (True, 0.0))
+        self.assertTrue(buckets.hit(limits, now=2)[0])
+
+    @override_settings(RATE_LIMIT_TRUSTED_PROXIES=1)
+    def test_client_ip_comes_from_the_trusted_forwarded_hop(self):
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='6.6.6.6, 1.2.3.4', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(client_ip(request), '1.2.3.4')
+        with self.settings(RATE_LIMIT_TRUSTED_PROXIES=0):
+            self.assertEqual(client_ip(request), '10.0.0.1')
+
+    @override_settings(RATE_LIMITS={'verify': {'ip': '5/m', 'wallet': '1/m'}})
+    def test_verify_is_limited_per_wallet_with_retry_after(self):
+        body = json.dumps({'transaction_hash': '0x' + 'ab' * 32, 'amount_usdc': '0', 'from_address': '0x' + '11' * 20})
+        post = lambda ip: self.client.post('/api/crypto/verify-transaction/', data=body,
+                                           content_type='application/json', HTTP_X_FORWARDED_FOR=ip)
+
+        self.assertEqual(post('1.1.1.1').status_code, 400)  # Reaches the view (invalid amount)
+        response = post('2.2.2.2')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+
+
+class PaymentEventStreamTests(TestCase):
+    async def test_watcher_reads_the_head_once_for_every_waiter(self):
+        service = mock.Mock(get_head_block=mock.AsyncMock(side_effect=[5, 6, 6, 6, 6, 6]))
+        watcher = HeadWatcher(8453, interval=0.01)
+        with mock.patch('myApp.services.async_web3_service.get_async_web3_service', return_value=service):
+            self.assertEqual(await asyncio.gather(*[watcher.wait() for _ in range(50)]), [5] * 50)
+            self.assertEqual(await asyncio.gather(*[watcher.wait(after=5) for _ in range(50)]), [6] * 50)
+            self.assertEqual(await watcher.wait(after=6, timeout=0.02), 6)
+        self.assertLessEqual(service.get_head_block.await_count, 6)
+
+    @override_settings(WEB3_ASYNC_VIEWS=True)
+    async def test_stream_pushes_confirmations_until_the_payment_settles(self):
+        payment_cache._get_local().clear()
+        await sync_to_async(cache.clear)()
+        payment = await sync_to_async(make_payment)(1)
+        heads = iter([100, 101, 101, 102])
+
+        async def wait_for_head(chain_id, after=None, timeout=None):
+            head = next(heads)
+            if head == 102:
+                await TokenPayment.objects.filter(pk=payment.pk).aupdate(status='confirmed')
+                # What the promoter's invalidate_payments() does once its transaction commits
+                payment_cache._get_local().clear()
+                await sync_to_async(cache.clear)()
+            return head
+
+        build = mock.Mock(wraps=views._payment_snapshot)
+        with mock.patch('myApp.views.wait_for_head', wait_for_head), mock.patch('myApp.views._payment_snapshot', build):
+            response = await self.async_client.get(f'/api/crypto/payment-events/{payment.transaction_hash}/')
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            body = ''.join([chunk.decode() async for chunk in response.streaming_content])
+        # New heads are served from the cached snapshot; only the status change reloads it
+        self.assertEqual(build.call_count, 2)
+
+        events = [json.loads(line[len('data: '):]) for line in body.splitlines() if line.startswith('data: ')]
+        self.assertEqual([(e['status'], e['confirmations']) for e in events],
+                         [('pending', 0), ('pending', 1), ('confirmed', 2)])
+        self.assertIn(': keep-alive', body)
+
+    @override_settings(WEB3_ASYNC_VIEWS=False)
+    def test_stream_is_refused_and_pages_poll_under_wsgi(self):
+        payment = make_payment(1)
+        response = self.client.get(f'/api/crypto/payment-events/{payment.transaction_hash}/')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(self.client.get('/payment/').context['sse_enabled'])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class PaymentEventsConsumerTests(TestCase):
+    async def connect(self, user=None):
+        communicator = WebsocketCommunicator(PaymentEventsConsumer.as_asgi(), '/ws/payments/')
+        if user is not None:
+            communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_tx_subscriber_gets_snapshot_head_progress_and_status_changes(self):
+        payment = await sync_to_async(make_payment)(1)
+        communicator = await self.connect()
+
+        await communicator.send_json_to({'action': 'subscribe', 'tx_hash': payment.transaction_hash})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'subscribed')
+        snapshot = (await communicator.receive_json_from())['payment']
+        self.assertEqual((snapshot['status'], snapshot['confirmations']), ('pending', 0))
+
+        # One head message per block; the consumer derives the confirmation count
+        await sync_to_async(publish_head_event)(101, 8453)
+        self.assertEqual((await communicator.receive_json_from())['payment']['confirmations'], 1)
+
+        def promote():
+            with self.captureOnCommitCallbacks(execute=True):
+                promote_confirmed_payments(102, chain_id=8453)
+        with mock.patch('myApp.services.webhook_service.wake_webhook_dispatcher'):
+            await sync_to_async(promote)()
+        self.assertEqual((await communicator.receive_json_from())['payment']['status'], 'confirmed')
+        await communicator.disconnect()
+
+    async def test_org_subscriptions_require_staff(self):
+        communicator = await self.connect(user=AnonymousUser())
+        await communicator.send_json_to({'action': 'subscribe', 'org': 'tanya-client'})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'error')
+        await communicator.disconnect()
+
+        communicator = await self.connect(user=mock.Mock(is_staff=True))
+        await communicator.send_json_to({'action': 'subscribe', 'org': 'tanya-client'})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'subscribed')
+        await communicator.disconnect()
+
+
+class ConditionalPaymentStatusTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        payment_cache._get_local().clear()
+        get_rate_limiter().local = LocalBuckets()
+        self.payment = make_payment(1)
+        self.url = f'/api/crypto/payment-status/{self.payment.transaction_hash}/'
+
+    def get(self, url=None, confirmations=1, **headers):
+        with mock.patch('myApp.views.get_web3_service') as get_service:
+            get_service.return_value.get_confirmations.return_value = confirmations
+            return self.client.get(url or self.url, headers=headers)
+
+    def get_with_wait(self, query):
+        with mock.patch('myApp.views.get_web3_service') as get_service:
+            get_service.return_value.get_confirmations.return_value = 1
+            return self.client.get(self.url + query)
+
+    def test_unchanged_pending_payment_revalidates_to_304(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        not_modified = self.get(if_none_match=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertEqual(not_modified.content, b'')
+
+    @override_settings(WEB3_REORG_DEPTH=64)
+    def test_status_change_invalidates_and_only_final_payments_are_cacheable(self):
+        etag = self.get()['ETag']
+        with mock.patch('myApp.services.webhook_service.wake_webhook_dispatcher'), \
+                self.captureOnCommitCallbacks(execute=True):
+            promote_confirmed_payments(102, chain_id=8453)
+
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'confirmed')
+        # The reorg checker can still reopen it, so clients revalidate
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(self.get(if_modified_since=response['Last-Modified']).status_code, 304)
+
+        final = self.get(confirmations=64)
+        self.assertIn('public', final['Cache-Control'])
+        self.assertIn('max-age=86400', final['Cache-Control'])
+
+    def test_details_are_never_cached_by_shared_caches(self):
+        details_url = f'/api/crypto/payment-details/{self.payment.transaction_hash}/'
+        self.payment.status = 'failed'
+        self.payment.save()
+        response = self.get(details_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotIn('public', response['Cache-Control'])
+
+    def test_polls_are_served_from_the_cache_until_the_payment_is_saved(self):
+        self.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().json()['status'], 'pending')
+
+        payment_cache._get_local().clear()  # As if served by another process
+        with self.assertNumQueries(0):
+            self.get()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.payment.status = 'failed'
+            self.payment.save()
+        self.assertEqual(self.get().json()['status'], 'failed')
+
+    @override_settings(WEB3_LONG_POLL_SYNC=True)
+    def test_long_poll_returns_when_confirmations_change_without_db_queries(self):
+        self.get()  # Primes the cache
+        heads = iter([101, 101, 102])
+        with mock.patch('myApp.views.wait_for_head_sync', side_effect=lambda *a, **kw: next(heads)) as wait:
+            with self.assertNumQueries(0):
+                response = self.get_with_wait('?wait=10&since=1')
+        self.assertEqual(response.json()['confirmations'], 2)
+        self.assertEqual(wait.call_count, 3)
+
+    @override_settings(WEB3_LONG_POLL_SYNC=True)
+    def test_long_poll_times_out_with_the_unchanged_status(self):
+        service = mock.Mock(get_head_block=mock.Mock(return_value=101))
+        with mock.patch('myApp.services.web3_service.get_web3_service', return_value=service):
+            started = time.monotonic()
+            response = self.get_with_wait('?wait=0.2&since=1')
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(response.json()['confirmations'], 1)
+        self.assertEqual(self.client.get(self.url + '?wait=soon').status_code, 400)
+
+    def test_wsgi_view_answers_at_once_unless_long_polls_are_enabled_and_a_slot_is_free(self):
+        self.get()  # Primes the cache
+        with mock.patch('myApp.views.wait_for_head_sync') as wait:
+            self.assertEqual(self.get_with_wait('?wait=10&since=1').json()['confirmations'], 1)
+            with override_settings(WEB3_LONG_POLL_SYNC=True, WEB3_LONG_POLL_MAX_CONCURRENT=0):
+                self.assertEqual(self.get_with_wait('?wait=10&since=1').json()['confirmations'], 1)
+        wait.assert_not_called()
+        self.assertEqual(views._long_polls, 0)
+
+
+@override_settings(PAYMENT_WEBHOOK_URL='', REQUIRED_CONFIRMATIONS=2, WEB3_INDEXER_BLOCK_RANGE=50,
+                   WEB3_INDEXER_START_LOOKBACK=100, WEB3_INDEXER_REORG_OVERLAP=5)
+class TransferIndexerTests(TestCase):
+    usdc = '0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913'
+    receiver = '0x918e03d7c59d61b6505fed486082419941ffd77f'
+    sender = '0x' + '11' * 20
+
+    def setUp(self):
+        self.logs = []
+        self.ranges = []
+        service = mock.Mock(chain_id=8453, token=TokenConfig(8453, self.usdc), get_head_block=mock.Mock(return_value=120))
+        self.service = service
+        self.indexer = TransferIndexer(service=service, receiver_wallet=self.receiver)
+        self.indexer.get_logs = self.get_logs
+
+    def get_logs(self, from_block, to_block):
+        self.ranges.append((from_block, to_block))
+        return [log for log in self.logs if from_block <= log['blockNumber'] <= to_block]
+
+    def transfer(self, tx_number, block, value=5_000_000, log_index=0):
+        self.logs.append(AttributeDict({
+            'address': self.usdc, 'logIndex': log_index, 'blockNumber': block,
+            'blockHash': HexBytes(f'0x{block:064x}'), 'transactionHash': HexBytes(f'0x{tx_number:064x}'),
+            'topics': [HexBytes(TRANSFER_TOPIC), HexBytes(_topic_address(self.sender)),
+                       HexBytes(_topic_address(self.receiver))],
+            'data': HexBytes(f'0x{value:064x}'),
+        }))
+
+    def test_resumes_from_the_cursor_and_rescans_the_reorg_overlap(self):
+        self.transfer(1, block=110)
+        self.assertEqual(self.indexer.run_once(), (101, 1))
+        self.assertEqual(self.ranges, [(20, 69), (70, 119), (120, 120)])
+
+        # A reorg re-mined tx 2 just behind the cursor; tx 3 is new
+        self.transfer(2, block=118)
+        self.transfer(3, block=125)
+        self.service.get_head_block.return_value = 130
+        self.ranges.clear()
+        self.assertEqual(self.indexer.run_once(), (15, 2))
+        self.assertEqual(self.ranges, [(116, 130)])
+        self.assertEqual(ChainCursor.objects.get().block_number, 130)
+        self.assertEqual(TokenPayment.objects.filter(source='indexer').count(), 3)
+
+    def test_rescans_and_client_verified_rows_are_not_duplicated_or_overwritten(self):
+        make_payment(1, email='a@example.com', block_number=110)
+        self.transfer(1, block=110)
+        self.transfer(2, block=111, value=7_000_000)
+        self.transfer(2, block=111, value=9_000_000, log_index=1)  # First transfer per tx wins
+
+        self.indexer.run_once()
+        self.indexer.run_once(start_block=100)
+
+        self.assertEqual(TokenPayment.objects.count(), 2)
+        client_row = TokenPayment.objects.get(transaction_hash=f'0x{1:064x}')
+        self.assertEqual((client_row.source, client_row.email), ('client', 'a@example.com'))
+        indexed = TokenPayment.objects.get(transaction_hash=f'0x{2:064x}')
+        self.assertEqual((indexed.source, indexed.amount_raw, indexed.transfer_event_index), ('indexer', 7_000_000, 0))
+
+    def test_rescan_restores_the_block_of_a_payment_a_reorg_dropped(self):
+        make_payment(1, email='a@example.com', block_number=None, block_hash='')
+        self.transfer(1, block=112)
+
+        self.indexer.run_once()
+
+        payment = TokenPayment.objects.get()
+        self.assertEqual((payment.source, payment.email), ('client', 'a@example.com'))
+        self.assertEqual((payment.block_number, payment.block_hash), (112, f'0x{112:064x}'))
+
+    def test_claim_checks_the_amount_and_sender_before_attaching_details(self):
+        self.transfer(1, block=110)
+        self.indexer.run_once()
+        payment = TokenPayment.objects.get()
+
+        def claim(**fields):
+            body = {'transaction_hash': payment.transaction_hash, 'amount_usdc': '5', 'from_address': self.sender,
+                    'email': 'a@example.com', **fields}
+            return claim_indexed_payment(payment, parse_verify_request(body))
+
+        with mock.patch('myApp.services.web3_service.get_web3_service'):
+            with self.assertRaisesMessage(VerificationError, 'Amount mismatch'):
+                claim(amount_usdc='6')
+            with self.assertRaisesMessage(VerificationError, 'Sender mismatch'):
+                claim(from_address='0x' + '33' * 20)
+            payment.refresh_from_db()
+            self.assertIsNone(payment.claimed_at)
+
+            self.assertEqual(claim().email, 'a@example.com')
+            with self.assertRaisesMessage(VerificationError, 'already processed'):
+                claim()
+
+
+@mock.patch('myApp.services.webhook_service.wake_webhook_dispatcher')
+class WebhookOutboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def enqueue(self, receiver):
+        with override_settings(PAYMENT_WEBHOOK_URL=receiver.url):
+            promote_confirmed_payments(head=102)
+        return WebhookDelivery.objects.get()
+
+    def test_delivery_is_written_with_the_status_change_and_sent_by_the_dispatcher(self, wake_dispatcher):
+        receiver = FakeWebhookReceiver()
+        self.addCleanup(receiver.close)
+        payment = make_payment(1, email='a@example.com')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery = self.enqueue(receiver)
+        wake_dispatcher.assert_called_once()
+        self.assertEqual(receiver.bodies, [])  # Nothing sent on the promoting path
+
+        self.assertEqual(dispatch_due_webhooks(), 1)
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts, delivery.response_status), ('delivered', 1, 200))
+        self.assertEqual(receiver.bodies[0]['transaction_hash'], payment.transaction_hash)
+        self.assertEqual(receiver.bodies[0]['status'], 'confirmed')
+        self.assertEqual(receiver.headers[0]['X-Webhook-Delivery'], str(delivery.pk))
+        self.assertEqual(dispatch_due_webhooks(), 0)
+
+    @override_settings(PAYMENT_WEBHOOK_MAX_ATTEMPTS=2, PAYMENT_WEBHOOK_BACKOFF=60)
+    def test_failures_back_off_then_dead_letter_and_can_be_replayed(self, wake_dispatcher):
+        receiver = FakeWebhookReceiver(statuses=[500, 503, 200])
+        self.addCleanup(receiver.close)
+        make_payment(1)
+        delivery = self.enqueue(receiver)
+
+        dispatch_due_webhooks()
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts), ('pending', 1))
+        self.assertGreater(delivery.next_attempt_at, timezone.now() + timedelta(seconds=29))
+        self.assertEqual(dispatch_due_webhooks(), 0)  # Not due yet
+
+        WebhookDelivery.objects.update(next_attempt_at=timezone.now())
+        dispatch_due_webhooks()
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts, delivery.response_status), ('dead', 2, 503))
+
+        call_command('replay_webhooks', stdout=StringIO())
+        dispatch_due_webhooks()
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts), ('delivered', 1))
+        self.assertEqual(len(receiver.bodies), 3)
+
+    @override_settings(PAYMENT_WEBHOOK_CLAIM_GRACE=600)
+    def test_indexed_payment_webhook_waits_for_the_claim_and_carries_its_details(self, wake_dispatcher):
+        receiver = FakeWebhookReceiver()
+        self.addCleanup(receiver.close)
+        payment = make_payment(1, source='indexer')
+        self.enqueue(receiver)
+        self.assertEqual(dispatch_due_webhooks(), 0)  # Held for the customer's details
+
+        request = parse_verify_request({
+            'transaction_hash': payment.transaction_hash, 'amount_usdc': '5', 'from_address': '0x' + '11' * 20,
+            'first_name': 'Ada', 'last_name': 'Lovelace', 'email': 'ada@example.com',
+        })
+        with mock.patch('myApp.services.web3_service.get_web3_service'), \
+                self.captureOnCommitCallbacks(execute=True):
+            claim_indexed_payment(payment, request)
+        wake_dispatcher.assert_called_once()
+
+        self.assertEqual(dispatch_due_webhooks(), 1)
+        self.assertEqual((receiver.bodies[0]['customer_name'], receiver.bodies[0]['email']),
+                         ('Ada Lovelace', 'ada@example.com'))
+        self.assertEqual(receiver.bodies[0]['status'], 'confirmed')
+
+    @override_settings(PAYMENT_WEBHOOK_CLAIM_GRACE=600)
+    def test_unclaimed_indexed_payment_webhook_goes_out_after_the_grace_period(self, wake_dispatcher):
+        receiver = FakeWebhookReceiver()
+        self.addCleanup(receiver.close)
+        payment = make_payment(1, source='indexer')
+        TokenPayment.objects.filter(pk=payment.pk).update(created_at=timezone.now() - timedelta(minutes=11))
+        self.enqueue(receiver)
+
+        self.assertEqual(dispatch_due_webhooks(), 1)
+        self.assertEqual(receiver.bodies[0]['customer_name'], 'N/A')
+
+    def test_one_delivery_per_payment_event(self, wake_dispatcher):
+        receiver = FakeWebhookReceiver()
+        self.addCleanup(receiver.close)
+        payment = make_payment(1)
+        self.enqueue(receiver)
+        with override_settings(PAYMENT_WEBHOOK_URL=receiver.url):
+            enqueue_payment_webhooks([payment])
+        self.assertEqual(WebhookDelivery.objects.count(), 1)
+
+    @override_settings(PAYMENT_WEBHOOK_CONCURRENCY_PER_HOST=2)
+    def test_backlog_drains_in_parallel_over_pooled_connections(self, wake_dispatcher):
+        receiver = FakeWebhookReceiver(delay=0.1)
+        self.addCleanup(receiver.close)
+        for number in range(1, 9):
+            make_payment(number)
+        with override_settings(PAYMENT_WEBHOOK_URL=receiver.url):
+            promote_confirmed_payments(head=102)
+
+        started = time.monotonic()
+        self.assertEqual(dispatch_due_webhooks(), 8)
+        self.assertLess(time.monotonic() - started, 0.7)  # 4 rounds of 2, not 8 in a row
+        self.assertEqual(receiver.max_in_flight, 2)
+        self.assertLessEqual(receiver.connections, 2)
+        self.assertEqual(WebhookDelivery.objects.filter(status='delivered').count(), 8)
+
+    def test_backlog_present_at_startup_is_dispatched_without_a_new_enqueue(self, wake_dispatcher):
+        receiver = FakeWebhookReceiver()
+        self.addCleanup(receiver.close)
+        make_payment(1)
+        self.enqueue(receiver)  # Left behind by a previous process
+
+        # Run the dispatcher's first pass inline instead of on its thread
+        with mock.patch.object(WebhookDispatcher, 'start', lambda dispatcher: dispatcher.run_once()), \
+                mock.patch('myApp.services.webhook_service._dispatcher', None):
+            # Any script that sets Django up (a benchmark, a celery worker) leaves the outbox alone
+            apps.get_app_config('myApp').ready()
+            self.assertEqual(receiver.bodies, [])
+            with override_settings(PAYMENT_WEBHOOK_DISPATCHER='worker'):
+                runpy.run_module('myProject.asgi')
+            self.assertEqual(receiver.bodies, [])
+            runpy.run_module('myProject.wsgi')
+
+        self.assertEqual(len(receiver.bodies), 1)
+        self.assertEqual(WebhookDelivery.objects.get().status, 'delivered')
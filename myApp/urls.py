@@ -1,7 +1,18 @@
+from django.conf import settings
 from django.urls import path
 from django.views.generic import TemplateView
 from . import views
 
+# Under ASGI the crypto API can use the asyncio views, which don't hold a thread per RPC wait
+if getattr(settings, 'WEB3_ASYNC_VIEWS', False):
+    verify_view = views.verify_token_transaction_async
+    status_view = views.payment_status_async
+    details_view = views.payment_details_async
+else:
+    verify_view = views.verify_token_transaction
+    status_view = views.payment_status
+    details_view = views.payment_details
+
 urlpatterns = [
     # Existing pages
     path("", views.home, name="home"),
@@ -21,9 +32,13 @@ urlpatterns = [
     path("payment/", views.web3_payment, name="web3_payment"),
     
     # Crypto/Token payment API endpoints
-    path("api/crypto/verify-transaction/", views.verify_token_transaction, name="verify_token_transaction"),
-    path("api/crypto/payment-status/<str:tx_hash>/", views.payment_status, name="payment_status"),
-    path("api/crypto/payment-details/<str:tx_hash>/", views.payment_details, name="payment_details"),
+    path("api/crypto/verify-transaction/", verify_view, name="verify_token_transaction"),
+    path("api/crypto/payment-status/<str:tx_hash>/", status_view, name="payment_status"),
+    path("api/crypto/payment-details/<str:tx_hash>/", details_view, name="payment_details"),
+    path("api/crypto/payment-events/<str:tx_hash>/", views.payment_events, name="payment_events"),
+    path("api/crypto/verify-transactions/", views.verify_transactions_batch, name="verify_transactions_batch"),
+    path("api/crypto/payment-statuses/", views.payment_statuses_batch, name="payment_statuses_batch"),
+    path("api/crypto/verification-jobs/<uuid:job_id>/", views.verification_job_status, name="verification_job_status"),
     
     # Payment success page
     path("payment/success/", views.payment_success, name="payment_success"),
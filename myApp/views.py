@@ -12,6 +12,7 @@ from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 import stripe
+from .services.rate_limiter import rate_limit
 
 def home(request):
     return render(request, "home.html")
@@ -56,6 +57,7 @@ def widget_metamask(request):
     """MetaMask donation widget"""
     ctx = {
         "org": request.GET.get("org", "solutions-for-change"),
+        "sse_enabled": _sse_enabled(),
     }
     return render(request, "solutions_for_change_metamask.html", ctx)
 
@@ -63,7 +65,7 @@ def widget_metamask(request):
 @ensure_csrf_cookie
 def web3_payment(request):
     """Web3 payment portal for Tanya's client"""
-    return render(request, "web3_payment.html")
+    return render(request, "web3_payment.html", {"sse_enabled": _sse_enabled()})
 
 
 def _verify_recaptcha(token: str) -> bool:
@@ -78,6 +80,7 @@ def _verify_recaptcha(token: str) -> bool:
         return False
 
 @method_decorator(csrf_exempt, name='dispatch')
+@method_decorator(rate_limit('checkout'), name='post')
 class CreateCheckoutSessionView(View):
     """
     Handles one-time and recurring (monthly/quarterly/yearly) via Checkout.
@@ -271,61 +274,257 @@ def stripe_webhook(request):
     return HttpResponse(status=200)
 
 # ========== Crypto/Web3 Payment Endpoints ==========
+import hashlib
+import threading
+from contextlib import contextmanager
 from django.views.decorators.http import require_http_methods
-from django.core.cache import cache
-from django.utils import timezone
-from .models import TokenPayment
-from .services.web3_service import Web3Service
-from .services.webhook_service import send_payment_webhook
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from .models import TokenPayment, VerificationJob
+from .services.web3_service import get_web3_service
+from .services.circuit_breaker import CircuitOpenError
+from .services.head_watcher import wait_for_head_sync
+from .services.payment_cache import PaymentSnapshot, get_payment_snapshot
+from .services.payment_verification import (
+    VerificationError, averify_payment, parse_verify_request, required_confirmations, verify_payment,
+    verify_payments,
+)
+from .services.verification_jobs import resume_overdue_jobs, submit_verification
+
+
+def _verification_failed(error):
+    """400 response for a VerificationError"""
+    if error.payment is not None:
+        return JsonResponse({
+            'error': 'Transaction already processed',
+            'payment_id': error.payment.id,
+            'status': error.payment.status
+        }, status=400)
+    return JsonResponse({'error': f'Transaction verification failed: {error.message}'}, status=400)
+
+
+def _wants_job(request):
+    """Job mode: verify in the background and answer 202 (RFC 7240 "Prefer: respond-async" or WEB3_VERIFY_JOBS)"""
+    return ('respond-async' in request.headers.get('Prefer', '').lower()
+            or getattr(settings, 'WEB3_VERIFY_JOBS', False))
+
+
+def _job_accepted(job):
+    """202 response pointing the client at a verification job"""
+    status_url = reverse('verification_job_status', args=[job.pk])
+    response = JsonResponse({
+        'job_id': str(job.pk),
+        'status': job.status,
+        'status_url': status_url,
+    }, status=202)
+    response['Location'] = status_url
+    return response
+
+
+def _retry_later(error):
+    """503 response for a tripped circuit breaker"""
+    response = JsonResponse({
+        'error': 'Blockchain service is temporarily unavailable. Please try again shortly.',
+        'retry_after': error.retry_after,
+    }, status=503)
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def _verified_payload(payment):
+    return {
+        'success': True,
+        'payment_id': payment.id,
+        'status': payment.status,
+        'transaction_hash': payment.transaction_hash,
+        'confirmations': payment.confirmations,
+        'required_confirmations': required_confirmations(),
+        'amount_usdc': str(payment.amount_token),
+        'basescan_url': payment.basescan_url,
+    }
+
+
+def _status_payload(payment):
+    return {
+        'status': payment.status,
+        'confirmations': payment.confirmations,
+        'required_confirmations': required_confirmations(),
+        'amount_usdc': str(payment.amount_token),
+        'amount_usd': str(payment.amount_usd),
+        'basescan_url': payment.basescan_url,
+        'from_address': payment.from_address,
+        'to_address': payment.to_address,
+    }
+
+
+def _details_payload(payment):
+    customer_name = f"{payment.first_name} {payment.last_name}".strip()
+    if not customer_name:
+        customer_name = "N/A"
+    
+    return {
+        'transaction_hash': payment.transaction_hash,
+        'payment_type': payment.payment_type,
+        'amount_usdc': str(payment.amount_token),
+        'amount_usd': str(payment.amount_usd),
+        'status': payment.status,
+        'customer_name': customer_name,
+        'email': payment.email or 'N/A',
+        'company_name': payment.company_name or '',
+        'created_at': payment.created_at.isoformat() if payment.created_at else None,
+        'confirmed_at': payment.confirmed_at.isoformat() if payment.confirmed_at else None,
+        'basescan_url': payment.basescan_url,
+        'from_address': payment.from_address,
+        'to_address': payment.to_address,
+        'block_number': payment.block_number,
+        'confirmations': payment.confirmations,
+        'chain_id': payment.chain_id,
+        'token_contract': payment.token_contract,
+    }
+
+
+def _payment_snapshot(payment):
+    """The cached form of a payment for the status and details endpoints"""
+    return PaymentSnapshot(payment, _status_payload(payment), _details_payload(payment))
+
+
+def _is_final(payment):
+    """Whether a payment's status can no longer change"""
+    if payment.status in ('failed', 'expired'):
+        return True
+    if payment.status != 'confirmed' or not getattr(settings, 'WEB3_REORG_CHECK', True):
+        return payment.status == 'confirmed'
+    # The reorg checker can still reopen or fail a confirmation inside its window
+    return payment.confirmations >= getattr(settings, 'WEB3_REORG_DEPTH', 64)
+
+
+def _conditional_payment_response(request, payment, payload, private=False):
+    """
+    JsonResponse for a payment payload, or 304 Not Modified when the client's copy is current.
+    
+    The ETag covers updated_at, status and confirmations. Last-Modified is
+    only sent once the payment settles, since a pending payment's
+    confirmations change without touching updated_at. Payments whose status
+    can no longer change are cacheable for WEB3_SETTLED_MAX_AGE seconds;
+    the rest must be revalidated on every poll. Pass private=True for
+    payloads with customer details, which shared caches must not keep.
+    """
+    validator = f'{payment.updated_at.isoformat() if payment.updated_at else ""}|{payment.status}|{payment.confirmations}'
+    etag = quote_etag(hashlib.md5(validator.encode()).hexdigest())
+    last_modified = None
+    if payment.status != 'pending' and payment.updated_at:
+        last_modified = int(payment.updated_at.timestamp())
+    
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = JsonResponse(payload)
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    visibility = {'private': True} if private else {'public': True}
+    if _is_final(payment):
+        patch_cache_control(response, max_age=getattr(settings, 'WEB3_SETTLED_MAX_AGE', 86400), **visibility)
+    else:
+        patch_cache_control(response, no_cache=True, **visibility)
+    return response
+
+
+def _long_poll_params(request):
+    """
+    (wait, since) from ?wait=<seconds>&since=<confirmations>.
+    
+    wait is 0 when absent and capped at WEB3_LONG_POLL_MAX_WAIT; since is None
+    when absent. Raises ValueError for values that aren't numbers.
+    """
+    import math
+    wait = float(request.GET.get('wait') or 0)
+    if not math.isfinite(wait):
+        raise ValueError(wait)
+    since = request.GET.get('since')
+    since = int(since) if since else None
+    return min(max(wait, 0), getattr(settings, 'WEB3_LONG_POLL_MAX_WAIT', 25)), since
+
+
+def _refreshed_status(tx_hash, head):
+    """The cached snapshot of a payment with confirmations at `head` (None if it's gone)"""
+    payment = get_payment_snapshot(tx_hash, _payment_snapshot)
+    if payment is not None and payment.block_number and head is not None:
+        payment = payment.with_confirmations(max(0, head - payment.block_number))
+    return payment
+
+
+def _long_poll_status(tx_hash, payment, wait, since):
+    """
+    Wait up to `wait` seconds for the payment's status or confirmation count
+    (compared to `since`, the client's count) to change; returns the latest snapshot.
+    
+    Woken by the shared head watcher; each new head re-reads the cached
+    snapshot, which writes invalidate, instead of querying the database.
+    """
+    import time
+    deadline = time.monotonic() + wait
+    status = payment.status
+    since = payment.confirmations if since is None else since
+    head = None
+    while payment is not None and payment.status == status and payment.confirmations == since:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        new_head = wait_for_head_sync(payment.chain_id, after=head, timeout=remaining)
+        if new_head is not None and new_head != head:
+            head = new_head
+            payment = _refreshed_status(tx_hash, head)
+    return payment
+
+
+_long_polls = 0
+_long_polls_lock = threading.Lock()
+
+
+@contextmanager
+def _long_poll_slot():
+    """
+    Yields whether this request may hold a long poll.
+    
+    At most WEB3_LONG_POLL_MAX_CONCURRENT are held at once per process;
+    beyond that the caller answers with the current status straight away.
+    """
+    global _long_polls
+    with _long_polls_lock:
+        acquired = _long_polls < getattr(settings, 'WEB3_LONG_POLL_MAX_CONCURRENT', 100)
+        if acquired:
+            _long_polls += 1
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with _long_polls_lock:
+                _long_polls -= 1
+
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('verify')
 def verify_token_transaction(request):
     """Verify a MetaMask USDC transaction after user submits"""
-    # Rate limiting (simple in-memory cache)
-    client_ip = request.META.get('REMOTE_ADDR', 'unknown')
-    rate_limit_key = f'verify_tx_{client_ip}'
-    if cache.get(rate_limit_key):
-        return JsonResponse({'error': 'Rate limit exceeded. Please wait a moment.'}, status=429)
-    cache.set(rate_limit_key, True, 5)  # 5 second rate limit
-    
     try:
         data = json.loads(request.body)
-        tx_hash = data.get('transaction_hash')
-        amount_usdc = Decimal(str(data.get('amount_usdc', 0)))
-        from_address = data.get('from_address', '').strip()
-        
-        if not tx_hash:
-            return JsonResponse({'error': 'Transaction hash required'}, status=400)
         
-        if amount_usdc <= 0:
-            return JsonResponse({'error': 'Invalid amount'}, status=400)
+        # Chain and token to verify against (Base USDC unless the client says otherwise)
+        try:
+            verify_request = parse_verify_request(data)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
         
-        # Check if transaction already processed (prevent replay)
-        if TokenPayment.objects.filter(transaction_hash=tx_hash).exists():
-            existing = TokenPayment.objects.get(transaction_hash=tx_hash)
-            return JsonResponse({
-                'error': 'Transaction already processed',
-                'payment_id': existing.id,
-                'status': existing.status
-            }, status=400)
-        
-        # Get customer information
-        customer = {
-            'first_name': data.get('first_name', ''),
-            'last_name': data.get('last_name', ''),
-            'email': data.get('email', ''),
-            'mobile': data.get('mobile', ''),
-            'company_name': data.get('company_name', ''),
-            'message': data.get('message', ''),
-            'notes': data.get('message', ''),  # Alias for notes
-            'payment_type': data.get('payment_type', 'course'),
-            'org': data.get('org', 'tanya-client'),
-        }
+        # Job mode: verify in the background, retrying until the tx is mined
+        if _wants_job(request):
+            job, _ = submit_verification(data)
+            return _job_accepted(job)
         
         # Initialize Web3 service
         try:
-            web3_service = Web3Service()
+            web3_service = get_web3_service(verify_request['token'].chain_id)
         except ValueError as e:
             import logging
             logger = logging.getLogger(__name__)
@@ -348,65 +547,20 @@ def verify_token_transaction(request):
                 'error': f'Blockchain service error: {str(e)}'
             }, status=503)
         
-        # Convert USDC amount to raw units
-        expected_amount_raw = web3_service.usdc_to_raw(amount_usdc)
-        
-        # Verify transaction
-        receiver_wallet = getattr(settings, 'RECEIVER_WALLET', '0x918e03d7c59d61b6505fed486082419941ffd77f')
-        is_valid, message, transfer_event = web3_service.verify_usdc_transfer(
-            tx_hash=tx_hash,
-            expected_to_address=receiver_wallet,
-            expected_amount_raw=expected_amount_raw,
-            expected_from_address=from_address if from_address else None
-        )
-        
-        if not is_valid:
+        # Verify transaction and record the payment
+        try:
+            payment = verify_payment(web3_service, verify_request)
+        except CircuitOpenError as e:
+            return _retry_later(e)
+        except ConnectionError as e:
             import logging
             logger = logging.getLogger(__name__)
-            logger.warning(f"Transaction verification failed: {tx_hash} - {message}")
-            return JsonResponse({'error': f'Transaction verification failed: {message}'}, status=400)
-        
-        # Get transaction details
-        tx_data = web3_service.get_transaction(tx_hash)
-        receipt = tx_data['receipt']
-        
-        # Create payment record
-        payment = TokenPayment.objects.create(
-            transaction_hash=tx_hash,
-            from_address=transfer_event['from'],
-            to_address=transfer_event['to'],
-            amount_raw=transfer_event['value'],
-            amount_token=web3_service.raw_to_usdc(transfer_event['value']),
-            amount_usd=amount_usdc,  # USDC is 1:1 with USD
-            status='pending',
-            block_number=receipt.blockNumber,
-            confirmations=web3_service.get_confirmations(receipt.blockNumber),
-            required_confirmations=getattr(settings, 'REQUIRED_CONFIRMATIONS', 2),
-            gas_price=tx_data['transaction'].get('gasPrice', 0),
-            gas_used=receipt.gasUsed,
-            transfer_event_index=transfer_event['log_index'],
-            **customer
-        )
-        
-        # Check if already confirmed
-        if payment.confirmations >= getattr(settings, 'REQUIRED_CONFIRMATIONS', 2):
-            if payment.status != 'confirmed':
-                payment.status = 'confirmed'
-                payment.confirmed_at = timezone.now()
-                payment.save()
-                # Send webhook notification
-                send_payment_webhook(payment)
+            logger.error(f"Web3 service connection error: {e}")
+            return JsonResponse({'error': f'Blockchain connection error: {str(e)}'}, status=503)
+        except VerificationError as e:
+            return _verification_failed(e)
         
-        return JsonResponse({
-            'success': True,
-            'payment_id': payment.id,
-            'status': payment.status,
-            'transaction_hash': tx_hash,
-            'confirmations': payment.confirmations,
-            'required_confirmations': getattr(settings, 'REQUIRED_CONFIRMATIONS', 2),
-            'amount_usdc': str(payment.amount_token),
-            'basescan_url': payment.basescan_url,
-        })
+        return JsonResponse(_verified_payload(payment))
     
     except Exception as e:
         import logging
@@ -415,44 +569,81 @@ def verify_token_transaction(request):
         return JsonResponse({'error': f'Server error: {str(e)}'}, status=500)
 
 @require_http_methods(["GET"])
+@rate_limit('status')
+def verification_job_status(request, job_id):
+    """Status of a background verification job (the payment once it succeeds)"""
+    try:
+        job = VerificationJob.objects.select_related('payment').get(pk=job_id)
+    except VerificationJob.DoesNotExist:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    if job.status in ('queued', 'running', 'retrying'):
+        resume_overdue_jobs(pk=job.pk)
+    
+    result = {
+        'job_id': str(job.pk),
+        'status': job.status,
+        'transaction_hash': job.transaction_hash,
+        'attempts': job.attempts,
+        'next_attempt_at': job.next_attempt_at.isoformat() if job.next_attempt_at else None,
+        'error': job.error or None,
+    }
+    if job.status == 'succeeded' and job.payment is not None:
+        result['payment'] = _verified_payload(job.payment)
+    elif job.payment is not None:
+        # Failed because the transaction was already recorded
+        result['payment_id'] = job.payment.id
+        result['payment_status'] = job.payment.status
+    
+    response = JsonResponse(result)
+    if job.status in ('queued', 'running', 'retrying'):
+        response['Retry-After'] = '2'
+    return response
+
+@require_http_methods(["GET"])
+@rate_limit('status')
 def payment_status(request, tx_hash):
-    """Check payment status"""
+    """
+    Check payment status.
+    
+    With ?wait=<seconds>[&since=<confirmations>] this is a long poll: the
+    response is held until the status or confirmation count changes, or the
+    wait expires. Holding it ties up a WSGI worker, so here that's only done
+    with WEB3_LONG_POLL_SYNC; otherwise ?wait= is ignored and the current
+    status returned. payment_status_async holds it without a worker thread.
+    """
     try:
-        payment = TokenPayment.objects.get(transaction_hash=tx_hash)
+        wait, since = _long_poll_params(request)
+    except ValueError:
+        return JsonResponse({'error': 'wait and since must be numbers'}, status=400)
+    
+    try:
+        # Served from the payment cache while the payment is unchanged (no DB round trip)
+        payment = get_payment_snapshot(tx_hash, _payment_snapshot)
+        if payment is None:
+            return JsonResponse({'error': 'Payment not found'}, status=404)
         
-        # Update confirmations
+        # Confirmations are computed from the tracked head; status changes are made
+        # by the promoter on each new head, so this endpoint never writes
         try:
-            web3_service = Web3Service()
             if payment.block_number:
-                payment.confirmations = web3_service.get_confirmations(payment.block_number)
-                
-                # Update status if confirmed
-                if payment.confirmations >= getattr(settings, 'REQUIRED_CONFIRMATIONS', 2):
-                    if payment.status == 'pending':
-                        payment.status = 'confirmed'
-                        payment.confirmed_at = timezone.now()
-                        payment.save()
-                        # Send webhook notification
-                        send_payment_webhook(payment)
+                payment = payment.with_confirmations(
+                    get_web3_service(payment.chain_id).get_confirmations(payment.block_number)
+                )
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
             logger.error(f"Error updating confirmations: {e}")
             # Continue with cached confirmations
         
-        return JsonResponse({
-            'status': payment.status,
-            'confirmations': payment.confirmations,
-            'required_confirmations': getattr(settings, 'REQUIRED_CONFIRMATIONS', 2),
-            'amount_usdc': str(payment.amount_token),
-            'amount_usd': str(payment.amount_usd),
-            'basescan_url': payment.basescan_url,
-            'from_address': payment.from_address,
-            'to_address': payment.to_address,
-        })
-    
-    except TokenPayment.DoesNotExist:
-        return JsonResponse({'error': 'Payment not found'}, status=404)
+        if wait and getattr(settings, 'WEB3_LONG_POLL_SYNC', False):
+            with _long_poll_slot() as slot:
+                if slot:
+                    payment = _long_poll_status(tx_hash, payment, wait, since)
+            if payment is None:
+                return JsonResponse({'error': 'Payment not found'}, status=404)
+        
+        return _conditional_payment_response(request, payment, payment.status_payload)
+    
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -460,41 +651,340 @@ def payment_status(request, tx_hash):
         return JsonResponse({'error': str(e)}, status=500)
 
 @require_http_methods(["GET"])
+@rate_limit('status')
 def payment_details(request, tx_hash):
     """Get full payment details for receipt"""
     try:
-        payment = TokenPayment.objects.get(transaction_hash=tx_hash)
+        payment = get_payment_snapshot(tx_hash, _payment_snapshot)
+        if payment is None:
+            return JsonResponse({'error': 'Payment not found'}, status=404)
         
-        customer_name = f"{payment.first_name} {payment.last_name}".strip()
-        if not customer_name:
-            customer_name = "N/A"
+        return _conditional_payment_response(request, payment, payment.details_payload, private=True)
+    
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Error fetching payment details: {e}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+def _batch_items(request, key):
+    """
+    The list under `key` in a batch request body.
+
+    Raises ValueError with a client-facing message when it is missing, empty
+    or longer than WEB3_BATCH_MAX_ITEMS.
+    """
+    try:
+        data = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid JSON')
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValueError(f'"{key}" must be a non-empty list')
+    max_items = getattr(settings, 'WEB3_BATCH_MAX_ITEMS', 50)
+    if len(items) > max_items:
+        raise ValueError(f'At most {max_items} items per batch')
+    return items
+
+
+def _batch_error(tx_hash, error):
+    """Per-item result for a verification that failed"""
+    result = {'transaction_hash': tx_hash, 'success': False, 'error': error.message, 'retryable': error.retryable}
+    if error.payment is not None:
+        result['error'] = 'Transaction already processed'
+        result['payment_id'] = error.payment.id
+        result['status'] = error.payment.status
+    return result
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@rate_limit('batch')
+def verify_transactions_batch(request):
+    """
+    Verify several MetaMask USDC transactions at once.
+    
+    Body: {"transactions": [<verify-transaction body>, ...]}. Returns
+    {"results": [...]} with one entry per transaction, in order.
+    """
+    import logging
+    logger = logging.getLogger(__name__)
+    
+    try:
+        items = _batch_items(request, 'transactions')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    try:
+        results = [None] * len(items)
+        parsed = []  # (index, verify request)
+        seen = set()
+        for index, item in enumerate(items):
+            tx_hash = item.get('transaction_hash') if isinstance(item, dict) else None
+            try:
+                if not isinstance(item, dict):
+                    raise ValueError('Each transaction must be an object')
+                verify_request = parse_verify_request(item)
+                if str(tx_hash).lower() in seen:
+                    raise ValueError('Duplicate transaction in batch')
+                seen.add(str(tx_hash).lower())
+            except ValueError as e:
+                results[index] = {'transaction_hash': tx_hash, 'success': False, 'error': str(e), 'retryable': False}
+                continue
+            parsed.append((index, verify_request))
         
-        return JsonResponse({
-            'transaction_hash': payment.transaction_hash,
-            'payment_type': payment.payment_type,
-            'amount_usdc': str(payment.amount_token),
-            'amount_usd': str(payment.amount_usd),
-            'status': payment.status,
-            'customer_name': customer_name,
-            'email': payment.email or 'N/A',
-            'company_name': payment.company_name or '',
-            'created_at': payment.created_at.isoformat() if payment.created_at else None,
-            'confirmed_at': payment.confirmed_at.isoformat() if payment.confirmed_at else None,
-            'basescan_url': payment.basescan_url,
-            'from_address': payment.from_address,
-            'to_address': payment.to_address,
-            'block_number': payment.block_number,
-            'confirmations': payment.confirmations,
-        })
-    
-    except TokenPayment.DoesNotExist:
-        return JsonResponse({'error': 'Payment not found'}, status=404)
+        try:
+            outcomes = verify_payments([verify_request for _, verify_request in parsed])
+        except CircuitOpenError as e:
+            return _retry_later(e)
+        except ConnectionError as e:
+            logger.error(f"Web3 service connection error: {e}")
+            return JsonResponse({'error': f'Blockchain connection error: {str(e)}'}, status=503)
+        
+        for (index, verify_request), (payment, error) in zip(parsed, outcomes):
+            if error is not None:
+                results[index] = _batch_error(verify_request['tx_hash'], error)
+            else:
+                results[index] = _verified_payload(payment)
+        
+        return JsonResponse({'results': results})
+    
+    except Exception as e:
+        logger.error(f"Error verifying transaction batch: {e}", exc_info=True)
+        return JsonResponse({'error': f'Server error: {str(e)}'}, status=500)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@rate_limit('batch')
+def payment_statuses_batch(request):
+    """
+    Check the status of several payments at once.
+    
+    Body: {"transaction_hashes": [...]}. Returns {"results": [...]} in order,
+    with {"transaction_hash", "error": "Payment not found"} for unknown ones.
+    """
+    import logging
+    logger = logging.getLogger(__name__)
+    
+    try:
+        tx_hashes = _batch_items(request, 'transaction_hashes')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not all(isinstance(tx_hash, str) for tx_hash in tx_hashes):
+        return JsonResponse({'error': '"transaction_hashes" must be a list of strings'}, status=400)
+    
+    try:
+        payments = {p.transaction_hash: p for p in TokenPayment.objects.filter(transaction_hash__in=tx_hashes)}
+        
+        # One head lookup per chain covers every payment on it
+        heads = {}
+        for chain_id in {p.chain_id for p in payments.values() if p.block_number}:
+            try:
+                heads[chain_id] = get_web3_service(chain_id).get_head_block()
+            except Exception as e:
+                logger.error(f"Error updating confirmations: {e}")
+                # Continue with cached confirmations
+        
+        results = []
+        for tx_hash in tx_hashes:
+            payment = payments.get(tx_hash)
+            if payment is None:
+                results.append({'transaction_hash': tx_hash, 'error': 'Payment not found'})
+                continue
+            if payment.block_number and payment.chain_id in heads:
+                payment.confirmations = max(0, heads[payment.chain_id] - payment.block_number)
+            results.append({'transaction_hash': tx_hash, **_status_payload(payment)})
+        
+        return JsonResponse({'results': results})
+    
+    except Exception as e:
+        logger.error(f"Error checking payment statuses: {e}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+# ========== Async (ASGI) Crypto Endpoints ==========
+# Same behaviour as the sync views above, but RPC waits don't hold a worker thread.
+# Routed instead of the sync views when WEB3_ASYNC_VIEWS is enabled (see urls.py).
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from .services.async_web3_service import get_async_web3_service
+from .services.head_watcher import wait_for_head
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@rate_limit('verify')
+async def verify_token_transaction_async(request):
+    """Async verify_token_transaction()"""
+    import logging
+    logger = logging.getLogger(__name__)
+    
+    try:
+        data = json.loads(request.body)
+        try:
+            verify_request = parse_verify_request(data)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        
+        if _wants_job(request):
+            job, _ = await sync_to_async(submit_verification)(data)
+            return _job_accepted(job)
+        
+        try:
+            web3_service = await sync_to_async(get_async_web3_service)(verify_request['token'].chain_id)
+        except Exception as e:
+            logger.error(f"Web3 service initialization failed: {e}")
+            return JsonResponse({
+                'error': f'Blockchain service error: {str(e)}'
+            }, status=503)
+        
+        try:
+            payment = await averify_payment(web3_service, verify_request)
+        except CircuitOpenError as e:
+            return _retry_later(e)
+        except ConnectionError as e:
+            logger.error(f"Web3 service connection error: {e}")
+            return JsonResponse({'error': f'Blockchain connection error: {str(e)}'}, status=503)
+        except VerificationError as e:
+            return _verification_failed(e)
+        
+        return JsonResponse(_verified_payload(payment))
+    
+    except Exception as e:
+        logger.error(f"Error verifying transaction: {e}", exc_info=True)
+        return JsonResponse({'error': f'Server error: {str(e)}'}, status=500)
+
+async def _along_poll_status(tx_hash, payment, wait, since):
+    """_long_poll_status() on the event loop's head watcher"""
+    import time
+    deadline = time.monotonic() + wait
+    status = payment.status
+    since = payment.confirmations if since is None else since
+    head = None
+    while payment is not None and payment.status == status and payment.confirmations == since:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        new_head = await wait_for_head(payment.chain_id, after=head, timeout=remaining)
+        if new_head is not None and new_head != head:
+            head = new_head
+            payment = await sync_to_async(_refreshed_status)(tx_hash, head)
+    return payment
+
+@require_http_methods(["GET"])
+@rate_limit('status')
+async def payment_status_async(request, tx_hash):
+    """Async payment_status(), including its long-poll mode"""
+    import logging
+    logger = logging.getLogger(__name__)
+    try:
+        wait, since = _long_poll_params(request)
+    except ValueError:
+        return JsonResponse({'error': 'wait and since must be numbers'}, status=400)
+    
+    try:
+        payment = await sync_to_async(get_payment_snapshot)(tx_hash, _payment_snapshot)
+        if payment is None:
+            return JsonResponse({'error': 'Payment not found'}, status=404)
+        
+        try:
+            if payment.block_number:
+                web3_service = await sync_to_async(get_async_web3_service)(payment.chain_id)
+                payment = payment.with_confirmations(await web3_service.get_confirmations(payment.block_number))
+        except Exception as e:
+            logger.error(f"Error updating confirmations: {e}")
+            # Continue with cached confirmations
+        
+        if wait:
+            with _long_poll_slot() as slot:
+                if slot:
+                    payment = await _along_poll_status(tx_hash, payment, wait, since)
+            if payment is None:
+                return JsonResponse({'error': 'Payment not found'}, status=404)
+        
+        return _conditional_payment_response(request, payment, payment.status_payload)
+    
+    except Exception as e:
+        logger.error(f"Error checking payment status: {e}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+@require_http_methods(["GET"])
+@rate_limit('status')
+async def payment_details_async(request, tx_hash):
+    """Async payment_details()"""
+    try:
+        payment = await sync_to_async(get_payment_snapshot)(tx_hash, _payment_snapshot)
+        if payment is None:
+            return JsonResponse({'error': 'Payment not found'}, status=404)
+        return _conditional_payment_response(request, payment, payment.details_payload, private=True)
+    
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
         logger.error(f"Error fetching payment details: {e}")
         return JsonResponse({'error': str(e)}, status=500)
 
+
+def _sse_enabled():
+    """Server-Sent Events only stream under ASGI, where the async views are routed"""
+    return getattr(settings, 'WEB3_ASYNC_VIEWS', False)
+
+
+async def _payment_event_stream(payment):
+    """
+    Server-Sent Events for a payment: a "status" event (the payment-status
+    payload) whenever its status or confirmations change, until it leaves
+    "pending" or WEB3_SSE_MAX_DURATION passes (EventSource then reconnects).
+    
+    `payment` is a PaymentSnapshot; each new head re-reads the cached
+    snapshot, which writes invalidate, so idle streams don't query the database.
+    """
+    import time
+    heartbeat = getattr(settings, 'WEB3_SSE_HEARTBEAT', 15)
+    deadline = time.monotonic() + getattr(settings, 'WEB3_SSE_MAX_DURATION', 600)
+    
+    yield 'retry: 3000\n\n'
+    head = await wait_for_head(payment.chain_id, timeout=heartbeat)
+    last_payload = None
+    while payment is not None:
+        if payment.block_number and head is not None:
+            payment = payment.with_confirmations(max(0, head - payment.block_number))
+        payload = payment.status_payload
+        if payload != last_payload:
+            yield f'event: status\ndata: {json.dumps(payload)}\n\n'
+            last_payload = payload
+        if payment.status != 'pending' or time.monotonic() >= deadline:
+            return
+        
+        new_head = await wait_for_head(payment.chain_id, after=head, timeout=heartbeat)
+        if new_head == head:
+            yield ': keep-alive\n\n'  # Keeps proxies from closing an idle stream
+            continue
+        head = new_head
+        # The promoter changes the status on new heads
+        payment = await sync_to_async(get_payment_snapshot)(payment.transaction_hash, _payment_snapshot)
+
+@require_http_methods(["GET"])
+@rate_limit('status')
+async def payment_events(request, tx_hash):
+    """
+    Stream payment status changes as Server-Sent Events.
+    
+    Replaces polling payment_status: one connection per checkout, pushed to
+    as the chain head advances. Served asynchronously, so idle streams don't
+    hold a worker thread under ASGI. Under WSGI Django would buffer the whole
+    stream in a worker, so it is only served with WEB3_ASYNC_VIEWS (the pages
+    poll payment_status otherwise).
+    """
+    if not _sse_enabled():
+        return JsonResponse({'error': 'Event streams require the ASGI deployment; poll payment-status instead'}, status=404)
+    payment = await sync_to_async(get_payment_snapshot)(tx_hash, _payment_snapshot)
+    if payment is None:
+        return JsonResponse({'error': 'Payment not found'}, status=404)
+    
+    response = StreamingHttpResponse(_payment_event_stream(payment), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx-style proxies buffer the stream
+    return response
+
 def payment_success(request):
     """Payment success page"""
     return render(request, "payment_success.html")
@@ -50,6 +50,7 @@ SESSION_COOKIE_SECURE = True
 # Application definition
 
 INSTALLED_APPS = [
+    'daphne',  # ASGI server; makes runserver serve the ASGI application
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -89,6 +90,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'myProject.wsgi.application'
+ASGI_APPLICATION = 'myProject.asgi.application'
 
 
 # Database
@@ -144,7 +146,7 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
-import os
+import os, json
 
 # Stripe Configuration - Load from environment variables (loaded via dotenv at top of file)
 STRIPE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY")
@@ -163,10 +165,152 @@ DOMAIN = os.environ.get("DOMAIN", "http://localhost:8000")
 # Base Network / USDC Configuration
 CHAIN = os.environ.get("CHAIN", "base")
 BASE_RPC_URL = os.environ.get("BASE_RPC_URL", "")  # From Alchemy (SECRET - must be set)
+BASE_RPC_URLS = [url.strip() for url in os.environ.get("BASE_RPC_URLS", "").split(",") if url.strip()]  # Optional extra providers; overrides BASE_RPC_URL
 RECEIVER_WALLET = os.environ.get("RECEIVER_WALLET", "0x918e03d7c59d61b6505fed486082419941ffd77f")
 USDC_CONTRACT_ADDRESS = os.environ.get("USDC_CONTRACT_ADDRESS", "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913")
 USDC_DECIMALS = int(os.environ.get("USDC_DECIMALS", "6"))
+CHAIN_ID = int(os.environ.get("CHAIN_ID", "8453"))  # Base mainnet
+
+# Supported chains and tokens for verification, keyed by chain id (see myApp/services/chain_registry.py).
+# Base USDC comes from the settings above; WEB3_EXTRA_CHAINS adds more as JSON, e.g.
+# {"1": {"name": "Ethereum", "rpc_urls": ["https://..."], "explorer_tx_url": "https://etherscan.io/tx/{tx_hash}",
+#        "tokens": {"0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48": {"symbol": "USDC", "decimals": 6}}}}
+WEB3_CHAINS = {
+    CHAIN_ID: {
+        "name": CHAIN.capitalize(),
+        "rpc_urls": BASE_RPC_URLS or BASE_RPC_URL,
+        "explorer_tx_url": "https://basescan.org/tx/{tx_hash}",
+        "tokens": {USDC_CONTRACT_ADDRESS: {"symbol": "USDC", "decimals": USDC_DECIMALS}},
+    },
+}
+WEB3_CHAINS.update({int(k): v for k, v in json.loads(os.environ.get("WEB3_EXTRA_CHAINS", "{}")).items()})
+WEB3_DEFAULT_CHAIN_ID = CHAIN_ID
 REQUIRED_CONFIRMATIONS = int(os.environ.get("REQUIRED_CONFIRMATIONS", "2"))
 
+# Shared Web3 service (one keep-alive HTTP session per process)
+WEB3_HTTP_POOL_SIZE = int(os.environ.get("WEB3_HTTP_POOL_SIZE", "20"))  # Max pooled connections to the RPC node
+WEB3_RPC_TIMEOUT = int(os.environ.get("WEB3_RPC_TIMEOUT", "10"))  # Seconds per RPC request
+WEB3_RPC_HEDGE = os.environ.get("WEB3_RPC_HEDGE", "false").lower() == "true"  # Send a duplicate read to a second provider when the first is slower than its p95
+WEB3_RPC_HEDGE_MIN_DELAY = float(os.environ.get("WEB3_RPC_HEDGE_MIN_DELAY", "0.05"))  # Never hedge sooner than this (seconds)
+WEB3_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("WEB3_CIRCUIT_FAILURE_THRESHOLD", "5"))  # Failed/slow RPC calls before the circuit opens
+WEB3_CIRCUIT_WINDOW = int(os.environ.get("WEB3_CIRCUIT_WINDOW", "30"))  # Seconds over which failures are counted
+WEB3_CIRCUIT_COOLDOWN = int(os.environ.get("WEB3_CIRCUIT_COOLDOWN", "30"))  # Seconds to fail fast before probing again
+WEB3_CIRCUIT_SLOW_CALL = float(os.environ.get("WEB3_CIRCUIT_SLOW_CALL", "5"))  # RPC calls slower than this count as failures
+WEB3_RPC_BATCHING = os.environ.get("WEB3_RPC_BATCHING", "true").lower() == "true"  # Send related RPC calls as one JSON-RPC batch
+
+# Route the crypto API to the asyncio views (run under ASGI: `daphne myProject.asgi:application`)
+WEB3_ASYNC_VIEWS = os.environ.get("WEB3_ASYNC_VIEWS", "false").lower() == "true"
+
+# Chain head tracker: "thread" starts one in each web process (one per chain polls at a time), "command" expects `manage.py track_chain_head`
+WEB3_HEAD_TRACKER = os.environ.get("WEB3_HEAD_TRACKER", "thread")
+WEB3_HEAD_POLL_INTERVAL = float(os.environ.get("WEB3_HEAD_POLL_INTERVAL", "2"))  # Base produces a block every ~2s
+WEB3_HEAD_MAX_AGE = int(os.environ.get("WEB3_HEAD_MAX_AGE", "15"))  # Seconds before a published head is considered stale
+
+# Payment status Server-Sent Events (GET /api/crypto/payment-events/<tx>/)
+WEB3_SSE_HEARTBEAT = float(os.environ.get("WEB3_SSE_HEARTBEAT", "15"))  # Seconds between keep-alive comments on an idle stream
+WEB3_SSE_MAX_DURATION = int(os.environ.get("WEB3_SSE_MAX_DURATION", "600"))  # Seconds before a stream is closed (the browser reconnects)
+
+# Payment promotion (runs on every new head)
+WEB3_PENDING_EXPIRY = int(os.environ.get("WEB3_PENDING_EXPIRY", str(24 * 3600)))  # Seconds before an unconfirmed payment is expired
+WEB3_PENDING_EXPIRY_CHECK_INTERVAL = int(os.environ.get("WEB3_PENDING_EXPIRY_CHECK_INTERVAL", "60"))  # Seconds between expiry sweeps
+
+WEB3_REORG_CHECK = os.environ.get("WEB3_REORG_CHECK", "true").lower() == "true"  # Compare stored block hashes with the canonical chain on each head
+WEB3_REORG_DEPTH = int(os.environ.get("WEB3_REORG_DEPTH", "64"))  # How many recent blocks to re-check
+
+# Receipt / verdict cache
+WEB3_FINALITY_CONFIRMATIONS = int(os.environ.get("WEB3_FINALITY_CONFIRMATIONS", "10"))  # Receipts deeper than this are cached as immutable
+WEB3_TX_CACHE_TTL = int(os.environ.get("WEB3_TX_CACHE_TTL", "30"))  # Seconds to keep receipts that are not final yet
+WEB3_TX_CACHE_FINAL_TTL = int(os.environ.get("WEB3_TX_CACHE_FINAL_TTL", str(7 * 24 * 3600)))  # Seconds to keep final receipts in the cache
+WEB3_TX_CACHE_DB = os.environ.get("WEB3_TX_CACHE_DB", "false").lower() == "true"  # Also persist final receipts to the database
+
+# Receiver-wallet Transfer indexer (`manage.py index_usdc_transfers`)
+WEB3_INDEXER_BLOCK_RANGE = int(os.environ.get("WEB3_INDEXER_BLOCK_RANGE", "2000"))  # Blocks per eth_getLogs request
+WEB3_INDEXER_START_LOOKBACK = int(os.environ.get("WEB3_INDEXER_START_LOOKBACK", "43200"))  # Blocks to backfill on first run (~1 day on Base)
+WEB3_INDEXER_REORG_OVERLAP = int(os.environ.get("WEB3_INDEXER_REORG_OVERLAP", "10"))  # Blocks behind the cursor rescanned each run, for transfers re-mined by a reorg
+WEB3_INDEXER_INTERVAL = float(os.environ.get("WEB3_INDEXER_INTERVAL", "10"))  # Seconds between indexer runs
+
+# Background verification jobs (POST verify-transaction with "Prefer: respond-async" -> 202 + job id)
+WEB3_VERIFY_JOBS = os.environ.get("WEB3_VERIFY_JOBS", "false").lower() == "true"  # Use job mode for every verify request
+WEB3_VERIFY_JOB_BACKEND = os.environ.get("WEB3_VERIFY_JOB_BACKEND", "thread")  # 'thread' (in-process pool) or 'celery'
+WEB3_VERIFY_JOB_WORKERS = int(os.environ.get("WEB3_VERIFY_JOB_WORKERS", "4"))  # Thread pool size for the 'thread' backend
+WEB3_VERIFY_JOB_MAX_ATTEMPTS = int(os.environ.get("WEB3_VERIFY_JOB_MAX_ATTEMPTS", "20"))  # Attempts before a job gives up on an unmined tx
+WEB3_VERIFY_JOB_BACKOFF = float(os.environ.get("WEB3_VERIFY_JOB_BACKOFF", "2"))  # Seconds before the first retry; doubles per attempt
+WEB3_VERIFY_JOB_MAX_BACKOFF = float(os.environ.get("WEB3_VERIFY_JOB_MAX_BACKOFF", "30"))  # Cap on the retry delay
+WEB3_VERIFY_JOB_LEASE = float(os.environ.get("WEB3_VERIFY_JOB_LEASE", "120"))  # Seconds past its due time before an active job counts as stranded and is resumed
+WEB3_VERIFY_LOCK_TIMEOUT = int(os.environ.get("WEB3_VERIFY_LOCK_TIMEOUT", "30"))  # Max seconds one verification holds the per-tx lock others wait on
+WEB3_LONG_POLL_MAX_WAIT = float(os.environ.get("WEB3_LONG_POLL_MAX_WAIT", "25"))  # Cap on payment-status ?wait= (stay under proxy timeouts)
+WEB3_LONG_POLL_SYNC = os.environ.get("WEB3_LONG_POLL_SYNC", "false").lower() == "true"  # Let the WSGI payment_status hold a worker for ?wait= (off: it answers at once; long-poll via the async view)
+WEB3_LONG_POLL_MAX_CONCURRENT = int(os.environ.get("WEB3_LONG_POLL_MAX_CONCURRENT", "100"))  # Long polls held at once per process; beyond it requests get the current status immediately
+WEB3_SETTLED_MAX_AGE = int(os.environ.get("WEB3_SETTLED_MAX_AGE", "86400"))  # Cache-Control max-age for status/details of payments that can no longer change (failed, expired, or confirmed past WEB3_REORG_DEPTH)
+WEB3_BATCH_MAX_ITEMS = int(os.environ.get("WEB3_BATCH_MAX_ITEMS", "50"))  # Max transactions per batch verify/status request
+
+# Cache - shared Redis cache when REDIS_URL is set, per-process memory otherwise
+REDIS_URL = os.environ.get("REDIS_URL", "")
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 5000},  # Bounds the receipt cache; oldest entries are culled first
+        }
+    }
+
+# Channels layer for live payment events (ws/payments/): in-memory for one process, Redis across processes/nodes
+CHANNEL_REDIS_URL = os.environ.get("CHANNEL_REDIS_URL", REDIS_URL)
+if CHANNEL_REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [CHANNEL_REDIS_URL]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+    }
+PAYMENT_EVENTS_MAX_SUBSCRIPTIONS = int(os.environ.get("PAYMENT_EVENTS_MAX_SUBSCRIPTIONS", "50"))  # Per WebSocket connection
+
+# Read-through cache of payment status/details for the polled endpoints (local LRU in front of CACHES['default'])
+PAYMENT_CACHE_TTL = int(os.environ.get("PAYMENT_CACHE_TTL", "300"))  # Seconds a settled payment's snapshot stays in the shared cache
+PAYMENT_CACHE_PENDING_TTL = int(os.environ.get("PAYMENT_CACHE_PENDING_TTL", "30"))  # Same for pending payments, which change soon
+PAYMENT_CACHE_LOCAL_SIZE = int(os.environ.get("PAYMENT_CACHE_LOCAL_SIZE", "1024"))  # Snapshots kept in each process's LRU
+PAYMENT_CACHE_LOCAL_TTL = float(os.environ.get("PAYMENT_CACHE_LOCAL_TTL", "2"))  # Max seconds another process's write can go unseen locally
+
+# Celery (only used when WEB3_VERIFY_JOB_BACKEND = 'celery'): celery -A myProject worker
+CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", REDIS_URL or "memory://")
+CELERY_TASK_ACKS_LATE = True
+
+# API rate limits: token buckets shared through Redis (per-process fallback). "N/m" = burst of N, refilled N per minute
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL", REDIS_URL)
+RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get("RATE_LIMIT_TRUSTED_PROXIES", "1"))  # Proxies that append to X-Forwarded-For (Railway's edge = 1); 0 uses REMOTE_ADDR
+RATE_LIMITS = {
+    "verify": {
+        "ip": os.environ.get("RATE_LIMIT_VERIFY_IP", "10/m"),
+        "wallet": os.environ.get("RATE_LIMIT_VERIFY_WALLET", "5/m"),
+    },
+    "status": {"ip": os.environ.get("RATE_LIMIT_STATUS_IP", "120/m")},  # Polled every few seconds by the payment page
+    "checkout": {"ip": os.environ.get("RATE_LIMIT_CHECKOUT_IP", "10/m")},
+    "batch": {"ip": os.environ.get("RATE_LIMIT_BATCH_IP", "10/m")},
+}
+
 # Webhook Configuration
-PAYMENT_WEBHOOK_URL = os.environ.get("PAYMENT_WEBHOOK_URL", "https://services.leadconnectorhq.com/hooks/QHdTN3veuJ2AYB8f9dQt/webhook-trigger/ca7e5231-a2af-4f8b-8d0c-59ea1a9d364f")
\ No newline at end of file
+PAYMENT_WEBHOOK_URL = os.environ.get("PAYMENT_WEBHOOK_URL", "https://services.leadconnectorhq.com/hooks/QHdTN3veuJ2AYB8f9dQt/webhook-trigger/ca7e5231-a2af-4f8b-8d0c-59ea1a9d364f")
+# Outbox delivery (see myApp/services/webhook_service.py)
+PAYMENT_WEBHOOK_DISPATCHER = os.environ.get("PAYMENT_WEBHOOK_DISPATCHER", "thread")  # 'thread' (started in each web process) or 'worker' (only `manage.py dispatch_webhooks`)
+PAYMENT_WEBHOOK_TIMEOUT = float(os.environ.get("PAYMENT_WEBHOOK_TIMEOUT", "10"))  # Seconds per delivery attempt
+PAYMENT_WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("PAYMENT_WEBHOOK_MAX_ATTEMPTS", "12"))  # Attempts before a delivery is dead-lettered
+PAYMENT_WEBHOOK_BACKOFF = float(os.environ.get("PAYMENT_WEBHOOK_BACKOFF", "5"))  # Seconds before the first retry; doubles per attempt
+PAYMENT_WEBHOOK_MAX_BACKOFF = float(os.environ.get("PAYMENT_WEBHOOK_MAX_BACKOFF", "3600"))  # Cap on the retry delay
+PAYMENT_WEBHOOK_BATCH_SIZE = int(os.environ.get("PAYMENT_WEBHOOK_BATCH_SIZE", "50"))  # Deliveries claimed per dispatcher poll
+PAYMENT_WEBHOOK_WORKERS = int(os.environ.get("PAYMENT_WEBHOOK_WORKERS", "8"))  # Sender threads per dispatcher
+PAYMENT_WEBHOOK_CONCURRENCY_PER_HOST = int(os.environ.get("PAYMENT_WEBHOOK_CONCURRENCY_PER_HOST", "4"))  # In-flight requests (and pooled connections) per destination
+PAYMENT_WEBHOOK_MAX_HOSTS = int(os.environ.get("PAYMENT_WEBHOOK_MAX_HOSTS", "10"))  # Destinations whose connection pools are kept
+PAYMENT_WEBHOOK_POLL_INTERVAL = float(os.environ.get("PAYMENT_WEBHOOK_POLL_INTERVAL", "2"))  # Seconds between outbox polls when idle
+PAYMENT_WEBHOOK_CLAIM_GRACE = float(os.environ.get("PAYMENT_WEBHOOK_CLAIM_GRACE", "600"))  # Seconds an indexed payment's webhook waits for the client to attach customer details
\ No newline at end of file
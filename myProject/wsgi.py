@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myProject.settings')
 
 application = get_wsgi_application()
+
+# Serving processes deliver the webhook outbox in the background
+from myApp.services.webhook_service import start_webhook_dispatcher
+
+start_webhook_dispatcher()